@@ -8,22 +8,23 @@ import {
 } from "@codesandbox/sandpack-react";
 import { useMemo, useState } from "react";
 
-type AnalyzeResponse =
-  | {
-      ok: true;
-      tsx: string;
-      data: unknown;
-      model: string;
-    }
-  | {
-      detail?: unknown;
-    };
+type ReportJob = {
+  job_id: string;
+  status: "pending" | "running" | "succeeded" | "failed";
+  error: string | null;
+  tsx?: string;
+  data?: unknown;
+  model?: string;
+};
+
+const POLL_INTERVAL_MS = 2000;
 
 function getBackendUrl(): string {
   return process.env.NEXT_PUBLIC_BACKEND_URL || "http://localhost:8000";
 }
 
 export default function AnalyticsPage() {
+  const [campaignId, setCampaignId] = useState("");
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [tsx, setTsx] = useState<string | null>(null);
@@ -35,20 +36,31 @@ export default function AnalyticsPage() {
     setLoading(true);
     setError(null);
     try {
-      const res = await fetch(`${backendUrl}/analyze`, { method: "GET" });
-      const json = (await res.json()) as AnalyzeResponse;
-      if (!res.ok || !("ok" in json) || json.ok !== true) {
+      // Reports are generated in the background; unchanged analytics return
+      // the finished report straight away.
+      const res = await fetch(
+        `${backendUrl}/campaigns/${encodeURIComponent(campaignId.trim())}/reports`,
+        { method: "POST" },
+      );
+      let job = await res.json();
+      if (!res.ok) {
         throw new Error(
-          `Analyze failed: ${res.status} ${res.statusText}\n${JSON.stringify(
-            json,
-            null,
-            2,
-          )}`,
+          `Report failed: ${res.status} ${res.statusText}\n${JSON.stringify(job, null, 2)}`,
         );
       }
 
-      setTsx(json.tsx);
-      setData(json.data);
+      while (true) {
+        const poll = await fetch(`${backendUrl}/reports/${job.job_id}`);
+        job = (await poll.json()) as ReportJob;
+        if (!poll.ok || job.status === "failed") {
+          throw new Error(`Report failed: ${job.error ?? poll.statusText}`);
+        }
+        if (job.status === "succeeded") break;
+        await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+      }
+
+      setTsx(job.tsx ?? null);
+      setData(job.data);
     } catch (e) {
       setError(e instanceof Error ? e.message : String(e));
       setTsx(null);
@@ -92,9 +104,20 @@ createRoot(rootEl).render(<App />);
       <h1 style={{ fontSize: 20, fontWeight: 600 }}>Analytics report</h1>
 
       <div style={{ display: "flex", gap: 12, alignItems: "center" }}>
+        <input
+          value={campaignId}
+          onChange={(e) => setCampaignId(e.target.value)}
+          placeholder="Campaign ID"
+          style={{
+            padding: "10px 14px",
+            borderRadius: 8,
+            border: "1px solid #ccc",
+            width: 320,
+          }}
+        />
         <button
           onClick={generate}
-          disabled={loading}
+          disabled={loading || !campaignId.trim()}
           style={{
             padding: "10px 14px",
             borderRadius: 8,
@@ -5,8 +5,10 @@ import {
   jsonb,
   timestamp,
   integer,
+  doublePrecision,
   uniqueIndex,
   index,
+  primaryKey,
 } from 'drizzle-orm/pg-core';
 import { relations, sql } from 'drizzle-orm';
 
@@ -43,6 +45,8 @@ export const campaigns = pgTable('campaigns', {
   rewardLink: text('reward_link'),
   phoneNumbers: text('phone_numbers').array(),
   targeting: jsonb('targeting').$type<Record<string, unknown> | null>(),
+  outreachWeight: integer('outreach_weight').notNull().default(1),
+  outreachBurst: integer('outreach_burst'),
   status: text('status').notNull().default('draft'),
   totalConversations: integer('total_conversations').notNull().default(0),
   completedConversations: integer('completed_conversations')
@@ -73,6 +77,9 @@ export const conversations = pgTable(
       .default({})
       .$type<Record<string, unknown>>(),
     messageCount: integer('message_count').notNull().default(0),
+    // Rolling LLM summary of messages up to historySummaryUntil
+    historySummary: text('history_summary'),
+    historySummaryUntil: timestamp('history_summary_until', { withTimezone: true }),
     createdAt: timestamp('created_at', { withTimezone: true })
       .defaultNow()
       .notNull(),
@@ -87,6 +94,16 @@ export const conversations = pgTable(
       .where(sql`campaign_id IS NOT NULL`),
     index('idx_conversations_phone').on(table.phoneNumber),
     index('idx_conversations_status').on(table.campaignId, table.status),
+    // Keyset order for the paginated conversation list
+    index('idx_conversations_campaign_created').on(
+      table.campaignId,
+      table.createdAt,
+      table.id,
+    ),
+    // Keyset order for streaming extraction exports
+    index('idx_conversations_completed')
+      .on(table.campaignId, table.completedAt, table.id)
+      .where(sql`status = 'completed'`),
   ],
 );
 
@@ -126,9 +143,16 @@ export const outreachQueue = pgTable(
     conversationId: uuid('conversation_id')
       .references(() => conversations.id, { onDelete: 'cascade' })
       .notNull(),
+    campaignId: uuid('campaign_id').references(() => campaigns.id, {
+      onDelete: 'cascade',
+    }),
     scheduledAt: timestamp('scheduled_at', { withTimezone: true }).notNull(),
     sentAt: timestamp('sent_at', { withTimezone: true }),
-    status: text('status').notNull().default('pending'),
+    claimedAt: timestamp('claimed_at', { withTimezone: true }),
+    claimedBy: text('claimed_by'),
+    leaseExpiresAt: timestamp('lease_expires_at', { withTimezone: true }),
+    messageBody: text('message_body'), // exact bounty text, stored when the send is reserved
+    status: text('status').notNull().default('pending'), // 'pending' | 'sending' | 'sent' | 'failed' | 'paused'
     error: text('error'),
     createdAt: timestamp('created_at', { withTimezone: true })
       .defaultNow()
@@ -136,6 +160,129 @@ export const outreachQueue = pgTable(
   },
   (table) => [
     index('idx_outreach_pending').on(table.status, table.scheduledAt),
+    index('idx_outreach_campaign_due').on(
+      table.campaignId,
+      table.status,
+      table.scheduledAt,
+    ),
+  ],
+);
+
+// --- Rate Limiters (shared token buckets) ---
+
+export const rateLimiters = pgTable('rate_limiters', {
+  name: text('name').primaryKey(),
+  tokens: doublePrecision('tokens').notNull(),
+  capacity: doublePrecision('capacity').notNull(),
+  refillPerSecond: doublePrecision('refill_per_second').notNull(),
+  updatedAt: timestamp('updated_at', { withTimezone: true })
+    .defaultNow()
+    .notNull(),
+});
+
+// --- Outbound Messages (transactional outbox) ---
+
+export const outboundMessages = pgTable(
+  'outbound_messages',
+  {
+    id: uuid('id').primaryKey().defaultRandom(),
+    conversationId: uuid('conversation_id').references(
+      () => conversations.id,
+      { onDelete: 'cascade' },
+    ),
+    messageId: uuid('message_id').references(() => messages.id, {
+      onDelete: 'set null',
+    }),
+    toPhone: text('to_phone').notNull(),
+    body: text('body').notNull(),
+    idempotencyKey: text('idempotency_key').notNull(),
+    status: text('status').notNull().default('pending'), // 'pending' | 'sending' | 'sent' | 'failed'
+    attempts: integer('attempts').notNull().default(0),
+    nextAttemptAt: timestamp('next_attempt_at', { withTimezone: true })
+      .defaultNow()
+      .notNull(),
+    lastError: text('last_error'),
+    twilioSid: text('twilio_sid'),
+    createdAt: timestamp('created_at', { withTimezone: true })
+      .defaultNow()
+      .notNull(),
+    sentAt: timestamp('sent_at', { withTimezone: true }),
+  },
+  (table) => [
+    uniqueIndex('uq_outbound_idempotency_key').on(table.idempotencyKey),
+    index('idx_outbound_due').on(table.status, table.nextAttemptAt),
+  ],
+);
+
+// --- Pending Turns (inbound messages whose agent reply failed) ---
+
+export const pendingTurns = pgTable(
+  'pending_turns',
+  {
+    conversationId: uuid('conversation_id')
+      .primaryKey()
+      .references(() => conversations.id, { onDelete: 'cascade' }),
+    phoneNumber: text('phone_number').notNull(),
+    // Inbound messages not yet counted in conversations.message_count
+    unanswered: integer('unanswered').notNull().default(0),
+    status: text('status').notNull().default('pending'), // 'pending' | 'failed'
+    attempts: integer('attempts').notNull().default(0),
+    nextAttemptAt: timestamp('next_attempt_at', { withTimezone: true })
+      .defaultNow()
+      .notNull(),
+    createdAt: timestamp('created_at', { withTimezone: true })
+      .defaultNow()
+      .notNull(),
+  },
+  (table) => [
+    index('idx_pending_turns_due').on(table.status, table.nextAttemptAt),
+  ],
+);
+
+// --- Campaign Status Counts (incremental per-status rollup) ---
+
+export const campaignStatusCounts = pgTable(
+  'campaign_status_counts',
+  {
+    campaignId: uuid('campaign_id')
+      .references(() => campaigns.id, { onDelete: 'cascade' })
+      .notNull(),
+    status: text('status').notNull(),
+    count: integer('count').notNull().default(0),
+  },
+  (table) => [primaryKey({ columns: [table.campaignId, table.status] })],
+);
+
+// --- Report Jobs (async analytics report generation) ---
+
+export const reportJobs = pgTable(
+  'report_jobs',
+  {
+    id: uuid('id').primaryKey().defaultRandom(),
+    campaignId: uuid('campaign_id')
+      .references(() => campaigns.id, { onDelete: 'cascade' })
+      .notNull(),
+    // sha256 of model + prompt + analysis context; identical inputs share a report
+    contextHash: text('context_hash').notNull(),
+    context: jsonb('context').notNull(),
+    status: text('status').notNull().default('pending'), // 'pending' | 'running' | 'succeeded' | 'failed'
+    attempts: integer('attempts').notNull().default(0),
+    nextAttemptAt: timestamp('next_attempt_at', { withTimezone: true })
+      .defaultNow()
+      .notNull(),
+    tsx: text('tsx'),
+    model: text('model'),
+    lastError: text('last_error'),
+    createdAt: timestamp('created_at', { withTimezone: true })
+      .defaultNow()
+      .notNull(),
+    finishedAt: timestamp('finished_at', { withTimezone: true }),
+  },
+  (table) => [
+    uniqueIndex('uq_report_jobs_context_hash')
+      .on(table.contextHash)
+      .where(sql`status <> 'failed'`),
+    index('idx_report_jobs_due').on(table.status, table.nextAttemptAt),
   ],
 );
 
@@ -147,6 +294,8 @@ export const usersRelations = relations(users, ({ many }) => ({
 
 export const campaignsRelations = relations(campaigns, ({ many }) => ({
   conversations: many(conversations),
+  statusCounts: many(campaignStatusCounts),
+  reportJobs: many(reportJobs),
 }));
 
 export const conversationsRelations = relations(
@@ -162,6 +311,8 @@ export const conversationsRelations = relations(
     }),
     messages: many(messages),
     outreachQueue: many(outreachQueue),
+    outboundMessages: many(outboundMessages),
+    pendingTurns: many(pendingTurns),
   }),
 );
 
@@ -179,6 +330,44 @@ export const outreachQueueRelations = relations(outreachQueue, ({ one }) => ({
   }),
 }));
 
+export const outboundMessagesRelations = relations(
+  outboundMessages,
+  ({ one }) => ({
+    conversation: one(conversations, {
+      fields: [outboundMessages.conversationId],
+      references: [conversations.id],
+    }),
+    message: one(messages, {
+      fields: [outboundMessages.messageId],
+      references: [messages.id],
+    }),
+  }),
+);
+
+export const pendingTurnsRelations = relations(pendingTurns, ({ one }) => ({
+  conversation: one(conversations, {
+    fields: [pendingTurns.conversationId],
+    references: [conversations.id],
+  }),
+}));
+
+export const campaignStatusCountsRelations = relations(
+  campaignStatusCounts,
+  ({ one }) => ({
+    campaign: one(campaigns, {
+      fields: [campaignStatusCounts.campaignId],
+      references: [campaigns.id],
+    }),
+  }),
+);
+
+export const reportJobsRelations = relations(reportJobs, ({ one }) => ({
+  campaign: one(campaigns, {
+    fields: [reportJobs.campaignId],
+    references: [campaigns.id],
+  }),
+}));
+
 // --- Types ---
 
 export type User = typeof users.$inferSelect;
@@ -191,3 +380,11 @@ export type Message = typeof messages.$inferSelect;
 export type NewMessage = typeof messages.$inferInsert;
 export type OutreachQueueItem = typeof outreachQueue.$inferSelect;
 export type NewOutreachQueueItem = typeof outreachQueue.$inferInsert;
+export type OutboundMessage = typeof outboundMessages.$inferSelect;
+export type NewOutboundMessage = typeof outboundMessages.$inferInsert;
+export type PendingTurn = typeof pendingTurns.$inferSelect;
+export type NewPendingTurn = typeof pendingTurns.$inferInsert;
+export type CampaignStatusCount = typeof campaignStatusCounts.$inferSelect;
+export type NewCampaignStatusCount = typeof campaignStatusCounts.$inferInsert;
+export type ReportJob = typeof reportJobs.$inferSelect;
+export type NewReportJob = typeof reportJobs.$inferInsert;
@@ -0,0 +1,374 @@
+import asyncio
+import io
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any
+
+import numpy as np
+
+from .campaign_events import campaign_data_version
+from .config import ANALYTICS_MAX_STALENESS_SECONDS
+from .db import get_pool
+
+logger = logging.getLogger("backend.analytics")
+
+DEMOGRAPHICS = ("city", "age_range", "gender")
+TOP_VALUES = 20
+# Rows/columns kept per crosstab; the rest are folded into "other"
+CROSSTAB_TOP = 10
+MAX_HISTOGRAM_BINS = 20
+CACHE_SIZE = 50
+# Free-text answers are compared on their first characters only
+MAX_VALUE_CHARS = 200
+
+_NUMBER_RE = r"^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$"
+_RANGE_RE = re.compile(r"\(\s*(-?\d+(?:\.\d+)?)\s*(?:-|to|–)\s*(-?\d+(?:\.\d+)?)\s*\)")
+_LIST_SEPARATOR = "\x1f"
+
+# campaign_id -> (version, computed_at monotonic, result)
+_cache: OrderedDict[str, tuple[Any, float, dict]] = OrderedDict()
+_inflight: dict[str, asyncio.Future] = {}
+
+_stats = {
+    "hits": 0,
+    "stale_hits": 0,
+    "computes": 0,
+    "last_compute_ms": 0.0,
+    "last_rows": 0,
+}
+
+
+def analytics_stats() -> dict:
+    return {**_stats, "cached_campaigns": len(_cache)}
+
+
+def field_kind(field: Any) -> str:
+    """'number', 'boolean', 'list' or 'category', from an extraction_schema type."""
+    declared = str(field.get("type", "") if isinstance(field, dict) else field).strip().lower()
+    if declared.startswith(("number", "integer", "int", "float", "rating", "scale")):
+        return "number"
+    if declared.startswith(("bool", "yes/no")):
+        return "boolean"
+    if declared.startswith(("list", "array")) or declared.endswith("[]"):
+        return "list"
+    return "category"
+
+
+async def campaign_analytics(campaign_id) -> dict | None:
+    """
+    Aggregates for a campaign's conversations, or None if it doesn't exist.
+    Results are cached per campaign version (campaign row + the campaign
+    events this process has heard), and a result younger than
+    ANALYTICS_MAX_STALENESS_SECONDS is reused even if the campaign moved on,
+    so a busy campaign isn't recomputed on every request.
+    """
+    campaign = await get_pool().fetchrow(
+        "SELECT extraction_schema, updated_at FROM campaigns WHERE id = $1", campaign_id,
+    )
+    if not campaign:
+        return None
+    key = str(campaign_id)
+    version = (campaign["updated_at"], campaign_data_version(campaign_id))
+
+    cached = _cache.get(key)
+    if cached:
+        cached_version, computed_at, result = cached
+        if cached_version == version:
+            _stats["hits"] += 1
+            _cache.move_to_end(key)
+            return {**result, "cached": True}
+        if time.monotonic() - computed_at < ANALYTICS_MAX_STALENESS_SECONDS:
+            _stats["stale_hits"] += 1
+            return {**result, "cached": True}
+
+    # Concurrent requests for the same campaign share one computation.
+    inflight = _inflight.get(key)
+    if inflight is None:
+        inflight = asyncio.ensure_future(_refresh(key, campaign_id, campaign["extraction_schema"], version))
+        _inflight[key] = inflight
+        inflight.add_done_callback(lambda _: _inflight.pop(key, None))
+    return {**await asyncio.shield(inflight), "cached": False}
+
+
+async def _refresh(key: str, campaign_id, schema: Any, version) -> dict:
+    if isinstance(schema, str):
+        schema = json.loads(schema)
+    schema = schema or {}
+    started = time.monotonic()
+    csv_bytes = await _load(campaign_id, schema)
+    # Vectorized, but still CPU: keep it off the event loop so webhooks aren't stalled.
+    result = await asyncio.to_thread(compute_analytics, schema, csv_bytes)
+    elapsed_ms = (time.monotonic() - started) * 1000
+    result = {
+        "campaign_id": key,
+        "computed_at": datetime.now(timezone.utc).isoformat(),
+        "compute_ms": round(elapsed_ms, 1),
+        **result,
+    }
+    _stats["computes"] += 1
+    _stats["last_compute_ms"] = round(elapsed_ms, 1)
+    _stats["last_rows"] = result["conversations"]
+    _cache[key] = (version, time.monotonic(), result)
+    _cache.move_to_end(key)
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return result
+
+
+async def _load(campaign_id, schema: dict[str, Any]) -> bytes:
+    """
+    Reads one row per conversation as CSV via COPY, with every schema field
+    already extracted and normalized in SQL, so nothing is parsed per row in
+    Python.
+    """
+    columns = []
+    for i, (name, field) in enumerate(schema.items()):
+        value = f"(c.extracted_data ->> ${i + 2}::text)"
+        kind = field_kind(field)
+        if kind == "number":
+            expr = f"CASE WHEN {value} ~ '{_NUMBER_RE}' THEN btrim({value})::float8 END"
+        elif kind == "boolean":
+            expr = f"""CASE
+                WHEN lower(btrim({value})) IN ('true', 'yes', 'y', '1') THEN 1
+                WHEN lower(btrim({value})) IN ('false', 'no', 'n', '0') THEN 0
+            END"""
+        elif kind == "list":
+            raw = f"(c.extracted_data -> ${i + 2}::text)"
+            expr = f"""CASE WHEN jsonb_typeof({raw}) = 'array' THEN (
+                SELECT string_agg(NULLIF(left(lower(btrim(e)), {MAX_VALUE_CHARS}), ''), chr(31))
+                FROM jsonb_array_elements_text({raw}) AS e
+            ) ELSE NULLIF(left(lower(btrim({value})), {MAX_VALUE_CHARS}), '') END"""
+        else:
+            expr = f"NULLIF(left(lower(btrim({value})), {MAX_VALUE_CHARS}), '')"
+        columns.append(f"{expr} AS f{i}")
+
+    query = f"""
+        SELECT c.status, c.message_count,
+               NULLIF(lower(btrim(u.city)), '') AS city,
+               NULLIF(lower(btrim(u.age_range)), '') AS age_range,
+               NULLIF(lower(btrim(u.gender)), '') AS gender
+               {''.join(', ' + col for col in columns)}
+        FROM conversations c
+        JOIN users u ON u.id = c.user_id
+        WHERE c.campaign_id = $1
+    """
+    buf = io.BytesIO()
+    async with get_pool().acquire() as conn:
+        await conn.copy_from_query(query, campaign_id, *schema.keys(), output=buf, format="csv", header=True)
+    return buf.getvalue()
+
+
+def compute_analytics(schema: dict[str, Any], csv_bytes: bytes) -> dict:
+    """Distributions, histograms, demographic crosstabs and funnels from the CSV `_load` produces."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+
+    kinds = {name: field_kind(field) for name, field in schema.items()}
+    column_types = {"status": pa.string(), "message_count": pa.int64()}
+    column_types.update({d: pa.string() for d in DEMOGRAPHICS})
+    for i, name in enumerate(schema):
+        column_types[f"f{i}"] = pa.float64() if kinds[name] in ("number", "boolean") else pa.string()
+    table = pacsv.read_csv(
+        io.BytesIO(csv_bytes),
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(column_types=column_types, strings_can_be_null=True),
+    )
+    n = table.num_rows
+
+    status_labels, status_codes = _codes(pc, table["status"])
+    status_counts = np.bincount(status_codes[status_codes >= 0], minlength=len(status_labels))
+    message_count = table["message_count"].to_numpy(zero_copy_only=False) if n else np.zeros(0)
+    contacted = ~np.isin(status_codes, _label_codes(status_labels, "pending", "failed"))
+    engaged = np.nan_to_num(message_count.astype(float)) > 1
+    completed = np.isin(status_codes, _label_codes(status_labels, "completed"))
+
+    demographics = {d: _codes(pc, table[d]) for d in DEMOGRAPHICS}
+
+    fields: dict[str, dict] = {}
+    answered_any = np.zeros(n, dtype=bool)
+    for i, (name, field) in enumerate(schema.items()):
+        column = table[f"f{i}"]
+        kind = kinds[name]
+        answered = ~pc.is_null(column).to_numpy(zero_copy_only=False) if n else np.zeros(0, dtype=bool)
+        answered_any |= answered
+        summary: dict[str, Any] = {
+            "type": field.get("type") if isinstance(field, dict) else field,
+            "kind": kind,
+            "answered": int(answered.sum()),
+            # Of the participants who engaged, the share who answered
+            "answer_rate": _rate((answered & engaged).sum(), engaged.sum()),
+        }
+        if kind == "number":
+            values = column.to_numpy(zero_copy_only=False).astype(float)
+            summary.update(_number_summary(values[answered], field))
+            declared = _declared_range(field)
+            valid = answered & ((values >= declared[0]) & (values <= declared[1]) if declared else True)
+            summary["by"] = {d: _number_crosstab(values, valid, *demographics[d]) for d in DEMOGRAPHICS}
+        elif kind == "boolean":
+            values = column.to_numpy(zero_copy_only=False)
+            yes = int((values[answered] == 1).sum())
+            summary["counts"] = {"true": yes, "false": int(answered.sum()) - yes}
+            codes = np.where(answered, (values == 1).astype(np.int64), -1)
+            summary["by"] = {
+                d: _crosstab(*demographics[d], ["false", "true"], codes) for d in DEMOGRAPHICS
+            }
+        elif kind == "list":
+            items = pc.list_flatten(pc.split_pattern(column, _LIST_SEPARATOR))
+            labels, codes = _codes(pc, items)
+            summary["mentions"] = len(items)
+            summary["distinct"] = len(labels)
+            summary["top"] = _top(labels, codes)
+        else:
+            labels, codes = _codes(pc, column)
+            summary["distinct"] = len(labels)
+            summary["top"] = _top(labels, codes)
+            summary["by"] = {d: _crosstab(*demographics[d], labels, codes) for d in DEMOGRAPHICS}
+        fields[name] = summary
+
+    funnel = [
+        ("conversations", n),
+        ("contacted", int(contacted.sum())),
+        ("engaged", int(engaged.sum())),
+        ("answered_any", int(answered_any.sum())),
+        ("completed", int(completed.sum())),
+    ]
+    return {
+        "conversations": n,
+        "status_counts": {label: int(c) for label, c in zip(status_labels, status_counts)},
+        "funnel": [{"stage": stage, "count": count} for stage, count in funnel],
+        # Drop-off through the interview, in schema order
+        "field_funnel": [{"field": name, "answered": fields[name]["answered"]} for name in schema],
+        "demographics": {d: _top(*demographics[d]) for d in DEMOGRAPHICS},
+        "fields": fields,
+    }
+
+
+def _codes(pc, column) -> tuple[list[str], np.ndarray]:
+    """Dictionary-encodes a string column: (labels, codes) with -1 for null."""
+    if len(column) == 0:
+        return [], np.zeros(0, dtype=np.int64)
+    encoded = pc.dictionary_encode(column)
+    if hasattr(encoded, "combine_chunks"):
+        encoded = encoded.combine_chunks()
+    labels = encoded.dictionary.to_pylist()
+    codes = pc.fill_null(encoded.indices, -1).to_numpy(zero_copy_only=False).astype(np.int64)
+    return labels, codes
+
+
+def _label_codes(labels: list[str], *wanted: str) -> list[int]:
+    return [i for i, label in enumerate(labels) if label in wanted]
+
+
+def _top(labels: list[str], codes: np.ndarray, limit: int = TOP_VALUES) -> list[dict]:
+    counts = np.bincount(codes[codes >= 0], minlength=len(labels))
+    order = np.argsort(-counts, kind="stable")[:limit]
+    return [{"value": labels[i], "count": int(counts[i])} for i in order if counts[i]]
+
+
+def _fold(labels: list[str], codes: np.ndarray, limit: int) -> tuple[list[str], np.ndarray]:
+    """Keeps the `limit` most common labels and maps the rest to 'other'."""
+    counts = np.bincount(codes[codes >= 0], minlength=len(labels))
+    if len(labels) <= limit:
+        return list(labels), codes
+    keep = np.argsort(-counts, kind="stable")[:limit]
+    remap = np.full(len(labels), limit, dtype=np.int64)
+    remap[keep] = np.arange(limit)
+    folded = np.where(codes >= 0, remap[np.maximum(codes, 0)], -1)
+    return [labels[i] for i in keep] + ["other"], folded
+
+
+def _crosstab(
+    group_labels: list[str], group_codes: np.ndarray, value_labels: list[str], value_codes: np.ndarray,
+) -> dict:
+    """Answer counts per demographic group (rows) and answer value (columns)."""
+    rows, row_codes = _fold(group_labels, group_codes, CROSSTAB_TOP)
+    cols, col_codes = _fold(value_labels, value_codes, CROSSTAB_TOP)
+    rows = rows + ["unknown"]
+    row_codes = np.where(row_codes >= 0, row_codes, len(rows) - 1)
+    mask = col_codes >= 0
+    flat = row_codes[mask] * len(cols) + col_codes[mask]
+    counts = np.bincount(flat, minlength=len(rows) * len(cols)).reshape(len(rows), len(cols))
+    keep = counts.sum(axis=1) > 0
+    return {
+        "rows": [r for r, k in zip(rows, keep) if k],
+        "columns": cols,
+        "counts": counts[keep].tolist(),
+    }
+
+
+def _number_crosstab(
+    values: np.ndarray, answered: np.ndarray, group_labels: list[str], group_codes: np.ndarray,
+) -> dict:
+    """Count and mean of a numeric answer per demographic group."""
+    groups, codes = _fold(group_labels, group_codes, CROSSTAB_TOP)
+    groups = groups + ["unknown"]
+    codes = np.where(codes >= 0, codes, len(groups) - 1)[answered]
+    counts = np.bincount(codes, minlength=len(groups))
+    sums = np.bincount(codes, weights=values[answered], minlength=len(groups))
+    keep = counts > 0
+    means = np.divide(sums, counts, out=np.zeros(len(groups)), where=keep)
+    return {
+        "groups": [g for g, k in zip(groups, keep) if k],
+        "count": counts[keep].tolist(),
+        "mean": [round(float(m), 3) for m in means[keep]],
+    }
+
+
+def _number_summary(values: np.ndarray, field: Any) -> dict:
+    """
+    Distribution of a numeric answer. With a declared range, values outside it
+    are only counted as out_of_range and left out of every statistic.
+    """
+    summary: dict[str, Any] = {}
+    declared = _declared_range(field)
+    if declared:
+        low, high = declared
+        in_range = (values >= low) & (values <= high)
+        summary["out_of_range"] = int((~in_range).sum())
+        values = values[in_range]
+    elif values.size == 0:
+        return {"histogram": {"edges": [], "counts": []}}
+    if values.size:
+        p25, median, p75 = np.percentile(values, [25, 50, 75])
+        summary.update({
+            "min": float(values.min()),
+            "max": float(values.max()),
+            "mean": round(float(values.mean()), 3),
+            "std": round(float(values.std()), 3),
+            "p25": float(p25),
+            "median": float(median),
+            "p75": float(p75),
+        })
+    if declared:
+        if high - low <= MAX_HISTOGRAM_BINS * 2 and float(low).is_integer() and float(high).is_integer():
+            edges = np.arange(low, high + 2) - 0.5  # one bin per integer score
+        else:
+            edges = np.linspace(low, high, MAX_HISTOGRAM_BINS + 1)
+    else:
+        bins = int(min(MAX_HISTOGRAM_BINS, max(1, np.sqrt(values.size))))
+        edges = np.histogram_bin_edges(values, bins=bins)
+    counts, edges = np.histogram(values, bins=edges)
+    summary["histogram"] = {
+        "edges": [round(float(e), 4) for e in edges],
+        "counts": counts.tolist(),
+    }
+    return summary
+
+
+def _declared_range(field: Any) -> tuple[float, float] | None:
+    """(low, high) from a type like 'number(1-10)'."""
+    declared = str(field.get("type", "") if isinstance(field, dict) else field)
+    match = _RANGE_RE.search(declared)
+    if not match:
+        return None
+    low, high = float(match.group(1)), float(match.group(2))
+    return (low, high) if low < high else None
+
+
+def _rate(numerator, denominator) -> float:
+    return round(float(numerator) / float(denominator), 4) if denominator else 0.0
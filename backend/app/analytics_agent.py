@@ -1,3 +1,5 @@
+import hashlib
+import json
 import logging
 import os
 from typing import Any
@@ -23,19 +25,32 @@ Constraints:
   - If you need hooks, start with: `const React = globalThis.React;`
   - Then use `React.useMemo`, `React.useState` etc.
 - Use only HTML + inline SVG (no external chart libs).
+- `data` is a research campaign's aggregated results:
+  - `campaign` (name, research_brief), `conversations`, `status_counts`
+  - `funnel` and `field_funnel`: [{stage|field, count|answered}]
+  - `demographics`: {city|age_range|gender: [{value, count}]}
+  - `fields`: {name: {kind, answered, answer_rate, ...}} where kind is
+    "number" (min/max/mean/median, histogram {edges, counts}, by), "boolean"
+    (counts {true, false}, by), "category" (top [{value, count}], by) or
+    "list" (top, mentions). `by` maps a demographic to a crosstab:
+    {rows, columns, counts[][]} or, for numbers, {groups, count[], mean[]}.
 - Must render:
-  - A summary section (status, total duration, question count, answer count).
-  - A Q/A table.
-  - A simple visualization: response time per question (bar chart in SVG).
+  - A summary section (conversations, completion funnel, status counts).
+  - One section per field with a simple inline-SVG chart of its distribution.
+  - At least one demographic crosstab as a table.
 - Keep it compact and readable.
 - Do not access network, storage, cookies, or window/document.
 """.strip()
 
 
-def _ai_enabled() -> bool:
+def ai_enabled() -> bool:
     return bool(os.environ.get("GOOGLE_API_KEY"))
 
 
+REPORT_MODEL = "google-gla:gemini-2.5-flash"
+# Part of the report cache key, so editing the prompt invalidates old reports
+PROMPT_FINGERPRINT = hashlib.sha256(_SYSTEM_PROMPT.encode()).hexdigest()[:12]
+
 _agent: Agent[Any, AnalyticsAgentOutput] | None = None
 
 
@@ -43,27 +58,34 @@ def _get_agent() -> Agent[Any, AnalyticsAgentOutput]:
     global _agent
     if _agent is None:
         _agent = Agent(
-            "google-gla:gemini-2.5-flash",
+            REPORT_MODEL,
             system_prompt=_SYSTEM_PROMPT,
             output_type=AnalyticsAgentOutput,
         )
     return _agent
 
 
-def generate_report_tsx_sync(*, analysis_context: dict[str, Any]) -> str:
-    if not _ai_enabled():
+async def generate_report_tsx(
+    *, analysis_context: dict[str, Any], previous_errors: list[str] | None = None,
+) -> str:
+    if not ai_enabled():
         raise RuntimeError("AI is not enabled (missing GOOGLE_API_KEY/GEMINI_API_KEY)")
 
     prompt = (
         "Generate a React analytics report component.\n\n"
         "Here is the input data JSON (use it via `data` prop):\n"
-        f"{analysis_context}\n"
+        f"{json.dumps(analysis_context, default=str)}\n"
     )
+    if previous_errors:
+        prompt += (
+            "\nYour previous attempt was rejected by the validator. Fix these problems:\n"
+            + "\n".join(f"- {e}" for e in previous_errors)
+            + "\n"
+        )
 
-    result = _get_agent().run_sync(prompt)
+    result = await _get_agent().run(prompt)
     tsx = (result.output.tsx or "").strip()
     if not tsx:
         raise RuntimeError("Empty TSX from agent")
     logger.info("Generated TSX length=%s", len(tsx))
     return tsx
-
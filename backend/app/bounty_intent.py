@@ -0,0 +1,143 @@
+import difflib
+import re
+import unicodedata
+
+# Replies longer than this are left to the LLM; they usually carry more than
+# a yes/no.
+MAX_TOKENS = 6
+FUZZY_CUTOFF = 0.85
+FUZZY_MIN_LENGTH = 4
+
+# Single words that signal intent wherever they appear in a short reply.
+# Tables cover the languages the product ships in (en, fr, ar) plus Arabizi.
+_ACCEPT_WORDS = {
+    # en
+    "go", "yes", "yeah", "yep", "yup", "yea", "ya", "sure", "ok", "okay", "okey",
+    "k", "kk", "start", "ready", "absolutely", "definitely", "alright", "deal",
+    "down", "letsgo", "y",
+    # fr
+    "oui", "ouais", "daccord", "dac", "partant", "partante", "carrement", "allez",
+    # ar
+    "نعم", "ايوه", "ايوا", "اه", "ايه", "اكيد", "تمام", "يلا", "يالله", "ماشي",
+    "موافق", "موافقه", "طيب", "اوكي", "اوك", "جاهز", "جاهزه",
+    # arabizi
+    "yalla", "yala", "aywa", "aiwa", "akid", "akeed", "tamam", "mashi", "mashy",
+    "naam", "jahez",
+}
+_DECLINE_WORDS = {
+    # en
+    "no", "nope", "nah", "pass", "skip", "later", "decline", "busy",
+    # fr
+    "non", "nan", "occupe", "occupee",
+    # ar
+    "لا", "لاء", "بعدين", "لاحقا", "مشغول", "مشغوله",
+    # arabizi
+    "la2", "laa", "ba3den", "ba3dein", "mashghoul", "mashghul",
+}
+# Words that carry no intent on their own ("yes please", "no thanks").
+_FILLER_WORDS = {
+    "please", "pls", "plz", "thanks", "thank", "you", "thx", "ty", "lets", "let",
+    "do", "it", "im", "i", "am", "in", "me", "now", "sounds", "good", "so",
+    "merci", "stp", "svp", "je", "suis", "cest", "parti", "vas",
+    "شكرا", "يا", "انا", "والله",
+    "shukran", "ana", "wallah", "habibi",
+}
+# Whole replies, matched after normalization. Covers multi-word phrases and
+# short words that are too ambiguous to trust inside longer text.
+_ACCEPT_PHRASES = {
+    "lets do it", "lets go", "im in", "i am in", "count me in", "go ahead",
+    "of course", "sounds good", "why not", "im down",
+    "vas y", "allons y", "bien sur", "cest parti", "je suis partant",
+    "je suis partante", "pourquoi pas", "avec plaisir",
+    "اكيد يلا", "ان شاء الله", "انشالله",
+    "inshallah", "insha allah", "ok yalla",
+}
+_DECLINE_PHRASES = {
+    "not now", "no thanks", "no thank you", "not interested", "maybe later",
+    "not today", "n", "not for me", "im busy", "im good",
+    "pas maintenant", "non merci", "pas interesse", "pas interessee", "plus tard",
+    "pas dispo", "une autre fois", "pas aujourdhui",
+    "مش الحين", "مش هلق", "مش هلا", "لا شكرا", "مش مهتم", "مش مهتمه",
+    "la", "mish hala2", "msh hala2", "mesh hala2", "la shukran", "mish mhtam",
+}
+_ACCEPT_EMOJI = {"👍", "✅", "🚀", "👌", "🔥", "💪", "🙌", "✔", "☑", "💯", "🤝", "😎"}
+_DECLINE_EMOJI = {"👎", "❌", "🙅", "✋", "⛔", "🚫", "✖"}
+
+_ARABIC_FOLD = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ى": "ي", "ة": "ه", "ـ": None})
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+_REPEAT_RE = re.compile(r"(.)\1+")
+
+_FUZZY_VOCAB = sorted(w for w in _ACCEPT_WORDS | _DECLINE_WORDS if len(w) >= FUZZY_MIN_LENGTH)
+
+_stats = {"accept": 0, "decline": 0, "ambiguous": 0}
+
+
+def classify_bounty_reply(text: str) -> bool | None:
+    """
+    True for a clear accept, False for a clear decline, None when the reply
+    needs the LLM (mixed signals, questions, anything unrecognised).
+    """
+    intent = _classify(text)
+    _stats["ambiguous" if intent is None else "accept" if intent else "decline"] += 1
+    return intent
+
+
+def bounty_intent_stats() -> dict:
+    return dict(_stats)
+
+
+def _classify(text: str) -> bool | None:
+    if "?" in text or "؟" in text:
+        return None
+
+    signals: set[bool] = set()
+    if any(c in _ACCEPT_EMOJI for c in text):
+        signals.add(True)
+    if any(c in _DECLINE_EMOJI for c in text):
+        signals.add(False)
+
+    normalized = _normalize(text)
+    tokens = normalized.split()
+    if len(tokens) > MAX_TOKENS:
+        return None
+
+    phrase = " ".join(tokens)
+    if phrase in _ACCEPT_PHRASES:
+        signals.add(True)
+    elif phrase in _DECLINE_PHRASES:
+        signals.add(False)
+    else:
+        for token in tokens:
+            intent = _word_intent(token)
+            if intent is None:
+                return None  # unknown word: let the LLM read it
+            if intent != "filler":
+                signals.add(intent)
+
+    if len(signals) != 1:
+        return None
+    return signals.pop()
+
+
+def _word_intent(token: str):
+    for candidate in (token, _REPEAT_RE.sub(r"\1", token)):
+        if candidate in _ACCEPT_WORDS:
+            return True
+        if candidate in _DECLINE_WORDS:
+            return False
+        if candidate in _FILLER_WORDS:
+            return "filler"
+    if len(token) >= FUZZY_MIN_LENGTH:
+        match = difflib.get_close_matches(token, _FUZZY_VOCAB, n=1, cutoff=FUZZY_CUTOFF)
+        if match:
+            return match[0] in _ACCEPT_WORDS
+    return None
+
+
+def _normalize(text: str) -> str:
+    # Strip accents and Arabic diacritics, fold letter variants, drop
+    # apostrophes so "let's" / "d'accord" / "c'est" match their table forms.
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = text.translate(_ARABIC_FOLD).replace("'", "").replace("’", "")
+    return " ".join(_WORD_RE.findall(text))
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import logging
+import weakref
+from typing import Any, AsyncIterator
+
+from .config import SSE_COALESCE_SECONDS, SSE_HEARTBEAT_SECONDS, SSE_MAX_PENDING_EVENTS
+from .db import add_listener, on_listener_reconnect
+
+logger = logging.getLogger("backend.campaign_events")
+
+NOTIFY_CHANNEL = "campaign_events"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD_BYTES = 7900
+
+# campaign_id -> subscribers streaming that campaign in this process
+_subscribers: dict[str, set["Subscriber"]] = {}
+# campaign_id -> events heard for that campaign; _epoch bumps when events may
+# have been missed. Together they version anything derived from a campaign.
+_event_counts: dict[str, int] = {}
+_epoch = 0
+
+_stats = {
+    "received": 0,
+    "delivered": 0,
+    "coalesced": 0,
+    "resyncs": 0,
+    "oversized": 0,
+}
+
+
+async def start_campaign_events() -> None:
+    await add_listener(NOTIFY_CHANNEL, _on_notify)
+    # Events sent while the listener was down are lost; clients refetch.
+    on_listener_reconnect(_resync_all)
+    logger.info("Campaign event bridge started")
+
+
+def campaign_event_stats() -> dict:
+    return {
+        **_stats,
+        "subscribers": sum(len(subs) for subs in _subscribers.values()),
+        "campaigns": len(_subscribers),
+    }
+
+
+def campaign_data_version(campaign_id) -> tuple[int, int]:
+    """Changes whenever this process hears of (or may have missed) a change to the campaign."""
+    return _epoch, _event_counts.get(str(campaign_id), 0)
+
+
+async def publish_campaign_event(conn, campaign_id, event_type: str, **data: Any) -> None:
+    """
+    Broadcasts a campaign event to every process's subscribers, this one
+    included. The NOTIFY goes out with the caller's transaction, so
+    subscribers only hear about committed changes.
+    """
+    payload = json.dumps({"campaign_id": str(campaign_id), "type": event_type, **data}, default=str)
+    if len(payload.encode()) > MAX_PAYLOAD_BYTES:
+        # Large extraction payloads are announced without their values.
+        _stats["oversized"] += 1
+        data = {k: v for k, v in data.items() if k != "data"}
+        payload = json.dumps(
+            {"campaign_id": str(campaign_id), "type": event_type, "truncated": True, **data}, default=str,
+        )
+    await conn.execute("SELECT pg_notify($1, $2)", NOTIFY_CHANNEL, payload)
+
+
+class Subscriber:
+    """
+    One SSE client's pending events. Publishing never blocks: status and
+    extraction events are keyed by conversation so a newer one replaces an
+    older one not yet sent, and counter deltas are summed. A client that
+    falls more than SSE_MAX_PENDING_EVENTS conversations behind gets a single
+    'resync' event instead, telling it to refetch.
+    """
+
+    def __init__(self, campaign_id: str):
+        self.campaign_id = campaign_id
+        self.counts: dict[str, int] = {}
+        self.statuses: dict[str, dict] = {}
+        self.extractions: dict[str, dict] = {}
+        self.campaign: dict | None = None
+        self.resync = False
+        self.wake = asyncio.Event()
+
+    def push(self, event: dict) -> None:
+        event_type = event.get("type")
+        if self.resync:
+            return
+        if event_type == "status":
+            _merge_counts(self.counts, {event["from"]: -1, event["to"]: 1})
+            self._keep(self.statuses, event)
+        elif event_type == "counts":
+            _merge_counts(self.counts, event.get("deltas", {}))
+        elif event_type == "extraction":
+            previous = self.extractions.get(event["conversation_id"])
+            if previous and "data" in previous and "data" in event:
+                event = {**event, "data": {**previous["data"], **event["data"]}}
+            self._keep(self.extractions, event)
+        elif event_type == "campaign":
+            self.campaign = event
+        if len(self.statuses) + len(self.extractions) > SSE_MAX_PENDING_EVENTS:
+            self.mark_resync()
+        self.wake.set()
+
+    def mark_resync(self) -> None:
+        if not self.resync:
+            _stats["resyncs"] += 1
+        self.resync = True
+        self.counts.clear()
+        self.statuses.clear()
+        self.extractions.clear()
+        self.campaign = None
+        self.wake.set()
+
+    def drain(self) -> list[tuple[str, dict]]:
+        """Pending events as (SSE event name, data), counters first."""
+        if self.resync:
+            self.resync = False
+            return [("resync", {"campaign_id": self.campaign_id})]
+        events: list[tuple[str, dict]] = []
+        if self.campaign:
+            events.append(("campaign", self.campaign))
+        counts = {status: delta for status, delta in self.counts.items() if delta}
+        if counts:
+            events.append(("counts", {"campaign_id": self.campaign_id, "deltas": counts}))
+        events.extend(("status", e) for e in self.statuses.values())
+        events.extend(("extraction", e) for e in self.extractions.values())
+        self.counts.clear()
+        self.statuses.clear()
+        self.extractions.clear()
+        self.campaign = None
+        return events
+
+    def _keep(self, pending: dict[str, dict], event: dict) -> None:
+        key = event["conversation_id"]
+        if key in pending:
+            _stats["coalesced"] += 1
+            del pending[key]  # re-insert so the newest goes last
+        pending[key] = event
+
+
+def subscribe_campaign_events(campaign_id) -> Subscriber:
+    """
+    Starts buffering the campaign's events. Subscribe before reading the
+    snapshot so nothing committed in between is missed, then hand the
+    subscriber to stream_campaign_events (or unsubscribe() if you don't).
+    """
+    subscriber = Subscriber(str(campaign_id))
+    _subscribers.setdefault(subscriber.campaign_id, set()).add(subscriber)
+    return subscriber
+
+
+def unsubscribe(subscriber: Subscriber) -> None:
+    subs = _subscribers.get(subscriber.campaign_id)
+    if subs is not None:
+        subs.discard(subscriber)
+        if not subs:
+            del _subscribers[subscriber.campaign_id]
+
+
+def stream_campaign_events(subscriber: Subscriber, snapshot: dict, is_disconnected) -> AsyncIterator[bytes]:
+    """
+    SSE stream for one campaign: a 'snapshot' event first, then coalesced
+    batches of events every SSE_COALESCE_SECONDS at most, with comment
+    heartbeats while idle. Ends (and unsubscribes) when `is_disconnected()`
+    returns True.
+    """
+    stream = _stream(subscriber, snapshot, is_disconnected)
+    # A stream the server never starts (client gone first) never reaches its
+    # finally block; unsubscribe when it is collected instead.
+    weakref.finalize(stream, unsubscribe, subscriber)
+    return stream
+
+
+async def _stream(subscriber: Subscriber, snapshot: dict, is_disconnected) -> AsyncIterator[bytes]:
+    try:
+        yield _format("snapshot", snapshot)
+        while not await is_disconnected():
+            if not subscriber.wake.is_set():
+                try:
+                    await asyncio.wait_for(subscriber.wake.wait(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+            # Let a burst of transitions land in the same batch.
+            await asyncio.sleep(SSE_COALESCE_SECONDS)
+            subscriber.wake.clear()
+            events = subscriber.drain()
+            _stats["delivered"] += len(events)
+            yield b"".join(_format(name, data) for name, data in events)
+    finally:
+        unsubscribe(subscriber)
+
+
+def _format(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+
+def _merge_counts(counts: dict[str, int], deltas: dict[str, int]) -> None:
+    for status, delta in deltas.items():
+        counts[status] = counts.get(status, 0) + delta
+
+
+def _on_notify(payload: str) -> None:
+    _stats["received"] += 1
+    event = json.loads(payload)
+    key = event.get("campaign_id")
+    _event_counts[key] = _event_counts.get(key, 0) + 1
+    for subscriber in _subscribers.get(key, ()):
+        subscriber.push(event)
+
+
+def _resync_all() -> None:
+    global _epoch
+    _epoch += 1
+    for subs in _subscribers.values():
+        for subscriber in subs:
+            subscriber.mark_resync()
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+
+from .campaign_events import publish_campaign_event
+from .db import close_pool, create_pool, get_pool
+
+logger = logging.getLogger("backend.campaign_stats")
+
+TERMINAL_STATUSES = ("completed", "declined", "abandoned", "expired", "failed")
+# Terminal statuses that stamp completed_at ('failed' outreach never started)
+_COMPLETING_STATUSES = {"completed", "declined", "abandoned", "expired"}
+
+
+async def set_conversation_status(
+    conn, conv_id, status: str, *, add_messages: int = 0, only_from: tuple[str, ...] | None = None,
+):
+    """
+    Moves a conversation to `status` (adding `add_messages` to message_count)
+    and updates its campaign's status rollup in the caller's transaction.
+    `only_from` restricts the statuses it may move from. Returns
+    (previous_status, user_id, campaign_id), or None when the conversation
+    doesn't exist or isn't in one of `only_from`.
+    """
+    row = await conn.fetchrow(
+        """
+        WITH prev AS (
+            SELECT id, status FROM conversations WHERE id = $1 FOR UPDATE
+        )
+        UPDATE conversations c
+        SET status = $2, message_count = c.message_count + $5, updated_at = NOW(),
+            completed_at = CASE WHEN $3 THEN NOW() ELSE c.completed_at END
+        FROM prev
+        WHERE c.id = prev.id AND ($4::text[] IS NULL OR prev.status = ANY($4))
+        RETURNING prev.status AS previous_status, c.user_id, c.campaign_id
+        """,
+        conv_id,
+        status,
+        status in _COMPLETING_STATUSES,
+        list(only_from) if only_from else None,
+        add_messages,
+    )
+    if row and row["campaign_id"] is not None and row["previous_status"] != status:
+        await _upsert_counts(conn, row["campaign_id"], {row["previous_status"]: -1, status: 1})
+        await publish_campaign_event(
+            conn, row["campaign_id"], "status",
+            conversation_id=str(conv_id), **{"from": row["previous_status"], "to": status},
+        )
+    return row
+
+
+async def add_status_counts(conn, campaign_id, deltas: dict[str, int]) -> None:
+    """Applies per-status deltas (e.g. newly launched conversations) to the rollup."""
+    await _upsert_counts(conn, campaign_id, deltas)
+    await publish_campaign_event(conn, campaign_id, "counts", deltas=deltas)
+
+
+async def _upsert_counts(conn, campaign_id, deltas: dict[str, int]) -> None:
+    # Rows are upserted in status order so concurrent opposite transitions
+    # (pending <-> bounty_sent) can't deadlock.
+    items = sorted((s, d) for s, d in deltas.items() if d)
+    if not items:
+        return
+    await conn.execute(
+        """
+        INSERT INTO campaign_status_counts (campaign_id, status, count)
+        SELECT $1, t.status, t.delta
+        FROM unnest($2::text[], $3::int[]) AS t(status, delta)
+        ORDER BY t.status
+        ON CONFLICT (campaign_id, status)
+        DO UPDATE SET count = campaign_status_counts.count + EXCLUDED.count
+        """,
+        campaign_id,
+        [s for s, _ in items],
+        [d for _, d in items],
+    )
+
+
+async def get_status_counts(conn, campaign_id) -> dict[str, int]:
+    rows = await conn.fetch(
+        "SELECT status, count FROM campaign_status_counts WHERE campaign_id = $1 AND count <> 0",
+        campaign_id,
+    )
+    return {r["status"]: r["count"] for r in rows}
+
+
+async def check_campaign_completion(conn, campaign_id) -> bool:
+    """
+    Marks an active campaign completed once every conversation is terminal.
+    Reads the rollup, so it costs the same for any campaign size. Call after
+    the transition commits so concurrent final transitions all see each other.
+    """
+    completed = await conn.fetchval(
+        """
+        UPDATE campaigns c
+        SET status = 'completed', updated_at = NOW()
+        WHERE c.id = $1 AND c.status = 'active' AND c.total_conversations > 0
+          AND c.total_conversations <= (
+              SELECT COALESCE(SUM(count), 0) FROM campaign_status_counts
+              WHERE campaign_id = $1 AND status = ANY($2::text[])
+          )
+        RETURNING c.id
+        """,
+        campaign_id,
+        list(TERMINAL_STATUSES),
+    )
+    if completed:
+        await publish_campaign_event(conn, campaign_id, "campaign", status="completed")
+        logger.info("Campaign %s completed (all conversations terminal)", campaign_id)
+    return completed is not None
+
+
+async def rebuild_status_counts(conn, campaign_id=None) -> None:
+    """
+    Recomputes the rollup from conversations (all campaigns, or one). Blocks
+    status transitions for the duration, so the result is exact.
+    """
+    async with conn.transaction():
+        await conn.execute("LOCK TABLE campaign_status_counts IN EXCLUSIVE MODE")
+        await conn.execute(
+            "DELETE FROM campaign_status_counts WHERE $1::uuid IS NULL OR campaign_id = $1",
+            campaign_id,
+        )
+        await conn.execute(
+            """
+            INSERT INTO campaign_status_counts (campaign_id, status, count)
+            SELECT campaign_id, status, count(*)
+            FROM conversations
+            WHERE campaign_id IS NOT NULL AND ($1::uuid IS NULL OR campaign_id = $1)
+            GROUP BY campaign_id, status
+            """,
+            campaign_id,
+        )
+
+
+# ---------------------------------------------------------------------------
+# Backfill / repair: python -m app.campaign_stats
+# ---------------------------------------------------------------------------
+
+
+async def _run_rebuild() -> None:
+    await create_pool()
+    try:
+        async with get_pool().acquire() as conn:
+            await rebuild_status_counts(conn)
+        logger.info("Rebuilt campaign status counts")
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run_rebuild())
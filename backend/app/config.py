@@ -30,4 +30,68 @@ TWILIO_WHATSAPP_FROM = _require_env("TWILIO_WHATSAPP_FROM")
 
 # Outreach worker
 OUTREACH_RATE_PER_MINUTE = int(os.environ.get("OUTREACH_RATE_PER_MINUTE", "10"))
+OUTREACH_BURST = int(os.environ.get("OUTREACH_BURST", "10"))
+# Set to 0 on API machines when dedicated `python -m app.outreach_worker`
+# processes drain the queue instead
+RUN_OUTREACH_WORKER = os.environ.get("RUN_OUTREACH_WORKER", "1") != "0"
+# Retries of an inbound turn whose agent reply failed, before giving up
+PENDING_TURN_MAX_ATTEMPTS = int(os.environ.get("PENDING_TURN_MAX_ATTEMPTS", "6"))
+# Upper bound for the adaptive LLM concurrency limit, which moves between
+# LLM_MIN_CONCURRENCY and this from observed latency and 429s
 MAX_CONCURRENT_LLM_CALLS = int(os.environ.get("MAX_CONCURRENT_LLM_CALLS", "20"))
+LLM_MIN_CONCURRENCY = int(os.environ.get("LLM_MIN_CONCURRENCY", "2"))
+# Attempts per LLM call on rate-limit / transient errors (jittered backoff)
+LLM_MAX_ATTEMPTS = int(os.environ.get("LLM_MAX_ATTEMPTS", "3"))
+# Consecutive provider failures that open the circuit breaker, and how long
+# calls fail fast before a probe is let through
+LLM_BREAKER_THRESHOLD = int(os.environ.get("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.environ.get("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+# General (idle) chat waiting for an LLM slot beyond this is answered with a
+# template instead of queueing behind campaign turns
+LLM_GENERAL_QUEUE_LIMIT = int(os.environ.get("LLM_GENERAL_QUEUE_LIMIT", "50"))
+
+# Inbound routing — comma-separated Fly machine IDs that own inbound
+# processing. Empty means this process handles every participant.
+INBOUND_NODES = [n.strip() for n in os.environ.get("INBOUND_NODES", "").split(",") if n.strip()]
+MACHINE_ID = os.environ.get("FLY_MACHINE_ID", "")
+# Messages from one participant arriving within this quiet window are answered
+# in a single agent turn. 0 disables coalescing.
+INBOUND_DEBOUNCE_SECONDS = float(os.environ.get("INBOUND_DEBOUNCE_SECONDS", "2"))
+INBOUND_MAX_WAIT_SECONDS = float(os.environ.get("INBOUND_MAX_WAIT_SECONDS", "8"))
+INBOUND_MAX_BATCH = int(os.environ.get("INBOUND_MAX_BATCH", "10"))
+
+# In-memory cache of inbound routing state (user -> active conversation ->
+# campaign config), invalidated across processes via NOTIFY
+ROUTING_CACHE_SIZE = int(os.environ.get("ROUTING_CACHE_SIZE", "10000"))
+ROUTING_CACHE_TTL_SECONDS = float(os.environ.get("ROUTING_CACHE_TTL_SECONDS", "300"))
+
+# Conversation history sent to the LLM. Older turns beyond the token budget
+# are folded into a rolling summary stored on the conversation.
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "3000"))
+HISTORY_MIN_RECENT_MESSAGES = int(os.environ.get("HISTORY_MIN_RECENT_MESSAGES", "6"))
+HISTORY_CACHE_SIZE = int(os.environ.get("HISTORY_CACHE_SIZE", "5000"))
+HISTORY_CACHE_TTL_SECONDS = float(os.environ.get("HISTORY_CACHE_TTL_SECONDS", "1800"))
+
+# Provider-side caching of the stable prompt prefix (personality + campaign
+# brief/schema): "gemini", "fake" (in-memory, for local runs/tests) or "off"
+CONTEXT_CACHE_PROVIDER = os.environ.get("CONTEXT_CACHE_PROVIDER", "off")
+CONTEXT_CACHE_TTL_SECONDS = int(os.environ.get("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+CONTEXT_CACHE_MAX_ENTRIES = int(os.environ.get("CONTEXT_CACHE_MAX_ENTRIES", "200"))
+
+# Rows read per keyset page when streaming exports
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", "2000"))
+
+# Campaign analytics are recomputed when the campaign changes, but a result
+# younger than this is served as-is so busy campaigns aren't recomputed per request
+ANALYTICS_MAX_STALENESS_SECONDS = float(os.environ.get("ANALYTICS_MAX_STALENESS_SECONDS", "10"))
+
+# Server-Sent Events for live campaign progress: events are batched per
+# client at most this often, idle streams get a heartbeat comment, and a
+# client this many conversations behind is told to resync instead
+SSE_COALESCE_SECONDS = float(os.environ.get("SSE_COALESCE_SECONDS", "0.5"))
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_MAX_PENDING_EVENTS = int(os.environ.get("SSE_MAX_PENDING_EVENTS", "500"))
+
+# Outbound sender pool
+OUTBOUND_QUEUE_SIZE = int(os.environ.get("OUTBOUND_QUEUE_SIZE", "1000"))
+OUTBOUND_SENDER_WORKERS = int(os.environ.get("OUTBOUND_SENDER_WORKERS", "8"))
@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Protocol
+from uuid import uuid4
+
+from .config import (
+    CONTEXT_CACHE_MAX_ENTRIES,
+    CONTEXT_CACHE_PROVIDER,
+    CONTEXT_CACHE_TTL_SECONDS,
+)
+
+logger = logging.getLogger("backend.context_cache")
+
+# Refresh a cached context that is still in use once less than this much of
+# its TTL is left.
+REFRESH_MARGIN_SECONDS = 300
+# After a failed create (e.g. prefix below the provider's minimum size), don't
+# retry the same key for this long.
+NEGATIVE_TTL_SECONDS = 600
+# Gemini 2.5 Flash only caches prefixes of at least 1,024 tokens; shorter ones
+# are skipped up front (~4 characters per token).
+GEMINI_MIN_CACHE_CHARS = 4096
+
+
+@dataclass
+class CachedContext:
+    name: str
+    expires_at: float  # time.monotonic()
+
+
+class ContextCacheProvider(Protocol):
+    async def create(self, model: str, system_instruction: str, ttl_seconds: int) -> CachedContext: ...
+
+    async def refresh(self, name: str, ttl_seconds: int) -> CachedContext: ...
+
+    async def delete(self, name: str) -> None: ...
+
+
+class GeminiContextCacheProvider:
+    """Explicit context caching through the Gemini API (google-genai)."""
+
+    def __init__(self):
+        from google import genai
+
+        self._client = genai.Client()
+
+    async def create(self, model: str, system_instruction: str, ttl_seconds: int) -> CachedContext:
+        from google.genai import types
+
+        cached = await self._client.aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                ttl=f"{ttl_seconds}s",
+            ),
+        )
+        return CachedContext(name=cached.name, expires_at=time.monotonic() + ttl_seconds)
+
+    async def refresh(self, name: str, ttl_seconds: int) -> CachedContext:
+        from google.genai import types
+
+        await self._client.aio.caches.update(
+            name=name, config=types.UpdateCachedContentConfig(ttl=f"{ttl_seconds}s"),
+        )
+        return CachedContext(name=name, expires_at=time.monotonic() + ttl_seconds)
+
+    async def delete(self, name: str) -> None:
+        await self._client.aio.caches.delete(name=name)
+
+
+class FakeContextCacheProvider:
+    """In-memory provider for local runs and tests; records every call."""
+
+    def __init__(self, min_chars: int = 0):
+        self.min_chars = min_chars
+        self.contexts: dict[str, str] = {}
+        self.calls: list[tuple[str, str]] = []
+
+    async def create(self, model: str, system_instruction: str, ttl_seconds: int) -> CachedContext:
+        self.calls.append(("create", model))
+        if len(system_instruction) < self.min_chars:
+            raise ValueError("Cached content is too small")
+        name = f"cachedContents/fake-{uuid4().hex[:12]}"
+        self.contexts[name] = system_instruction
+        return CachedContext(name=name, expires_at=time.monotonic() + ttl_seconds)
+
+    async def refresh(self, name: str, ttl_seconds: int) -> CachedContext:
+        self.calls.append(("refresh", name))
+        if name not in self.contexts:
+            raise KeyError(name)
+        return CachedContext(name=name, expires_at=time.monotonic() + ttl_seconds)
+
+    async def delete(self, name: str) -> None:
+        self.calls.append(("delete", name))
+        self.contexts.pop(name, None)
+
+
+class ContextCacheManager:
+    """
+    Maps a stable prompt prefix (identified by `key`) to a provider cache
+    handle. Handles are created on first use, refreshed while in use, and
+    deleted when evicted. Failures fall back to sending the prompt inline.
+    """
+
+    def __init__(
+        self,
+        provider: ContextCacheProvider,
+        model: str,
+        ttl_seconds: int = CONTEXT_CACHE_TTL_SECONDS,
+        max_entries: int = CONTEXT_CACHE_MAX_ENTRIES,
+        min_chars: int = 0,
+    ):
+        self.provider = provider
+        self.model = model
+        self.min_chars = min_chars
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CachedContext] = OrderedDict()
+        self._failed: dict[str, float] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "create_errors": 0,
+            "fallbacks": 0,
+            "rejected": 0,
+        }
+
+    async def get_handle(self, key: str, system_instruction: str) -> str | None:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry and entry.expires_at - now > REFRESH_MARGIN_SECONDS:
+            self.stats["hits"] += 1
+            self._entries.move_to_end(key)
+            return entry.name
+        if self._failed.get(key, 0) > now or len(system_instruction) < self.min_chars:
+            self.stats["fallbacks"] += 1
+            return None
+
+        # One create/refresh per key at a time; concurrent turns wait for it.
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry and entry.expires_at - now > REFRESH_MARGIN_SECONDS:
+                self.stats["hits"] += 1
+                return entry.name
+            try:
+                if entry and entry.expires_at > now:
+                    entry = await self.provider.refresh(entry.name, self.ttl_seconds)
+                    self.stats["refreshes"] += 1
+                else:
+                    entry = await self.provider.create(self.model, system_instruction, self.ttl_seconds)
+                    self.stats["misses"] += 1
+            except Exception as e:
+                self.stats["create_errors"] += 1
+                self.stats["fallbacks"] += 1
+                self._entries.pop(key, None)
+                self._failed[key] = time.monotonic() + NEGATIVE_TTL_SECONDS
+                logger.warning("Context cache unavailable for %s: %s", key, e)
+                return None
+
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            await self._evict_overflow()
+            return entry.name
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def invalidate(self, key: str) -> None:
+        """
+        Drops a handle the provider rejected (e.g. expired early): deletes it
+        provider-side so it stops being billed, and holds the key off for
+        NEGATIVE_TTL_SECONDS so a handle that keeps failing isn't recreated
+        on every turn.
+        """
+        self.stats["rejected"] += 1
+        self._failed[key] = time.monotonic() + NEGATIVE_TTL_SECONDS
+        entry = self._entries.pop(key, None)
+        if entry:
+            await self._delete(entry.name)
+
+    async def close(self) -> None:
+        names = [e.name for e in self._entries.values()]
+        self._entries.clear()
+        for name in names:
+            await self._delete(name)
+
+    async def _evict_overflow(self) -> None:
+        while len(self._entries) > self.max_entries:
+            key, entry = self._entries.popitem(last=False)
+            self._locks.pop(key, None)
+            await self._delete(entry.name)
+
+    async def _delete(self, name: str) -> None:
+        try:
+            await self.provider.delete(name)
+        except Exception:
+            logger.warning("Failed to delete cached context %s", name)
+
+
+_manager: ContextCacheManager | None = None
+
+
+def get_context_cache(model: str) -> ContextCacheManager | None:
+    """The process-wide manager for CONTEXT_CACHE_PROVIDER, or None when off."""
+    global _manager
+    if _manager is None and CONTEXT_CACHE_PROVIDER != "off":
+        if CONTEXT_CACHE_PROVIDER == "gemini":
+            _manager = ContextCacheManager(
+                GeminiContextCacheProvider(), model, min_chars=GEMINI_MIN_CACHE_CHARS,
+            )
+        elif CONTEXT_CACHE_PROVIDER == "fake":
+            _manager = ContextCacheManager(FakeContextCacheProvider(), model)
+        else:
+            raise RuntimeError(f"Unknown CONTEXT_CACHE_PROVIDER: {CONTEXT_CACHE_PROVIDER}")
+    return _manager
+
+
+def set_context_cache(manager: ContextCacheManager | None) -> None:
+    """Installs a manager explicitly, e.g. one backed by FakeContextCacheProvider."""
+    global _manager
+    _manager = manager
+
+
+async def close_context_cache() -> None:
+    global _manager
+    if _manager:
+        await _manager.close()
+        _manager = None
+
+
+def context_cache_stats() -> dict:
+    if _manager is None:
+        return {"provider": CONTEXT_CACHE_PROVIDER}
+    return {
+        "provider": CONTEXT_CACHE_PROVIDER,
+        **_manager.stats,
+        "entries": len(_manager),
+    }
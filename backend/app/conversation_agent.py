@@ -1,10 +1,19 @@
+import hashlib
 import logging
 import os
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from typing import Any
 
-from pydantic_ai import Agent, RunContext
+from pydantic_ai import Agent, NativeOutput, RunContext
+from pydantic_ai.exceptions import ModelHTTPError
+from pydantic_ai.messages import ModelMessage, ModelResponse, TextPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+from pydantic_ai.models.google import GoogleModelSettings
+from pydantic_ai.profiles import ModelProfile
 
+from .context_cache import FakeContextCacheProvider, get_context_cache
+from .llm_scheduler import classify_llm_error
 from .models import AgentResponse
 
 logger = logging.getLogger("backend.conversation_agent")
@@ -23,6 +32,8 @@ def _ai_enabled() -> bool:
 class MeshContext:
     mode: str  # "onboarding" | "campaign" | "general" | "bounty"
     conversation_history: list[dict[str, str]]
+    # Rolling summary of turns older than conversation_history
+    history_summary: str | None = None
     user_demographics: dict[str, Any] = field(default_factory=dict)
     # Campaign-specific (None when not in campaign/bounty mode)
     research_brief: str | None = None
@@ -31,32 +42,94 @@ class MeshContext:
     reward_text: str | None = None
     reward_link: str | None = None
     system_prompt_override: str | None = None
+    # Identify the campaign's compiled prompt; version is campaigns.updated_at
+    campaign_id: Any = None
+    campaign_version: Any = None
+
+
+# ---------------------------------------------------------------------------
+# Compiled campaign prompts — the per-campaign static sections, rendered once
+# ---------------------------------------------------------------------------
+
+PROMPT_CACHE_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class CompiledCampaignPrompt:
+    version: Any
+    campaign_static: str
+    bounty_block: str
+    # key -> description, in schema order
+    field_descriptions: dict[str, str]
+
+
+_compiled_prompts: OrderedDict[str, CompiledCampaignPrompt] = OrderedDict()
+_prompt_cache_stats = {"hits": 0, "misses": 0}
+
+
+def compiled_campaign_prompt(deps: MeshContext) -> CompiledCampaignPrompt:
+    """Returns the campaign's compiled prompt, recompiling when its version changes."""
+    if deps.campaign_id is None:
+        return _compile_campaign_prompt(deps)
+
+    key = str(deps.campaign_id)
+    compiled = _compiled_prompts.get(key)
+    if compiled is not None and compiled.version == deps.campaign_version:
+        _prompt_cache_stats["hits"] += 1
+        _compiled_prompts.move_to_end(key)
+        return compiled
+
+    _prompt_cache_stats["misses"] += 1
+    compiled = _compile_campaign_prompt(deps)
+    _compiled_prompts[key] = compiled
+    _compiled_prompts.move_to_end(key)
+    while len(_compiled_prompts) > PROMPT_CACHE_SIZE:
+        _compiled_prompts.popitem(last=False)
+    return compiled
+
+
+def prompt_cache_stats() -> dict:
+    return {**_prompt_cache_stats, "campaigns": len(_compiled_prompts)}
 
 
 # ---------------------------------------------------------------------------
 # Single global agent
 # ---------------------------------------------------------------------------
 
+MODEL_NAME = "gemini-2.5-flash"
+
 agent = Agent(
-    "google-gla:gemini-2.5-flash",
+    f"google-gla:{MODEL_NAME}",
     deps_type=MeshContext,
     output_type=AgentResponse,
 )
 
+# Runs against a provider-side cached context that already holds the system
+# prompt. Gemini rejects cached requests that also carry a system instruction
+# or tools, so this agent has no system prompts and uses native structured
+# output instead of an output tool.
+cached_agent = Agent(
+    f"google-gla:{MODEL_NAME}",
+    deps_type=MeshContext,
+    output_type=NativeOutput(AgentResponse),
+)
+
 
 # ---------------------------------------------------------------------------
 # Shared personality prompt (always present)
 # ---------------------------------------------------------------------------
 
+PERSONALITY_PROMPT = (
+    "You are MeshAI. You pay people for quick research chats "
+    "on WhatsApp. Your vibe: fun, warm, quick. Like texting a friend "
+    "who happens to pay you. 1-3 sentences max per message. "
+    "Emojis natural, not forced. Never corporate."
+)
+
 
 @agent.system_prompt
 def personality() -> str:
-    return (
-        "You are MeshAI. You pay people for quick research chats "
-        "on WhatsApp. Your vibe: fun, warm, quick. Like texting a friend "
-        "who happens to pay you. 1-3 sentences max per message. "
-        "Emojis natural, not forced. Never corporate."
-    )
+    return PERSONALITY_PROMPT
 
 
 # ---------------------------------------------------------------------------
@@ -120,13 +193,14 @@ Keys: city, neighborhood, age_range, gender."""
 
 
 def _campaign_block(deps: MeshContext) -> str:
-    extraction_schema = deps.extraction_schema or {}
-    extracted_data = deps.extracted_data or {}
+    # Static sections first so the prompt prefix is identical for every
+    # conversation in the campaign (provider-side prefix caching).
+    compiled = compiled_campaign_prompt(deps)
+    return f"{compiled.campaign_static}\n\n{_campaign_dynamic(deps, compiled)}"
 
-    schema_lines = "\n".join(
-        f"- {key}: {field_def.get('description', '')} (type: {field_def.get('type', 'string')})"
-        for key, field_def in extraction_schema.items()
-    )
+
+def _campaign_dynamic(deps: MeshContext, compiled: CompiledCampaignPrompt) -> str:
+    extracted_data = deps.extracted_data or {}
 
     already_collected = "\n".join(
         f"- {key}: {value}"
@@ -134,13 +208,10 @@ def _campaign_block(deps: MeshContext) -> str:
         if value is not None
     ) or "Nothing extracted yet."
 
-    remaining_keys = [
-        key for key in extraction_schema
-        if key not in extracted_data or extracted_data[key] is None
-    ]
     remaining_lines = "\n".join(
-        f"- {key}: {extraction_schema[key].get('description', '')}"
-        for key in remaining_keys
+        f"- {key}: {description}"
+        for key, description in compiled.field_descriptions.items()
+        if extracted_data.get(key) is None
     ) or "All data points collected."
 
     # Demographics section
@@ -150,6 +221,28 @@ def _campaign_block(deps: MeshContext) -> str:
         for k in ("city", "neighborhood", "age_range", "gender")
     )
 
+    return f"""KNOWN ABOUT THIS PERSON:
+{demo_lines}
+
+ALREADY COLLECTED:
+{already_collected}
+
+STILL NEEDED:
+{remaining_lines}"""
+
+
+def _bounty_block(deps: MeshContext) -> str:
+    return compiled_campaign_prompt(deps).bounty_block
+
+
+def _compile_campaign_prompt(deps: MeshContext) -> CompiledCampaignPrompt:
+    extraction_schema = deps.extraction_schema or {}
+
+    schema_lines = "\n".join(
+        f"- {key}: {field_def.get('description', '')} (type: {field_def.get('type', 'string')})"
+        for key, field_def in extraction_schema.items()
+    )
+
     custom_instructions = ""
     if deps.system_prompt_override:
         custom_instructions = f"\nADDITIONAL INSTRUCTIONS:\n{deps.system_prompt_override}\n"
@@ -159,28 +252,19 @@ def _campaign_block(deps: MeshContext) -> str:
     if deps.reward_link:
         reward_link_line = f"REWARD LINK (include when conversation_complete): {deps.reward_link}"
 
-    return f"""MODE: CAMPAIGN CONVERSATION
+    campaign_static = f"""MODE: CAMPAIGN CONVERSATION
 {reward_line}
 RESEARCH CONTEXT:
 {deps.research_brief or ''}
 {custom_instructions}
-KNOWN ABOUT THIS PERSON:
-{demo_lines}
-
 DATA POINTS TO COLLECT:
 {schema_lines}
 
-ALREADY COLLECTED:
-{already_collected}
-
-STILL NEEDED:
-{remaining_lines}
-
 {reward_link_line}
 
 RULES:
 1. Your first message after they accept should signal the start clearly.
-2. If any demographics above are "unknown", weave them in naturally
+2. If any demographics below are "unknown", weave them in naturally
    at the start before the research questions. Return them in user_demographics_update.
 3. Ask ONE question at a time. 1-3 sentences max.
 4. Acknowledge what the person said before changing topics.
@@ -191,9 +275,7 @@ RULES:
    send a thank-you message and include the reward link.
    Set conversation_complete = true."""
 
-
-def _bounty_block(deps: MeshContext) -> str:
-    return f"""MODE: BOUNTY INTERPRETATION
+    bounty_block = f"""MODE: BOUNTY INTERPRETATION
 The user was sent a bounty notification and has replied.
 Research topic: {deps.research_brief or 'N/A'}
 Reward: {deps.reward_text or 'N/A'}
@@ -218,6 +300,16 @@ If AMBIGUOUS (can't tell):
 - Ask for clarification naturally: "Just checking — want to jump in? Reply 'go' to start!"
 - Do NOT set conversation_complete."""
 
+    return CompiledCampaignPrompt(
+        version=deps.campaign_version,
+        campaign_static=campaign_static,
+        bounty_block=bounty_block,
+        field_descriptions={
+            key: field_def.get("description", "")
+            for key, field_def in extraction_schema.items()
+        },
+    )
+
 
 def _general_block(deps: MeshContext) -> str:
     return """MODE: GENERAL
@@ -242,8 +334,10 @@ Never set conversation_complete to true."""
 # ---------------------------------------------------------------------------
 
 
-def _build_user_prompt(conversation_history: list[dict[str, str]]) -> str:
-    if not conversation_history:
+def _build_user_prompt(
+    conversation_history: list[dict[str, str]], history_summary: str | None = None,
+) -> str:
+    if not conversation_history and not history_summary:
         return "The conversation hasn't started yet. Send your opening message."
 
     lines = []
@@ -251,8 +345,13 @@ def _build_user_prompt(conversation_history: list[dict[str, str]]) -> str:
         role = "You" if msg["sender"] == "agent" else "Them"
         lines.append(f"{role}: {msg['content']}")
 
+    earlier = ""
+    if history_summary:
+        earlier = f"Summary of the earlier conversation:\n{history_summary}\n\n"
+
     return (
-        "Here is the conversation so far:\n\n"
+        earlier
+        + "Here is the conversation so far:\n\n"
         + "\n".join(lines)
         + "\n\nRespond with your next message."
     )
@@ -267,6 +366,113 @@ async def get_agent_response(deps: MeshContext) -> AgentResponse:
     if not _ai_enabled():
         raise RuntimeError("AI is not enabled — set GOOGLE_API_KEY")
 
-    user_prompt = _build_user_prompt(deps.conversation_history)
+    user_prompt = _build_user_prompt(deps.conversation_history, deps.history_summary)
+    cached = await _run_with_cached_context(deps, user_prompt)
+    if cached is not None:
+        return cached
     result = await agent.run(user_prompt, deps=deps)
     return result.output
+
+
+async def _run_with_cached_context(deps: MeshContext, user_prompt: str) -> AgentResponse | None:
+    """
+    Runs the turn against a cached personality + campaign prefix. Returns None
+    (caller sends the full prompt inline) when caching is off, not applicable
+    to this mode, or the provider rejects the handle.
+    """
+    manager = get_context_cache(MODEL_NAME)
+    if manager is None or deps.campaign_id is None or deps.mode not in ("campaign", "bounty"):
+        return None
+
+    compiled = compiled_campaign_prompt(deps)
+    if deps.mode == "campaign":
+        static, dynamic = compiled.campaign_static, _campaign_dynamic(deps, compiled)
+    else:
+        static, dynamic = compiled.bounty_block, ""
+
+    # Keyed by content, not campaigns.updated_at: launches, pauses and counter
+    # updates bump updated_at without touching the prompt, and each new key
+    # would create (and pay for) another provider cache.
+    system_instruction = f"{PERSONALITY_PROMPT}\n\n{static}"
+    digest = hashlib.sha256(system_instruction.encode()).hexdigest()[:16]
+    key = f"{deps.mode}:{deps.campaign_id}:{digest}"
+    handle = await manager.get_handle(key, system_instruction)
+    if handle is None:
+        return None
+
+    prompt = f"{dynamic}\n\n{user_prompt}" if dynamic else user_prompt
+    # Fake handles mean nothing to Gemini, so the fake provider is paired
+    # with a local model that resolves them.
+    model = _fake_cached_model(manager.provider) if isinstance(manager.provider, FakeContextCacheProvider) else None
+    try:
+        result = await cached_agent.run(
+            prompt, deps=deps, model=model,
+            model_settings=GoogleModelSettings(google_cached_content=handle),
+        )
+    except Exception as e:
+        if classify_llm_error(e) is not None:
+            raise  # throttled or transient, not a bad handle: the scheduler retries
+        if _is_cache_rejection(e):
+            logger.warning("Cached context for %s was rejected, retrying inline: %s", key, e)
+            await manager.invalidate(key)
+        else:
+            logger.exception("Cached-context run failed for %s, retrying inline", key)
+        return None
+    return result.output
+
+
+def _is_cache_rejection(exc: BaseException) -> bool:
+    """Gemini's answer to an expired, deleted or unknown cached-content handle."""
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    text = str(exc).lower().replace(" ", "").replace("_", "")
+    return status in (400, 403, 404) and "cachedcontent" in text
+
+
+def _fake_cached_model(provider: FakeContextCacheProvider) -> FunctionModel:
+    """
+    Stands in for Gemini when CONTEXT_CACHE_PROVIDER=fake: rejects handles
+    the fake provider doesn't hold (like Gemini's 404) and otherwise returns
+    a canned reply, so the cached path runs end to end without the API.
+    """
+
+    def respond(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        handle = (info.model_settings or {}).get("google_cached_content")
+        if handle not in provider.contexts:
+            raise ModelHTTPError(404, MODEL_NAME, {"error": f"CachedContent not found: {handle}"})
+        reply = AgentResponse(message="Thanks! Tell me a bit more about that.")
+        return ModelResponse(parts=[TextPart(reply.model_dump_json())])
+
+    return FunctionModel(respond, model_name=MODEL_NAME, profile=ModelProfile(supports_json_schema_output=True))
+
+
+# ---------------------------------------------------------------------------
+# History summarizer — folds old turns into a rolling summary
+# ---------------------------------------------------------------------------
+
+summary_agent = Agent(
+    f"google-gla:{MODEL_NAME}",
+    output_type=str,
+    system_prompt=(
+        "You maintain a running summary of a WhatsApp research chat between "
+        "MeshAI (\"You\") and a participant (\"Them\"). Merge the new messages "
+        "into the existing summary. Keep every concrete fact the participant "
+        "shared, questions already asked, and commitments made. Plain prose, "
+        "under 200 words."
+    ),
+)
+
+
+async def summarize_history(previous_summary: str | None, messages: list[dict[str, str]]) -> str:
+    if not _ai_enabled():
+        raise RuntimeError("AI is not enabled — set GOOGLE_API_KEY")
+
+    transcript = "\n".join(
+        f"{'You' if m['sender'] == 'agent' else 'Them'}: {m['content']}" for m in messages
+    )
+    prompt = (
+        f"Existing summary:\n{previous_summary or 'None yet.'}\n\n"
+        f"New messages:\n{transcript}\n\n"
+        "Return the updated summary."
+    )
+    result = await summary_agent.run(prompt)
+    return result.output
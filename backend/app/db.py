@@ -1,9 +1,24 @@
+import asyncio
+import logging
+from typing import Callable
+
 import asyncpg
 
 from .config import DATABASE_URL
 
+logger = logging.getLogger("backend.db")
+
 pool: asyncpg.Pool | None = None
 
+# Dedicated connection for LISTEN, kept outside the pool so it never competes
+# with request traffic. Shared by every subsystem that wants notifications.
+_listener_conn: asyncpg.Connection | None = None
+_listeners: dict[str, list[Callable[[str], None]]] = {}
+_reconnect_callbacks: list[Callable[[], None]] = []
+_reconnect_task: asyncio.Task | None = None
+
+LISTENER_RECONNECT_SECONDS = 5
+
 
 async def create_pool() -> asyncpg.Pool:
     global pool
@@ -16,7 +31,15 @@ async def create_pool() -> asyncpg.Pool:
 
 
 async def close_pool() -> None:
-    global pool
+    global pool, _listener_conn, _reconnect_task
+    if _reconnect_task:
+        _reconnect_task.cancel()
+        _reconnect_task = None
+    if _listener_conn:
+        conn, _listener_conn = _listener_conn, None
+        await conn.close()
+    _listeners.clear()
+    _reconnect_callbacks.clear()
     if pool:
         await pool.close()
         pool = None
@@ -26,3 +49,62 @@ def get_pool() -> asyncpg.Pool:
     if pool is None:
         raise RuntimeError("Database pool not initialized. Call create_pool() first.")
     return pool
+
+
+async def add_listener(channel: str, callback: Callable[[str], None]) -> None:
+    """
+    Calls callback(payload) for every NOTIFY on channel. Subscriptions survive
+    listener reconnects; callers should still poll as a fallback.
+    """
+    first = channel not in _listeners
+    _listeners.setdefault(channel, []).append(callback)
+    if _listener_conn is None:
+        await _connect_listener()
+    elif first:
+        await _listener_conn.add_listener(channel, _dispatch)
+
+
+def on_listener_reconnect(callback: Callable[[], None]) -> None:
+    """Calls callback() after the listener reconnects, since NOTIFYs sent while it was down are lost."""
+    _reconnect_callbacks.append(callback)
+
+
+async def _connect_listener() -> None:
+    global _listener_conn
+    conn = await asyncpg.connect(dsn=DATABASE_URL)
+    conn.add_termination_listener(_on_listener_terminated)
+    for channel in _listeners:
+        await conn.add_listener(channel, _dispatch)
+    _listener_conn = conn
+
+
+def _dispatch(_conn, _pid, channel: str, payload: str) -> None:
+    for callback in _listeners.get(channel, ()):
+        try:
+            callback(payload)
+        except Exception:
+            logger.exception("Listener callback failed for channel %s", channel)
+
+
+def _on_listener_terminated(_conn) -> None:
+    global _listener_conn, _reconnect_task
+    if _listener_conn is None:
+        return  # closed on purpose
+    logger.warning("LISTEN connection lost, reconnecting")
+    _listener_conn = None
+    _reconnect_task = asyncio.create_task(_reconnect_listener())
+
+
+async def _reconnect_listener() -> None:
+    while _listener_conn is None and _listeners:
+        try:
+            await _connect_listener()
+        except Exception:
+            logger.exception("LISTEN reconnect failed")
+            await asyncio.sleep(LISTENER_RECONNECT_SECONDS)
+            continue
+        for callback in _reconnect_callbacks:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Listener reconnect callback failed")
@@ -0,0 +1,302 @@
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator
+from uuid import UUID
+
+from .config import EXPORT_PAGE_SIZE
+from .db import get_pool
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+_stats = {"exports": 0, "rows": 0, "bytes": 0}
+
+
+def encode_cursor(ts: datetime, row_id) -> str:
+    """Opaque keyset cursor for (timestamp, id) ordering."""
+    raw = f"{ts.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple[datetime, UUID]:
+    """Raises ValueError on a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        ts, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(ts), UUID(row_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def export_stats() -> dict:
+    return dict(_stats)
+
+
+async def next_extractions_cursor(campaign_id, after: tuple | None, limit: int) -> str | None:
+    """
+    Cursor for the page after `limit` rows, or None when this page reaches the
+    end. Computed before streaming so it can go in a response header.
+    """
+    rows = await get_pool().fetch(
+        f"""
+        SELECT completed_at, id FROM conversations
+        WHERE {_EXTRACTIONS_WHERE}
+        ORDER BY completed_at, id
+        OFFSET $4 LIMIT 2
+        """,
+        campaign_id,
+        after[0] if after else None,
+        after[1] if after else None,
+        limit - 1,
+    )
+    if len(rows) < 2:
+        return None
+    return encode_cursor(rows[0]["completed_at"], rows[0]["id"])
+
+
+async def stream_extractions(
+    campaign_id, schema: dict[str, Any], fmt: str, after: tuple | None = None, limit: int | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Streams completed conversations' extracted data in `fmt`, oldest completion
+    first. Rows are read in keyset pages of EXPORT_PAGE_SIZE and the
+    connection is released between pages, so a slow client never pins a pool
+    connection and memory stays bounded by one page.
+    """
+    writer = _WRITERS[fmt](schema)
+    _stats["exports"] += 1
+    remaining = limit
+    chunk = writer.begin()
+    if chunk:
+        yield _count(chunk)
+    while remaining is None or remaining > 0:
+        page_size = EXPORT_PAGE_SIZE if remaining is None else min(EXPORT_PAGE_SIZE, remaining)
+        rows = await get_pool().fetch(
+            f"""
+            SELECT id, phone_number, completed_at, extracted_data FROM conversations
+            WHERE {_EXTRACTIONS_WHERE}
+            ORDER BY completed_at, id
+            LIMIT $4
+            """,
+            campaign_id,
+            after[0] if after else None,
+            after[1] if after else None,
+            page_size,
+        )
+        if not rows:
+            break
+        _stats["rows"] += len(rows)
+        yield _count(writer.write([_extraction(r) for r in rows]))
+        after = (rows[-1]["completed_at"], rows[-1]["id"])
+        if remaining is not None:
+            remaining -= len(rows)
+        if len(rows) < page_size:
+            break
+    chunk = writer.end()
+    if chunk:
+        yield _count(chunk)
+
+
+_EXTRACTIONS_WHERE = """
+    campaign_id = $1 AND status = 'completed' AND completed_at IS NOT NULL
+    AND ($2::timestamptz IS NULL OR (completed_at, id) > ($2, $3::uuid))
+"""
+
+
+def _count(chunk: bytes) -> bytes:
+    _stats["bytes"] += len(chunk)
+    return chunk
+
+
+def _extraction(row) -> dict[str, Any]:
+    data = row["extracted_data"]
+    if isinstance(data, str):
+        data = json.loads(data)
+    return {
+        "conversation_id": str(row["id"]),
+        "phone_number": row["phone_number"],
+        "completed_at": row["completed_at"],
+        "data": data or {},
+    }
+
+
+class _NdjsonWriter:
+    def __init__(self, schema: dict[str, Any]):
+        pass
+
+    def begin(self) -> bytes:
+        return b""
+
+    def write(self, rows: list[dict[str, Any]]) -> bytes:
+        return "".join(
+            json.dumps({**r, "completed_at": r["completed_at"].isoformat()}, default=str) + "\n"
+            for r in rows
+        ).encode()
+
+    def end(self) -> bytes:
+        return b""
+
+
+class _CsvWriter:
+    """One column per extraction_schema field; lists and objects are JSON-encoded."""
+
+    def __init__(self, schema: dict[str, Any]):
+        self.fields = list(schema)
+        self._buf = io.StringIO()
+        self._csv = csv.writer(self._buf)
+
+    def begin(self) -> bytes:
+        self._csv.writerow(["conversation_id", "phone_number", "completed_at", *self.fields])
+        return self._drain()
+
+    def write(self, rows: list[dict[str, Any]]) -> bytes:
+        for r in rows:
+            self._csv.writerow([
+                r["conversation_id"],
+                r["phone_number"],
+                r["completed_at"].isoformat(),
+                *(_csv_value(r["data"].get(f)) for f in self.fields),
+            ])
+        return self._drain()
+
+    def end(self) -> bytes:
+        return b""
+
+    def _drain(self) -> bytes:
+        out = self._buf.getvalue().encode()
+        self._buf.seek(0)
+        self._buf.truncate()
+        return out
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return "" if value is None else value
+
+
+class _ArrowWriter:
+    """
+    Arrow IPC stream, one record batch per page. Schema fields declared as
+    number/integer/boolean get typed columns (values that don't fit are
+    null); everything else is a string column.
+    """
+
+    def __init__(self, schema: dict[str, Any]):
+        import pyarrow as pa
+
+        self.pa = pa
+        self.fields = list(schema)
+        self._types = {f: _arrow_type(pa, schema[f]) for f in self.fields}
+        self.schema = pa.schema([
+            ("conversation_id", pa.string()),
+            ("phone_number", pa.string()),
+            ("completed_at", pa.timestamp("us", tz="UTC")),
+            *((f, self._types[f]) for f in self.fields),
+        ])
+        self._sink = _DrainableSink()
+        self._writer = None
+
+    def begin(self) -> bytes:
+        self._writer = self.pa.ipc.new_stream(self._sink, self.schema)
+        return self._sink.drain()
+
+    def write(self, rows: list[dict[str, Any]]) -> bytes:
+        self._writer.write_table(self._table(rows))
+        return self._sink.drain()
+
+    def end(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+    def _table(self, rows: list[dict[str, Any]]):
+        columns = {
+            "conversation_id": [r["conversation_id"] for r in rows],
+            "phone_number": [r["phone_number"] for r in rows],
+            "completed_at": [r["completed_at"] for r in rows],
+        }
+        for f in self.fields:
+            columns[f] = [_arrow_value(self._types[f], r["data"].get(f), self.pa) for r in rows]
+        return self.pa.Table.from_pydict(columns, schema=self.schema)
+
+
+class _ParquetWriter(_ArrowWriter):
+    """Parquet file written one row group per page; the footer goes out last."""
+
+    def begin(self) -> bytes:
+        import pyarrow.parquet as pq
+
+        self._writer = pq.ParquetWriter(self._sink, self.schema)
+        return self._sink.drain()
+
+
+class _DrainableSink(io.RawIOBase):
+    """
+    Write-only file object whose buffered bytes can be handed to the client
+    as they are produced. tell() keeps counting across drains, which the
+    Parquet writer relies on for footer offsets.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
+
+
+def _arrow_type(pa, field: Any):
+    declared = str(field.get("type", "") if isinstance(field, dict) else field).lower()
+    if declared.startswith(("number", "float", "integer", "int")):
+        return pa.float64()
+    if declared.startswith(("bool", "boolean")):
+        return pa.bool_()
+    return pa.string()
+
+
+def _arrow_value(arrow_type, value: Any, pa) -> Any:
+    if value is None:
+        return None
+    if arrow_type == pa.float64():
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    if arrow_type == pa.bool_():
+        if isinstance(value, bool):
+            return value
+        lowered = str(value).strip().lower()
+        return True if lowered in ("true", "yes", "1") else False if lowered in ("false", "no", "0") else None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+_WRITERS = {
+    "ndjson": _NdjsonWriter,
+    "csv": _CsvWriter,
+    "arrow": _ArrowWriter,
+    "parquet": _ParquetWriter,
+}
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from .config import (
+    HISTORY_CACHE_SIZE,
+    HISTORY_CACHE_TTL_SECONDS,
+    HISTORY_MIN_RECENT_MESSAGES,
+    HISTORY_TOKEN_BUDGET,
+)
+from .db import get_pool
+from .routing_cache import LruTtlCache, on_invalidation
+
+logger = logging.getLogger("backend.history_store")
+
+# (previous summary, messages to fold in) -> new summary
+Summarizer = Callable[[str | None, list[dict[str, str]]], Awaitable[str]]
+
+
+@dataclass
+class _Transcript:
+    summary: str | None
+    # created_at of the newest message folded into the summary
+    summary_until: datetime | None
+    # Messages after summary_until, oldest first: sender, content, created_at
+    messages: list[dict] = field(default_factory=list)
+
+    @property
+    def cursor(self) -> datetime | None:
+        return self.messages[-1]["created_at"] if self.messages else self.summary_until
+
+
+@dataclass
+class HistoryWindow:
+    summary: str | None
+    messages: list[dict[str, str]]
+
+
+_transcripts = LruTtlCache(HISTORY_CACHE_SIZE, HISTORY_CACHE_TTL_SECONDS)
+_summarizer: Summarizer | None = None
+_compacting: dict[str, asyncio.Task] = {}
+
+# Incremental loads only fetch messages newer than the cursor, so a writer
+# that inserts a message dated earlier (a late-confirmed bounty) publishes a
+# "transcript" invalidation and the next load starts cold.
+on_invalidation("transcript", _transcripts.pop)
+
+_stats = {
+    "cold_loads": 0,
+    "incremental_loads": 0,
+    "messages_loaded": 0,
+    "compactions": 0,
+    "compaction_errors": 0,
+}
+
+
+def start_history_store(summarizer: Summarizer) -> None:
+    global _summarizer
+    _summarizer = summarizer
+
+
+async def stop_history_store() -> None:
+    global _summarizer
+    tasks = list(_compacting.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _compacting.clear()
+    _transcripts.clear()
+    _summarizer = None
+
+
+def history_store_stats() -> dict:
+    return {**_stats, "cached_transcripts": len(_transcripts), "compacting": len(_compacting)}
+
+
+async def load_history(conn, conv_id) -> HistoryWindow:
+    """
+    Returns the conversation's rolling summary plus as many recent messages as
+    fit in HISTORY_TOKEN_BUDGET. Cached transcripts only fetch messages newer
+    than the last one seen, so per-turn cost stays flat as a conversation grows.
+    """
+    key = str(conv_id)
+    hit, transcript = _transcripts.get(key)
+    if not hit:
+        _stats["cold_loads"] += 1
+        row = await conn.fetchrow(
+            "SELECT history_summary, history_summary_until FROM conversations WHERE id = $1",
+            conv_id,
+        )
+        transcript = _Transcript(
+            summary=row["history_summary"] if row else None,
+            summary_until=row["history_summary_until"] if row else None,
+        )
+    else:
+        _stats["incremental_loads"] += 1
+
+    cursor = transcript.cursor
+    rows = await conn.fetch(
+        """
+        SELECT sender, content, created_at FROM messages
+        WHERE conversation_id = $1 AND ($2::timestamptz IS NULL OR created_at > $2)
+        ORDER BY created_at
+        """,
+        conv_id,
+        cursor,
+    )
+    transcript.messages.extend(dict(r) for r in rows)
+    _stats["messages_loaded"] += len(rows)
+    _transcripts.put(key, transcript)
+
+    recent, omitted = _fit_budget(transcript)
+    if omitted:
+        _schedule_compaction(key, conv_id)
+
+    summary = transcript.summary
+    if omitted:
+        note = f"({omitted} earlier messages not shown.)"
+        summary = f"{summary}\n{note}" if summary else note
+    return HistoryWindow(
+        summary=summary,
+        messages=[{"sender": m["sender"], "content": m["content"]} for m in recent],
+    )
+
+
+def _tokens(text: str | None) -> int:
+    # Rough estimate (~4 characters per token); only used for budgeting.
+    return len(text or "") // 4 + 4
+
+
+def _fit_budget(transcript: _Transcript, budget: int | None = None) -> tuple[list[dict], int]:
+    """Newest messages that fit the budget (always at least HISTORY_MIN_RECENT_MESSAGES)."""
+    remaining = (budget or HISTORY_TOKEN_BUDGET) - _tokens(transcript.summary)
+    kept = 0
+    for msg in reversed(transcript.messages):
+        cost = _tokens(msg["content"])
+        if kept >= HISTORY_MIN_RECENT_MESSAGES and cost > remaining:
+            break
+        remaining -= cost
+        kept += 1
+    messages = transcript.messages
+    return messages[len(messages) - kept:], len(messages) - kept
+
+
+def _schedule_compaction(key: str, conv_id) -> None:
+    if _summarizer is None or key in _compacting:
+        return
+    task = asyncio.create_task(_compact(key, conv_id))
+    _compacting[key] = task
+    task.add_done_callback(lambda _t: _compacting.pop(key, None))
+
+
+async def _compact(key: str, conv_id) -> None:
+    """
+    Folds older messages into the rolling summary. Compacts down to half the
+    budget so a long interview summarizes every few turns, not every turn.
+    """
+    assert _summarizer is not None
+    hit, transcript = _transcripts.get(key)
+    if not hit:
+        return
+    _recent, overflow = _fit_budget(transcript, HISTORY_TOKEN_BUDGET // 2)
+    if not overflow:
+        return
+    folded = transcript.messages[:overflow]
+    try:
+        summary = await _summarizer(
+            transcript.summary,
+            [{"sender": m["sender"], "content": m["content"]} for m in folded],
+        )
+        until = folded[-1]["created_at"]
+        await get_pool().execute(
+            """
+            UPDATE conversations
+            SET history_summary = $2, history_summary_until = $3
+            WHERE id = $1
+            """,
+            conv_id,
+            summary,
+            until,
+        )
+    except Exception:
+        _stats["compaction_errors"] += 1
+        logger.exception("History compaction failed for conversation %s", conv_id)
+        return
+
+    # Messages may have been appended while the summarizer ran; keep them.
+    transcript.summary = summary
+    transcript.summary_until = until
+    transcript.messages = [m for m in transcript.messages if m["created_at"] > until]
+    _stats["compactions"] += 1
@@ -0,0 +1,196 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from .config import INBOUND_DEBOUNCE_SECONDS, INBOUND_MAX_BATCH, INBOUND_MAX_WAIT_SECONDS
+
+logger = logging.getLogger("backend.inbound_actors")
+
+# An actor with an empty mailbox exits after this long; the next message for
+# that participant starts a fresh one.
+ACTOR_IDLE_SECONDS = 60
+HASH_RING_REPLICAS = 64
+# On shutdown, how long pending batches get to reach the handler before
+# their actors are cancelled
+DRAIN_TIMEOUT_SECONDS = 10
+
+# Queued behind a mailbox's last message on shutdown: wakes an idle actor and
+# tells it to stop once everything before it is handled.
+_FLUSH = object()
+
+
+@dataclass
+class InboundMessage:
+    body: str
+    twilio_sid: str
+    received_at: float = field(default_factory=time.monotonic)
+    # Set on markers from the pending-turn worker: re-run the unanswered turn
+    # of this conversation instead of storing a new message.
+    resume_conversation_id: Any = None
+
+
+# Handlers receive every message coalesced into one turn, oldest first.
+Handler = Callable[[str, list[InboundMessage]], Awaitable[None]]
+
+# phone -> mailbox. Each mailbox is drained by exactly one task, so messages
+# from one participant are handled strictly in order while different
+# participants run in parallel.
+_mailboxes: dict[str, asyncio.Queue] = {}
+_actors: dict[str, asyncio.Task] = {}
+_handler: Handler | None = None
+# Set while stopping: new messages are refused and batches skip the debounce
+_draining = False
+
+_stats = {
+    "received": 0,
+    "processed": 0,
+    "batches": 0,
+    "coalesced": 0,
+    "errors": 0,
+    "actors_started": 0,
+}
+
+
+class HashRing:
+    """Consistent hash ring mapping a routing key (phone number) to a node."""
+
+    def __init__(self, nodes: list[str], replicas: int = HASH_RING_REPLICAS):
+        self._ring: list[tuple[int, str]] = sorted(
+            (_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas)
+        )
+        self._keys = [h for h, _ in self._ring]
+
+    def node_for(self, key: str) -> str | None:
+        if not self._ring:
+            return None
+        idx = bisect.bisect(self._keys, _hash(key)) % len(self._ring)
+        return self._ring[idx][1]
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+def start_inbound_actors(handler: Handler) -> None:
+    global _handler, _draining
+    _handler = handler
+    _draining = False
+    logger.info("Inbound actors started")
+
+
+async def stop_inbound_actors() -> None:
+    """
+    Messages in mailboxes were already acknowledged to Twilio, so they are
+    flushed through the handler (without waiting out the debounce) before
+    the actors stop. Actors still busy after DRAIN_TIMEOUT_SECONDS are
+    cancelled.
+    """
+    global _handler, _draining
+    _draining = True
+    for mailbox in _mailboxes.values():
+        mailbox.put_nowait(_FLUSH)
+    tasks = list(_actors.values())
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=DRAIN_TIMEOUT_SECONDS)
+        if pending:
+            logger.warning("Inbound actors shutdown with %s participants unflushed", len(pending))
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    _actors.clear()
+    _mailboxes.clear()
+    _handler = None
+    logger.info("Inbound actors stopped")
+
+
+def submit_inbound(phone: str, message: InboundMessage) -> None:
+    """Delivers a message to the participant's mailbox, starting its actor if idle."""
+    if _handler is None:
+        raise RuntimeError("Inbound actors not started. Call start_inbound_actors() first.")
+    if _draining:
+        raise RuntimeError("Inbound actors are shutting down")
+    _stats["received"] += 1
+    mailbox = _mailboxes.get(phone)
+    if mailbox is None:
+        mailbox = _mailboxes[phone] = asyncio.Queue()
+        _actors[phone] = asyncio.create_task(_actor_loop(phone, mailbox))
+        _stats["actors_started"] += 1
+    mailbox.put_nowait(message)
+
+
+def inbound_actor_stats() -> dict:
+    return {
+        **_stats,
+        "active_actors": len(_actors),
+        "queued_messages": sum(q.qsize() for q in _mailboxes.values()),
+        "draining": _draining,
+    }
+
+
+async def _actor_loop(phone: str, mailbox: asyncio.Queue) -> None:
+    assert _handler is not None
+    try:
+        while True:
+            try:
+                message = await asyncio.wait_for(mailbox.get(), ACTOR_IDLE_SECONDS)
+            except asyncio.TimeoutError:
+                # No await between this check and the removal, so a message
+                # can't slip into a mailbox that is being retired.
+                if mailbox.empty():
+                    return
+                continue
+            if message is _FLUSH:
+                return
+            batch = await _collect_batch(mailbox, message)
+            try:
+                await _handler(phone, batch)
+                _stats["processed"] += len(batch)
+                _stats["batches"] += 1
+                _stats["coalesced"] += len(batch) - 1
+            except Exception:
+                _stats["errors"] += 1
+                logger.exception("Inbound processing failed for %s", phone)
+            if _draining and mailbox.empty():
+                return
+    finally:
+        if _mailboxes.get(phone) is mailbox:
+            del _mailboxes[phone]
+            del _actors[phone]
+
+
+async def _collect_batch(mailbox: asyncio.Queue, first: InboundMessage) -> list[InboundMessage]:
+    """
+    Waits until the participant has been quiet for INBOUND_DEBOUNCE_SECONDS
+    (measured from the last message's arrival, so time spent queued counts),
+    capped by INBOUND_MAX_WAIT_SECONDS from the first message and
+    INBOUND_MAX_BATCH messages.
+    """
+    batch = [first]
+    if INBOUND_DEBOUNCE_SECONDS <= 0:
+        return batch
+    deadline = first.received_at + INBOUND_MAX_WAIT_SECONDS
+    while len(batch) < INBOUND_MAX_BATCH:
+        if not mailbox.empty():
+            message = mailbox.get_nowait()
+            if message is _FLUSH:
+                break
+            batch.append(message)
+            continue
+        if _draining:
+            break
+        now = time.monotonic()
+        timeout = min(batch[-1].received_at + INBOUND_DEBOUNCE_SECONDS, deadline) - now
+        if timeout <= 0:
+            break
+        try:
+            message = await asyncio.wait_for(mailbox.get(), timeout)
+        except asyncio.TimeoutError:
+            break
+        if message is _FLUSH:
+            break
+        batch.append(message)
+    return batch
@@ -0,0 +1,362 @@
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, TypeVar
+
+import httpx
+
+from .config import (
+    LLM_BREAKER_COOLDOWN_SECONDS,
+    LLM_BREAKER_THRESHOLD,
+    LLM_GENERAL_QUEUE_LIMIT,
+    LLM_MAX_ATTEMPTS,
+    LLM_MIN_CONCURRENCY,
+)
+
+logger = logging.getLogger("backend.llm_scheduler")
+
+T = TypeVar("T")
+
+# Lower number = served first. Paid interviews come before everything else;
+# general chat is the first thing shed under load. Analytics reports are
+# background jobs that wait behind all live traffic.
+PRIORITIES = {
+    "campaign": 0,
+    "bounty": 1,
+    "onboarding": 2,
+    "summary": 3,
+    "general": 4,
+    "report": 5,
+}
+# How long a request may wait for a slot before it is shed.
+MAX_WAIT_SECONDS = {
+    "campaign": 120.0,
+    "bounty": 60.0,
+    "onboarding": 60.0,
+    "summary": 300.0,
+    "general": 15.0,
+    "report": 600.0,
+}
+# Modes that are rejected up front when their estimated wait exceeds the
+# deadline, instead of queueing and timing out.
+SHEDDABLE = {"general", "summary"}
+# Background generations with long, variable outputs. Their latency says
+# nothing about how fast live turns are served, so it stays out of the
+# service-time estimate and the AIMD signal.
+UNTIMED_MODES = {"summary", "report"}
+SERVICE_TIME_ALPHA = 0.2
+
+# Adaptive limit (AIMD). The limit grows by ~1 slot per `limit` successful
+# calls while latency stays within LATENCY_TOLERANCE of the observed floor,
+# and shrinks multiplicatively on latency inflation or throttling (at most
+# once per average call time, so one burst of in-flight failures counts once).
+LATENCY_TOLERANCE = 2.0
+LATENCY_DECREASE = 0.9
+RATE_LIMIT_DECREASE = 0.5
+# The latency floor creeps up towards recent samples so a one-off fast call
+# doesn't pin it forever.
+FLOOR_DRIFT = 0.01
+
+BASE_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 20.0
+
+_TRANSIENT_STATUS = {500, 502, 503, 504}
+
+
+class LlmShed(Exception):
+    """The scheduler declined the request (queue full or deadline missed)."""
+
+
+class LlmUnavailable(LlmShed):
+    """The circuit breaker is open after repeated provider failures."""
+
+
+def classify_llm_error(exc: BaseException) -> str | None:
+    """'rate_limited', 'transient', or None for errors a retry won't fix."""
+    # pydantic-ai ModelHTTPError has status_code; google-genai APIError has code
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    if status == 429:
+        return "rate_limited"
+    if status in _TRANSIENT_STATUS:
+        return "transient"
+    if isinstance(exc, (TimeoutError, ConnectionError, httpx.TransportError)):
+        return "transient"
+    return None
+
+
+@dataclass
+class _Waiter:
+    mode: str
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class LlmScheduler:
+    """
+    Hands out LLM slots by priority class, and within a class round-robin
+    across campaigns so one large campaign can't starve the others. The
+    number of slots adapts between `min_limit` and `max_limit` from observed
+    latency and provider throttling.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = LLM_MIN_CONCURRENCY):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(self.max_limit)
+        self._active = 0
+        # priority -> campaign key -> waiters, oldest first
+        self._queues: dict[int, OrderedDict[str, deque[_Waiter]]] = {
+            p: OrderedDict() for p in sorted(set(PRIORITIES.values()))
+        }
+        self._queued = {mode: 0 for mode in PRIORITIES}
+        self._service_seconds = 5.0  # EWMA of call latency
+        self._latency_floor: float | None = None
+        self._last_decrease = 0.0
+        # Circuit breaker: closed -> open after LLM_BREAKER_THRESHOLD
+        # consecutive provider failures -> half_open (one probe) after the
+        # cooldown -> closed on success.
+        self._breaker = "closed"
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self._probe_inflight = False
+        self.stats = {
+            "admitted": {mode: 0 for mode in PRIORITIES},
+            "shed": {mode: 0 for mode in PRIORITIES},
+            "wait_ms": {mode: 0.0 for mode in PRIORITIES},  # last wait per mode
+            "retries": 0,
+            "rate_limited": 0,
+            "transient_errors": 0,
+            "breaker_opens": 0,
+            "breaker_rejections": 0,
+        }
+
+    @property
+    def capacity(self) -> int:
+        return int(self.limit)
+
+    async def run(self, mode: str, campaign_id, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs `call` in a slot, retrying throttling and transient errors with
+        jittered backoff. The slot is released while backing off.
+        """
+        mode = mode if mode in PRIORITIES else "general"
+        campaign_key = str(campaign_id) if campaign_id else "-"
+        attempt = 0
+        while True:
+            attempt += 1
+            probe = self._check_breaker()
+            try:
+                await self._acquire(mode, campaign_key)
+            except BaseException:
+                if probe:
+                    self._probe_inflight = False
+                raise
+            started = time.monotonic()
+            try:
+                result = await call()
+            except Exception as e:
+                kind = classify_llm_error(e)
+                self._release()
+                self._record_failure(kind, probe)
+                if kind is None or attempt >= LLM_MAX_ATTEMPTS:
+                    raise
+            except BaseException:
+                self._release()
+                if probe:
+                    self._probe_inflight = False
+                raise
+            else:
+                self._release()
+                self._record_success(mode, time.monotonic() - started, probe)
+                return result
+
+            self.stats["retries"] += 1
+            backoff = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            backoff = backoff * random.uniform(0.5, 1.0)
+            logger.info("LLM %s call failed (%s), retrying in %.1fs", mode, kind, backoff)
+            await asyncio.sleep(backoff)
+
+    def snapshot(self) -> dict:
+        by_campaign: dict[str, int] = {}
+        for queues in self._queues.values():
+            for key, waiters in queues.items():
+                if key != "-":
+                    by_campaign[key] = by_campaign.get(key, 0) + len(waiters)
+        return {
+            "limit": round(self.limit, 2),
+            "max_limit": self.max_limit,
+            "active": self._active,
+            "queued": dict(self._queued),
+            "queued_by_campaign": by_campaign,
+            "service_seconds": round(self._service_seconds, 3),
+            "latency_floor_seconds": round(self._latency_floor or 0.0, 3),
+            "breaker": self._breaker,
+            **self.stats,
+        }
+
+    # -- circuit breaker / adaptive limit ------------------------------------
+
+    def _check_breaker(self) -> bool:
+        """Raises LlmUnavailable while open. Returns True if this call is the half-open probe."""
+        if self._breaker == "closed":
+            return False
+        if self._breaker == "open" and time.monotonic() >= self._open_until:
+            self._breaker = "half_open"
+        if self._breaker == "half_open" and not self._probe_inflight:
+            self._probe_inflight = True
+            return True
+        self.stats["breaker_rejections"] += 1
+        raise LlmUnavailable("LLM circuit breaker is open")
+
+    def _record_success(self, mode: str, latency: float, probe: bool) -> None:
+        if probe or self._breaker != "closed":
+            logger.info("LLM circuit breaker closed")
+        self._breaker = "closed"
+        self._probe_inflight = False
+        self._consecutive_failures = 0
+        if mode in UNTIMED_MODES:
+            return
+
+        if self._latency_floor is None:
+            self._service_seconds = self._latency_floor = latency
+        self._service_seconds += SERVICE_TIME_ALPHA * (latency - self._service_seconds)
+        if latency < self._latency_floor:
+            self._latency_floor = latency
+        else:
+            self._latency_floor += FLOOR_DRIFT * (latency - self._latency_floor)
+
+        if self._service_seconds > self._latency_floor * LATENCY_TOLERANCE:
+            self._decrease(LATENCY_DECREASE)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._dispatch()
+
+    def _record_failure(self, kind: str | None, probe: bool) -> None:
+        if probe:
+            self._probe_inflight = False
+        if kind is None:
+            # Bad output / prompt errors say nothing about provider health.
+            if probe:
+                self._breaker = "closed"
+            return
+        self.stats["rate_limited" if kind == "rate_limited" else "transient_errors"] += 1
+        if kind == "rate_limited":
+            self._decrease(RATE_LIMIT_DECREASE)
+
+        self._consecutive_failures += 1
+        if probe or self._consecutive_failures >= LLM_BREAKER_THRESHOLD:
+            if self._breaker != "open":
+                self.stats["breaker_opens"] += 1
+                logger.warning(
+                    "LLM circuit breaker open for %ss after %d consecutive failures",
+                    LLM_BREAKER_COOLDOWN_SECONDS, self._consecutive_failures,
+                )
+            self._breaker = "open"
+            self._open_until = time.monotonic() + LLM_BREAKER_COOLDOWN_SECONDS
+
+    def _decrease(self, factor: float) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self._service_seconds:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * factor)
+
+    # -- slot queue ------------------------------------------------------------
+
+    async def _acquire(self, mode: str, campaign_key: str) -> None:
+        if self._active < self.capacity and not any(self._queued.values()):
+            self._active += 1
+            self._admit(mode, 0.0)
+            return
+
+        deadline = MAX_WAIT_SECONDS[mode]
+        if mode in SHEDDABLE:
+            ahead = sum(
+                count for m, count in self._queued.items() if PRIORITIES[m] <= PRIORITIES[mode]
+            )
+            estimated_wait = (ahead + 1) * self._service_seconds / self.capacity
+            if estimated_wait > deadline or (mode == "general" and self._queued[mode] >= LLM_GENERAL_QUEUE_LIMIT):
+                self._shed(mode)
+
+        waiter = _Waiter(mode=mode, future=asyncio.get_running_loop().create_future())
+        self._queues[PRIORITIES[mode]].setdefault(campaign_key, deque()).append(waiter)
+        self._queued[mode] += 1
+
+        try:
+            done, _ = await asyncio.wait({waiter.future}, timeout=deadline)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if not done:
+            self._abandon(waiter)
+            self._shed(mode)
+        self._admit(mode, time.monotonic() - waiter.enqueued_at)
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        if waiter.future.done():
+            # Granted a slot we will never use.
+            self._release()
+            return
+        waiter.future.cancel()
+        self._queued[waiter.mode] -= 1
+
+    def _admit(self, mode: str, waited: float) -> None:
+        self.stats["admitted"][mode] += 1
+        self.stats["wait_ms"][mode] = round(waited * 1000, 1)
+
+    def _shed(self, mode: str):
+        self.stats["shed"][mode] += 1
+        raise LlmShed(f"LLM scheduler shed a {mode} request")
+
+    def _release(self) -> None:
+        self._active -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._active < self.capacity:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            self._active += 1
+            waiter.future.set_result(None)
+
+    def _next_waiter(self) -> _Waiter | None:
+        for queues in self._queues.values():
+            while queues:
+                key, waiters = next(iter(queues.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    queues.move_to_end(key)  # round-robin across campaigns
+                else:
+                    del queues[key]
+                if waiter.future.cancelled():
+                    continue
+                self._queued[waiter.mode] -= 1
+                return waiter
+        return None
+
+
+_scheduler: LlmScheduler | None = None
+
+
+def start_llm_scheduler(max_limit: int) -> None:
+    global _scheduler
+    _scheduler = LlmScheduler(max_limit)
+    logger.info("LLM scheduler started (limit=%s..%s)", _scheduler.min_limit, max_limit)
+
+
+async def run_llm(mode: str, campaign_id, call: Callable[[], Awaitable[T]]) -> T:
+    """
+    Runs an LLM call through the scheduler. Raises LlmShed (or LlmUnavailable)
+    when declined, or the call's own error once retries are exhausted.
+    """
+    if _scheduler is None:
+        raise RuntimeError("LLM scheduler not started. Call start_llm_scheduler() first.")
+    return await _scheduler.run(mode, campaign_id, call)
+
+
+def llm_scheduler_stats() -> dict:
+    return _scheduler.snapshot() if _scheduler else {}
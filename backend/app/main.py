@@ -1,34 +1,142 @@
-import asyncio
+import hashlib
 import json
 import logging
 import sys
 from contextlib import asynccontextmanager
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any
 from uuid import UUID
 
-from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 
 _BACKEND_DIR = Path(__file__).resolve().parent.parent
 if str(_BACKEND_DIR) not in sys.path:
     sys.path.insert(0, str(_BACKEND_DIR))
 
-from app.config import MAX_CONCURRENT_LLM_CALLS, OUTREACH_RATE_PER_MINUTE  # noqa: E402
-from app.conversation_agent import MeshContext, get_agent_response  # noqa: E402
+from app.config import (  # noqa: E402
+    INBOUND_NODES,
+    MACHINE_ID,
+    MAX_CONCURRENT_LLM_CALLS,
+    OUTREACH_RATE_PER_MINUTE,
+    RUN_OUTREACH_WORKER,
+)
+from app.conversation_agent import (  # noqa: E402
+    MeshContext,
+    get_agent_response,
+    prompt_cache_stats,
+    summarize_history,
+)
 from app.db import close_pool, create_pool, get_pool  # noqa: E402
+from app.analytics import analytics_stats, campaign_analytics  # noqa: E402
+from app.bounty_intent import bounty_intent_stats, classify_bounty_reply  # noqa: E402
+from app.campaign_events import (  # noqa: E402
+    campaign_event_stats,
+    publish_campaign_event,
+    start_campaign_events,
+    stream_campaign_events,
+    subscribe_campaign_events,
+    unsubscribe,
+)
+from app.campaign_stats import (  # noqa: E402
+    add_status_counts,
+    check_campaign_completion,
+    get_status_counts,
+    set_conversation_status,
+)
+from app.context_cache import close_context_cache, context_cache_stats  # noqa: E402
+from app.exports import (  # noqa: E402
+    MEDIA_TYPES,
+    decode_cursor,
+    export_stats,
+    encode_cursor,
+    next_extractions_cursor,
+    stream_extractions,
+)
+from app.history_store import (  # noqa: E402
+    HistoryWindow,
+    history_store_stats,
+    load_history,
+    start_history_store,
+    stop_history_store,
+)
+from app.inbound_actors import (  # noqa: E402
+    HashRing,
+    InboundMessage,
+    inbound_actor_stats,
+    start_inbound_actors,
+    stop_inbound_actors,
+    submit_inbound,
+)
+from app.llm_scheduler import LlmShed, llm_scheduler_stats, run_llm, start_llm_scheduler  # noqa: E402
 from app.models import CreateCampaignRequest  # noqa: E402
-from app.outreach_worker import start_outreach_worker, stop_outreach_worker  # noqa: E402
-from app.twilio_client import send_whatsapp  # noqa: E402
+from app.onboarding_extractor import (  # noqa: E402
+    extract_demographics,
+    onboarding_extractor_stats,
+    plan_onboarding_turn,
+    record_llm_turn,
+)
+from app.outbound_sender import outbound_stats, start_outbound_sender, stop_outbound_sender  # noqa: E402
+from app.outbox import (  # noqa: E402
+    enqueue_outbox,
+    notify_outbox,
+    outbox_stats,
+    start_outbox_worker,
+    stop_outbox_worker,
+)
+from app.pending_turns import (  # noqa: E402
+    defer_turn,
+    drop_turn,
+    pending_turn_stats,
+    resolve_turn,
+    start_pending_turn_worker,
+    stop_pending_turn_worker,
+)
+from app.outreach_worker import (  # noqa: E402
+    notify_outreach_due,
+    outreach_stats,
+    start_outreach_worker,
+    stop_outreach_worker,
+)
+from app.reports import (  # noqa: E402
+    ReportsDisabled,
+    get_report,
+    report_stats,
+    start_report_worker,
+    stop_report_worker,
+    submit_report,
+)
+from app.routing_cache import (  # noqa: E402
+    evict_participant,
+    get_active_conversation,
+    get_user,
+    put_conversation,
+    put_user,
+    routing_cache_stats,
+    start_routing_cache,
+    write_conversation,
+    write_user,
+)
 
 logger = logging.getLogger("backend")
 logging.basicConfig(level=logging.INFO)
 
-_llm_semaphore: asyncio.Semaphore | None = None
+_inbound_ring = HashRing(INBOUND_NODES)
 
 STOP_KEYWORDS = {"stop", "quit", "cancel", "end"}
+STOP_REPLY = "Understood — thanks for your time! Take care."
+BOUNTY_DECLINE_REPLY = "No worries, catch you next time! 👋"
+# Sent to idle users when general chat is shed under LLM load
+GENERAL_BUSY_REPLY = "Hey! 👋 We'll message you as soon as there's a new bounty that fits your profile."
+
+# Phone numbers per set-based launch statement
+LAUNCH_CHUNK_SIZE = 5000
+
+# Conversation list page sizes
+CONVERSATIONS_PAGE_SIZE = 100
+MAX_CONVERSATIONS_PAGE_SIZE = 1000
 
 # Demographics required for "onboarded" status
 _REQUIRED_DEMOGRAPHICS = ("city", "age_range", "gender")
@@ -36,12 +144,27 @@ _REQUIRED_DEMOGRAPHICS = ("city", "age_range", "gender")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global _llm_semaphore
-    _llm_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LLM_CALLS)
+    start_llm_scheduler(MAX_CONCURRENT_LLM_CALLS)
     await create_pool()
-    start_outreach_worker()
+    await start_routing_cache()
+    await start_campaign_events()
+    start_history_store(_summarize_history)
+    start_inbound_actors(_process_inbound)
+    start_pending_turn_worker(_owns_participant, _resume_inbound)
+    start_outbound_sender()
+    start_outbox_worker()
+    start_report_worker()
+    if RUN_OUTREACH_WORKER:
+        start_outreach_worker()
     yield
+    stop_report_worker()
+    stop_pending_turn_worker()
+    await stop_inbound_actors()
+    await stop_history_store()
+    await close_context_cache()
     stop_outreach_worker()
+    stop_outbox_worker()
+    await stop_outbound_sender()
     await close_pool()
 
 
@@ -56,6 +179,7 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 
@@ -76,8 +200,9 @@ async def create_campaign(req: CreateCampaignRequest) -> dict[str, Any]:
         """
         INSERT INTO campaigns (name, research_brief, extraction_schema,
                                system_prompt_override, phone_numbers,
-                               reward_text, reward_link, targeting, status)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, 'draft')
+                               reward_text, reward_link, targeting,
+                               outreach_weight, outreach_burst, status)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, 'draft')
         RETURNING id, created_at
         """,
         req.name,
@@ -88,6 +213,8 @@ async def create_campaign(req: CreateCampaignRequest) -> dict[str, Any]:
         req.reward_text,
         req.reward_link,
         json.dumps(req.targeting) if req.targeting else None,
+        req.outreach_weight,
+        req.outreach_burst,
     )
 
     return {
@@ -102,8 +229,10 @@ async def list_campaigns() -> list[dict[str, Any]]:
     pool = get_pool()
     rows = await pool.fetch(
         """
-        SELECT id, name, status, total_conversations, completed_conversations, created_at
-        FROM campaigns ORDER BY created_at DESC
+        SELECT c.id, c.name, c.status, c.total_conversations, c.completed_conversations, c.created_at,
+               (SELECT jsonb_object_agg(s.status, s.count) FROM campaign_status_counts s
+                WHERE s.campaign_id = c.id AND s.count <> 0) AS status_counts
+        FROM campaigns c ORDER BY c.created_at DESC
         """
     )
     return [
@@ -113,6 +242,7 @@ async def list_campaigns() -> list[dict[str, Any]]:
             "status": r["status"],
             "total_conversations": r["total_conversations"],
             "completed_conversations": r["completed_conversations"],
+            "status_counts": json.loads(r["status_counts"]) if r["status_counts"] else {},
             "created_at": r["created_at"].isoformat(),
         }
         for r in rows
@@ -141,21 +271,64 @@ async def get_campaign(campaign_id: UUID) -> dict[str, Any]:
         "reward_text": row["reward_text"],
         "reward_link": row["reward_link"],
         "targeting": targeting,
+        "outreach_weight": row["outreach_weight"],
+        "outreach_burst": row["outreach_burst"],
         "status": row["status"],
         "total_conversations": row["total_conversations"],
         "completed_conversations": row["completed_conversations"],
+        "status_counts": await get_status_counts(pool, campaign_id),
         "created_at": row["created_at"].isoformat(),
         "updated_at": row["updated_at"].isoformat(),
     }
 
 
+@app.get("/campaigns/{campaign_id}/events")
+async def campaign_events(campaign_id: UUID, request: Request) -> StreamingResponse:
+    """
+    Server-Sent Events: a 'snapshot' of the campaign's status and counters,
+    then 'campaign', 'counts', 'status' and 'extraction' events as they
+    commit, or 'resync' when the client should refetch.
+    """
+    pool = get_pool()
+    # Subscribe first: events committed while the snapshot is read are
+    # buffered for the stream instead of falling between the two.
+    subscriber = subscribe_campaign_events(campaign_id)
+    try:
+        row = await pool.fetchrow(
+            "SELECT status, total_conversations, completed_conversations FROM campaigns WHERE id = $1",
+            campaign_id,
+        )
+        if not row:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+        snapshot = {
+            "campaign_id": str(campaign_id),
+            "status": row["status"],
+            "total_conversations": row["total_conversations"],
+            "completed_conversations": row["completed_conversations"],
+            "status_counts": await get_status_counts(pool, campaign_id),
+        }
+    except BaseException:
+        unsubscribe(subscriber)
+        raise
+    return StreamingResponse(
+        stream_campaign_events(subscriber, snapshot, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/campaigns/{campaign_id}/launch")
-async def launch_campaign(campaign_id: UUID) -> dict[str, Any]:
+async def launch_campaign(
+    campaign_id: UUID,
+    resume_chunk_size: int | None = Query(default=None, ge=1),
+) -> dict[str, Any]:
     pool = get_pool()
     campaign = await pool.fetchrow("SELECT * FROM campaigns WHERE id = $1", campaign_id)
     if not campaign:
         raise HTTPException(status_code=404, detail="Campaign not found")
-    if campaign["status"] not in ("draft", "paused"):
+    # 'launching' means an earlier launch was interrupted; re-running it is safe
+    # because every insert below is idempotent.
+    if campaign["status"] not in ("draft", "paused", "launching"):
         raise HTTPException(status_code=400, detail=f"Cannot launch campaign with status '{campaign['status']}'")
 
     phone_numbers = campaign["phone_numbers"] or []
@@ -164,89 +337,50 @@ async def launch_campaign(campaign_id: UUID) -> dict[str, Any]:
     conversations_created = 0
     reactivated_outreach = 0
 
+    # Sends are paced by the outreach worker's shared token bucket, so new rows
+    # are queued as due immediately and pause/resume is a campaign status flip.
+    if campaign["status"] == "paused":
+        reactivated_outreach = await _reactivate_paused_outreach(
+            pool, campaign_id, now, rate, resume_chunk_size,
+        )
+
     async with pool.acquire() as conn:
         async with conn.transaction():
-            # Re-activate paused outreach in staggered order to avoid burst sends.
-            if campaign["status"] == "paused":
-                paused_rows = await conn.fetch(
-                    """
-                    SELECT oq.id
-                    FROM outreach_queue oq
-                    JOIN conversations c ON c.id = oq.conversation_id
-                    WHERE c.campaign_id = $1
-                      AND oq.status = 'paused'
-                    ORDER BY oq.scheduled_at, oq.id
-                    """,
-                    campaign_id,
-                )
-                for i, row in enumerate(paused_rows):
-                    delay_seconds = int((i * 60) / rate)
-                    await conn.execute(
-                        """
-                        UPDATE outreach_queue
-                        SET status = 'pending', scheduled_at = $2, error = NULL
-                        WHERE id = $1
-                        """,
-                        row["id"],
-                        now + timedelta(seconds=delay_seconds),
-                    )
-                reactivated_outreach = len(paused_rows)
-
-            for i, phone in enumerate(phone_numbers):
-                delay_seconds = int(((reactivated_outreach + i) * 60) / rate)
-                scheduled_at = now + timedelta(seconds=delay_seconds)
-
-                # Upsert user — preserve existing status, default 'new' for new users
-                user_row = await conn.fetchrow(
-                    """
-                    INSERT INTO users (phone_number, status)
-                    VALUES ($1, 'new')
-                    ON CONFLICT (phone_number) DO UPDATE SET phone_number = EXCLUDED.phone_number
-                    RETURNING id
-                    """,
-                    phone,
-                )
-
-                # Create conversation
-                conv_row = await conn.fetchrow(
-                    """
-                    INSERT INTO conversations (campaign_id, user_id, phone_number, status)
-                    VALUES ($1, $2, $3, 'pending')
-                    ON CONFLICT (campaign_id, phone_number)
-                        WHERE campaign_id IS NOT NULL
-                        DO NOTHING
-                    RETURNING id
-                    """,
-                    campaign_id,
-                    user_row["id"],
-                    phone,
-                )
-                if not conv_row:
-                    continue
-
-                # Schedule outreach
-                await conn.execute(
-                    """
-                    INSERT INTO outreach_queue (conversation_id, scheduled_at, status)
-                    VALUES ($1, $2, 'pending')
-                    """,
-                    conv_row["id"],
-                    scheduled_at,
-                )
-                conversations_created += 1
+            await conn.execute(
+                "UPDATE campaigns SET status = 'launching', updated_at = NOW() WHERE id = $1",
+                campaign_id,
+            )
+            await publish_campaign_event(conn, campaign_id, "campaign", status="launching")
+            # Rows left pending by a pause become claimable again
+            await notify_outreach_due(conn, campaign_id)
+
+    # Each chunk is one set-based statement in its own short transaction, so a
+    # large launch never holds a connection for long and progress is visible
+    # through total_conversations as it goes.
+    chunks = 0
+    for offset in range(0, len(phone_numbers), LAUNCH_CHUNK_SIZE):
+        chunk = phone_numbers[offset:offset + LAUNCH_CHUNK_SIZE]
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                created = await _launch_chunk(conn, campaign_id, chunk, now)
+        conversations_created += created
+        chunks += 1
+        logger.info(
+            "Launch %s: %s/%s numbers processed, %s conversations created",
+            campaign_id, offset + len(chunk), len(phone_numbers), conversations_created,
+        )
 
-            # Activate campaign
+    async with pool.acquire() as conn:
+        async with conn.transaction():
             await conn.execute(
-                """
-                UPDATE campaigns
-                SET status = 'active',
-                    total_conversations = total_conversations + $2,
-                    updated_at = NOW()
-                WHERE id = $1
-                """,
+                "UPDATE campaigns SET status = 'active', updated_at = NOW() WHERE id = $1",
                 campaign_id,
-                conversations_created,
             )
+            await publish_campaign_event(conn, campaign_id, "campaign", status="active")
+    # Conversations that went terminal while the campaign was 'launching' or
+    # 'paused' skipped the completion check, which only completes 'active'
+    # campaigns.
+    await check_campaign_completion(pool, campaign_id)
 
     total_scheduled = reactivated_outreach + conversations_created
     estimated_minutes = max(1, (total_scheduled // rate) + 1)
@@ -255,11 +389,102 @@ async def launch_campaign(campaign_id: UUID) -> dict[str, Any]:
         "ok": True,
         "conversations_created": conversations_created,
         "reactivated_outreach": reactivated_outreach,
+        "chunks": chunks,
         "estimated_completion_minutes": estimated_minutes,
         "outreach_rate_per_minute": rate,
     }
 
 
+async def _reactivate_paused_outreach(
+    pool, campaign_id, now: datetime, rate: int, chunk_size: int | None,
+) -> int:
+    """
+    Moves rows with status 'paused' back to 'pending'. Each statement orders the
+    rows once with row_number() and spaces their scheduled_at at the outreach
+    rate. With chunk_size=None everything is done in one statement. Otherwise
+    each chunk commits separately, so a very large backlog never locks all its
+    rows in one transaction.
+    """
+    total = 0
+    while True:
+        result = await pool.execute(
+            """
+            WITH ranked AS (
+                SELECT id, row_number() OVER (ORDER BY scheduled_at, id) AS rn
+                FROM outreach_queue
+                WHERE campaign_id = $1 AND status = 'paused'
+                ORDER BY scheduled_at, id
+                LIMIT $5
+            )
+            UPDATE outreach_queue oq
+            SET status = 'pending', error = NULL,
+                scheduled_at = $2 + make_interval(secs => ($3::int + ranked.rn - 1) * 60.0 / $4::float8)
+            FROM ranked
+            WHERE oq.id = ranked.id
+            """,
+            campaign_id,
+            now,
+            total,
+            float(rate),
+            chunk_size,
+        )
+        updated = int(result.split()[-1])
+        total += updated
+        if chunk_size is None or updated < chunk_size:
+            return total
+
+
+async def _launch_chunk(conn, campaign_id, phones: list[str], scheduled_at: datetime) -> int:
+    """
+    Upserts users, creates conversations and queues outreach for a chunk of
+    phone numbers in one statement. Returns the number of new conversations.
+    """
+    created = await conn.fetchval(
+        """
+        WITH input AS (
+            SELECT DISTINCT phone FROM unnest($2::text[]) AS t(phone)
+        ),
+        upserted AS (
+            -- Preserve existing status, default 'new' for new users
+            INSERT INTO users (phone_number, status)
+            SELECT phone, 'new' FROM input
+            ON CONFLICT (phone_number) DO UPDATE SET phone_number = EXCLUDED.phone_number
+            RETURNING id, phone_number
+        ),
+        created AS (
+            INSERT INTO conversations (campaign_id, user_id, phone_number, status)
+            SELECT $1, id, phone_number, 'pending' FROM upserted
+            ON CONFLICT (campaign_id, phone_number)
+                WHERE campaign_id IS NOT NULL
+                DO NOTHING
+            RETURNING id
+        ),
+        queued AS (
+            INSERT INTO outreach_queue (conversation_id, campaign_id, scheduled_at, status)
+            SELECT id, $1, $3, 'pending' FROM created
+            RETURNING 1
+        )
+        SELECT count(*) FROM queued
+        """,
+        campaign_id,
+        phones,
+        scheduled_at,
+    )
+    if created:
+        await conn.execute(
+            """
+            UPDATE campaigns
+            SET total_conversations = total_conversations + $2, updated_at = NOW()
+            WHERE id = $1
+            """,
+            campaign_id,
+            created,
+        )
+        await add_status_counts(conn, campaign_id, {"pending": created})
+        await notify_outreach_due(conn, campaign_id)
+    return created
+
+
 @app.post("/campaigns/{campaign_id}/pause")
 async def pause_campaign(campaign_id: UUID) -> dict[str, Any]:
     pool = get_pool()
@@ -269,49 +494,105 @@ async def pause_campaign(campaign_id: UUID) -> dict[str, Any]:
     if campaign["status"] != "active":
         raise HTTPException(status_code=400, detail="Can only pause active campaigns")
 
-    await pool.execute(
-        "UPDATE campaigns SET status = 'paused', updated_at = NOW() WHERE id = $1",
-        campaign_id,
-    )
-    await pool.execute(
-        """
-        UPDATE outreach_queue SET status = 'paused'
-        WHERE conversation_id IN (SELECT id FROM conversations WHERE campaign_id = $1)
-          AND status = 'pending'
-        """,
-        campaign_id,
-    )
+    # The outreach worker only claims rows from active campaigns, so pending
+    # rows simply wait until the campaign is relaunched.
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                "UPDATE campaigns SET status = 'paused', updated_at = NOW() WHERE id = $1",
+                campaign_id,
+            )
+            await publish_campaign_event(conn, campaign_id, "campaign", status="paused")
     return {"ok": True}
 
 
 @app.get("/campaigns/{campaign_id}/conversations")
-async def list_conversations(campaign_id: UUID) -> list[dict[str, Any]]:
+async def list_conversations(
+    campaign_id: UUID,
+    request: Request,
+    limit: int = Query(default=CONVERSATIONS_PAGE_SIZE, ge=1, le=MAX_CONVERSATIONS_PAGE_SIZE),
+    after: str | None = None,
+    fields: str | None = None,
+    status: str | None = None,
+) -> Response:
+    """
+    One page of conversations in (created_at, id) order. The X-Next-Cursor
+    header, passed back as `after`, fetches the next page. `fields` and
+    `status` take comma-separated lists. Responds 304 when If-None-Match
+    matches the page's ETag.
+    """
+    selected = _CONVERSATION_FIELDS if fields is None else [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = set(selected) - set(_CONVERSATION_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    # id and created_at are always read: they form the cursor
+    columns = list(dict.fromkeys(["id", "created_at", *selected]))
+    try:
+        keyset = decode_cursor(after) if after else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    statuses = [s.strip() for s in status.split(",") if s.strip()] if status else None
+
     pool = get_pool()
     rows = await pool.fetch(
-        """
-        SELECT id, phone_number, status, extracted_data, message_count,
-               created_at, updated_at, completed_at
+        f"""
+        SELECT {", ".join(columns)}
         FROM conversations
         WHERE campaign_id = $1
-        ORDER BY created_at
+          AND ($2::text[] IS NULL OR status = ANY($2))
+          AND ($3::timestamptz IS NULL OR (created_at, id) > ($3, $4::uuid))
+        ORDER BY created_at, id
+        LIMIT $5
         """,
         campaign_id,
+        statuses,
+        keyset[0] if keyset else None,
+        keyset[1] if keyset else None,
+        limit + 1,
     )
-    return [
-        {
-            "id": str(r["id"]),
-            "phone_number": r["phone_number"],
-            "status": r["status"],
-            "extracted_data": json.loads(r["extracted_data"])
-            if isinstance(r["extracted_data"], str)
-            else r["extracted_data"],
-            "message_count": r["message_count"],
-            "created_at": r["created_at"].isoformat(),
-            "updated_at": r["updated_at"].isoformat(),
-            "completed_at": r["completed_at"].isoformat() if r["completed_at"] else None,
-        }
+
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+    body = json.dumps([
+        {f: _conversation_field(f, r[f]) for f in ["id", *selected] if f in columns}
         for r in rows
-    ]
+    ]).encode()
+    etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+    headers["ETag"] = etag
+    if _etag_matches(etag, request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+_CONVERSATION_FIELDS = [
+    "id", "phone_number", "status", "extracted_data", "message_count",
+    "created_at", "updated_at", "completed_at",
+]
+
+
+def _etag_matches(etag: str, if_none_match: str | None) -> bool:
+    """If-None-Match uses the weak comparison: W/ prefixes are ignored, * matches anything."""
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+def _conversation_field(name: str, value: Any) -> Any:
+    if name == "id":
+        return str(value)
+    if name == "extracted_data" and isinstance(value, str):
+        return json.loads(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
 
 
 @app.get("/conversations/{conversation_id}")
@@ -389,13 +670,85 @@ async def get_extractions(campaign_id: UUID) -> dict[str, Any]:
     }
 
 
+@app.get("/campaigns/{campaign_id}/analytics")
+async def get_campaign_analytics(campaign_id: UUID) -> dict[str, Any]:
+    result = await campaign_analytics(campaign_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return result
+
+
+@app.post("/campaigns/{campaign_id}/reports", status_code=202)
+async def create_report(campaign_id: UUID, response: Response) -> dict[str, Any]:
+    """
+    Queues generation of the campaign's analytics report, or returns the
+    existing job when the analytics haven't changed (200 if it's finished).
+    Poll GET /reports/{job_id} for the result.
+    """
+    try:
+        job = await submit_report(campaign_id)
+    except ReportsDisabled as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    if job["status"] == "succeeded":
+        response.status_code = 200
+    return job
+
+
+@app.get("/reports/{job_id}")
+async def get_report_job(job_id: UUID) -> dict[str, Any]:
+    report = await get_report(job_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return report
+
+
+@app.get("/campaigns/{campaign_id}/extractions/export")
+async def export_extractions(
+    campaign_id: UUID,
+    format: str = Query(default="ndjson", pattern="^(ndjson|csv|arrow|parquet)$"),
+    after: str | None = None,
+    limit: int | None = Query(default=None, ge=1),
+) -> StreamingResponse:
+    """
+    Streams extracted data from completed conversations. Pass the
+    X-Next-Cursor header of a limited export as `after` to fetch the next page.
+    """
+    pool = get_pool()
+    campaign = await pool.fetchrow("SELECT extraction_schema FROM campaigns WHERE id = $1", campaign_id)
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    try:
+        keyset = decode_cursor(after) if after else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    schema = campaign["extraction_schema"]
+    if isinstance(schema, str):
+        schema = json.loads(schema)
+
+    extension = "arrows" if format == "arrow" else format
+    headers = {"Content-Disposition": f'attachment; filename="extractions-{campaign_id}.{extension}"'}
+    if limit is not None:
+        next_cursor = await next_extractions_cursor(campaign_id, keyset, limit)
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+
+    return StreamingResponse(
+        stream_extractions(campaign_id, schema or {}, format, keyset, limit),
+        media_type=MEDIA_TYPES[format],
+        headers=headers,
+    )
+
+
 # ---------------------------------------------------------------------------
 # Twilio inbound webhook
 # ---------------------------------------------------------------------------
 
 
 @app.post("/twilio/inbound")
-async def inbound(request: Request, background: BackgroundTasks) -> PlainTextResponse:
+async def inbound(request: Request) -> PlainTextResponse:
     form = await request.form()
     from_user = str(form.get("From") or "")
     body = str(form.get("Body") or "").strip()
@@ -405,7 +758,15 @@ async def inbound(request: Request, background: BackgroundTasks) -> PlainTextRes
     if not phone:
         return PlainTextResponse("", status_code=200)
 
-    background.add_task(_process_inbound, phone, body, twilio_sid)
+    # Each participant is owned by one machine (consistent hash on phone), so
+    # their messages are serialized in that machine's actor without DB locks.
+    # Fly's proxy replays the webhook to the owner; a replayed request is
+    # always handled locally to rule out replay loops.
+    if not _owns_participant(phone) and "fly-replay-src" not in request.headers:
+        owner = _inbound_ring.node_for(phone)
+        return PlainTextResponse("", status_code=200, headers={"fly-replay": f"instance={owner}"})
+
+    submit_inbound(phone, InboundMessage(body=body, twilio_sid=twilio_sid))
     return PlainTextResponse("", status_code=200)
 
 
@@ -414,28 +775,58 @@ async def inbound(request: Request, background: BackgroundTasks) -> PlainTextRes
 # ---------------------------------------------------------------------------
 
 
-async def _process_inbound(phone: str, body: str, twilio_sid: str) -> None:
+def _owns_participant(phone: str) -> bool:
+    owner = _inbound_ring.node_for(phone)
+    return owner is None or owner == MACHINE_ID
+
+
+async def _lock_conversation(conn, conv_id) -> bool:
+    """
+    Without INBOUND_NODES every machine handles every participant, so the
+    actors alone don't serialize a conversation once a second machine runs.
+    In that case the caller's transaction takes the per-conversation advisory
+    lock instead. Returns True if the lock was taken.
+    """
+    if INBOUND_NODES:
+        return False
+    await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1::text))", str(conv_id))
+    return True
+
+
+def _resume_inbound(phone: str, conv_id) -> None:
+    """Queues a retry of an unanswered turn behind the participant's pending messages."""
+    submit_inbound(phone, InboundMessage(body="", twilio_sid="", resume_conversation_id=conv_id))
+
+
+async def _process_inbound(phone: str, messages: list[InboundMessage]) -> None:
+    try:
+        await _route_inbound(phone, messages)
+    except Exception:
+        # The failed turn may have written through changes that never
+        # committed; reload this participant from the DB next time.
+        evict_participant(phone)
+        raise
+
+
+async def _route_inbound(phone: str, messages: list[InboundMessage]) -> None:
+    # Runs inside the participant's actor: messages from one phone number are
+    # processed one batch at a time, in arrival order. Messages that arrive
+    # within the debounce window are coalesced into one agent turn. Duplicate
+    # webhooks are rejected by the uq_messages_twilio_sid index in
+    # _insert_inbound_user_message. Routing state comes from the routing
+    # cache, so a warm participant needs no reads before the LLM call.
     pool = get_pool()
 
-    # Idempotency: advisory lock on twilio_sid hash serializes duplicate webhooks,
-    # then check + unique index (uq_messages_twilio_sid) enforces exactly-once.
-    if twilio_sid:
-        async with pool.acquire() as conn:
-            async with conn.transaction():
-                await conn.execute(
-                    "SELECT pg_advisory_xact_lock(hashtext($1))", twilio_sid
-                )
-                existing = await conn.fetchval(
-                    "SELECT id FROM messages WHERE twilio_sid = $1", twilio_sid
-                )
-                if existing:
-                    logger.info("Duplicate webhook for twilio_sid=%s, skipping", twilio_sid)
-                    return
+    # A retry marker batched with new messages is covered by the new turn,
+    # which answers the whole history.
+    resumes = [m.resume_conversation_id for m in messages if m.resume_conversation_id]
+    messages = [m for m in messages if not m.resume_conversation_id]
+    if not messages:
+        await _resume_turn(phone, resumes[-1])
+        return
 
     # Step 1: Lookup user by phone
-    user = await pool.fetchrow(
-        "SELECT * FROM users WHERE phone_number = $1", phone
-    )
+    user = await get_user(pool, phone)
 
     if not user:
         # New user — create + start onboarding
@@ -448,45 +839,69 @@ async def _process_inbound(phone: str, body: str, twilio_sid: str) -> None:
             """,
             phone,
         )
+        put_user(user)
         conv = await _get_or_create_active_onboarding_conversation(user["id"], phone)
-        await _handle_onboarding(conv, user, phone, body, twilio_sid)
+        await _handle_onboarding(conv, user, phone, messages)
         return
 
     # Step 2: Find active conversation
-    conv = await pool.fetchrow(
-        """
-        SELECT c.*, cam.research_brief, cam.extraction_schema,
-               cam.system_prompt_override, cam.reward_text, cam.reward_link
-        FROM conversations c
-        LEFT JOIN campaigns cam ON c.campaign_id = cam.id
-        WHERE c.user_id = $1
-          AND c.status IN ('active', 'bounty_sent')
-        ORDER BY c.created_at DESC
-        LIMIT 1
-        """,
-        user["id"],
-    )
+    conv = await get_active_conversation(pool, user["id"])
 
     if not conv:
         # If onboarding is incomplete and no active thread exists, resume onboarding.
         if user["status"] in ("new", "onboarding"):
             conv = await _get_or_create_active_onboarding_conversation(user["id"], phone)
-            await _handle_onboarding(conv, user, phone, body, twilio_sid)
+            await _handle_onboarding(conv, user, phone, messages)
         else:
             # User is idle — general mode
-            await _handle_general(user, phone, body, twilio_sid)
+            await _handle_general(user, phone, messages)
         return
 
     # Step 3: Route by conversation state
     if conv["status"] == "bounty_sent" and conv["campaign_id"] is not None:
-        await _handle_bounty_response(conv, user, phone, body, twilio_sid)
+        await _handle_bounty_response(conv, user, phone, messages)
     elif conv["status"] == "active" and conv["campaign_id"] is not None:
-        await _handle_campaign(conv, user, phone, body, twilio_sid)
+        await _handle_campaign(conv, user, phone, messages)
     elif conv["status"] == "active" and conv["campaign_id"] is None:
-        await _handle_onboarding(conv, user, phone, body, twilio_sid)
+        await _handle_onboarding(conv, user, phone, messages)
     else:
         logger.warning("Unexpected conv state: status=%s campaign_id=%s", conv["status"], conv["campaign_id"])
-        await _handle_general(user, phone, body, twilio_sid)
+        await _handle_general(user, phone, messages)
+
+
+async def _resume_turn(phone: str, conv_id) -> None:
+    """
+    Re-runs a turn whose agent reply failed earlier. Runs in the participant's
+    actor like any inbound batch; the turn is dropped if the conversation has
+    moved on or its last message already has a reply.
+    """
+    pool = get_pool()
+    user = await get_user(pool, phone)
+    conv = await get_active_conversation(pool, user["id"]) if user else None
+    if not conv or conv["id"] != conv_id:
+        await drop_turn(conv_id)
+        return
+
+    async with pool.acquire() as conn:
+        history = await load_history(conn, conv_id)
+    if not history.messages or history.messages[-1]["sender"] != "user":
+        await drop_turn(conv_id)
+        return
+
+    # The pending row counts the stored inbound messages; only the reply is new.
+    if conv["status"] == "bounty_sent" and conv["campaign_id"] is not None:
+        await _run_bounty_turn(conv, user, phone, history, turn_messages=1)
+    elif conv["status"] == "active" and conv["campaign_id"] is not None:
+        await _run_campaign_turn(conv, user, phone, history, turn_messages=1)
+    elif conv["status"] == "active":
+        unanswered = []
+        for m in reversed(history.messages):
+            if m["sender"] != "user":
+                break
+            unanswered.insert(0, m["content"])
+        await _run_onboarding_turn(conv, user, phone, history, " ".join(unanswered), turn_messages=1)
+    else:
+        await drop_turn(conv_id)
 
 
 # ---------------------------------------------------------------------------
@@ -494,83 +909,122 @@ async def _process_inbound(phone: str, body: str, twilio_sid: str) -> None:
 # ---------------------------------------------------------------------------
 
 
-async def _handle_onboarding(conv, user, phone: str, body: str, twilio_sid: str) -> None:
+async def _handle_onboarding(conv, user, phone: str, messages: list[InboundMessage]) -> None:
     pool = get_pool()
     conv_id = conv["id"]
+    stop_requested = False
 
     async with pool.acquire() as conn:
         async with conn.transaction():
-            await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1::text))", str(conv_id))
-
-            # Save inbound message (dedupe-safe on twilio_sid)
-            inserted = await _insert_inbound_user_message(conn, conv_id, body, twilio_sid)
+            await _lock_conversation(conn, conv_id)
+            # Save inbound messages (dedupe-safe on twilio_sid)
+            inserted = await _insert_inbound_user_messages(conn, conv_id, messages)
             if not inserted:
                 logger.info("Duplicate inbound message ignored for conversation=%s", conv_id)
                 return
+            turn_messages = inserted + 1  # inbound messages + the agent reply
 
             # Update user status to onboarding if new
             if user["status"] == "new":
                 await conn.execute(
                     "UPDATE users SET status = 'onboarding' WHERE id = $1", user["id"]
                 )
+                await write_user(conn, phone, status="onboarding")
 
             # Check stop keywords
-            if body.lower().strip() in STOP_KEYWORDS:
+            if _is_stop_request(messages):
                 await conn.execute(
                     "UPDATE conversations SET status = 'abandoned', updated_at = NOW(), completed_at = NOW() WHERE id = $1",
                     conv_id,
                 )
-                _safe_send(phone, "Understood — thanks for your time! Take care.")
-                return
+                await write_conversation(conn, user["id"], conv_id, status="abandoned")
+                await enqueue_outbox(
+                    conn, phone, STOP_REPLY,
+                    conversation_id=conv_id, idempotency_key=f"stop:{conv_id}",
+                )
+                stop_requested = True
+            else:
+                # Load conversation history
+                history = await load_history(conn, conv_id)
 
-            # Load conversation history
-            conversation_history = await _load_history(conn, conv_id)
+    if stop_requested:
+        notify_outbox()
+        return
 
-    # Build context + call LLM
-    deps = MeshContext(
-        mode="onboarding",
-        conversation_history=conversation_history,
-        user_demographics=_user_demographics(user),
-    )
+    text = " ".join(m.body for m in messages)
+    await _run_onboarding_turn(conv, user, phone, history, text, turn_messages)
 
-    agent_resp = await _call_llm(deps, conv_id)
-    if not agent_resp:
-        return
+
+async def _run_onboarding_turn(
+    conv, user, phone: str, history: HistoryWindow, text: str, turn_messages: int,
+) -> None:
+    """Answers an onboarding turn whose inbound messages are already stored."""
+    pool = get_pool()
+    conv_id = conv["id"]
+
+    # Plain answers (a city, an age bracket, a gender) are handled with
+    # templates; only free-form turns go to the LLM.
+    demographics = _user_demographics(user)
+    turn = plan_onboarding_turn(text, demographics, history.messages)
+    if turn is not None:
+        reply, demographics_update, complete = turn.reply, turn.demographics_update, turn.complete
+    else:
+        record_llm_turn()
+        # Only trust the rule-based guess when it explained the whole reply;
+        # otherwise ("Hi, I'm Alex, from Cairo...") the LLM decides.
+        local_update, leftover = extract_demographics(text, demographics)
+        if leftover:
+            local_update = {}
+
+        # Build context + call LLM
+        deps = MeshContext(
+            mode="onboarding",
+            conversation_history=history.messages,
+            history_summary=history.summary,
+            user_demographics={**demographics, **local_update},
+        )
+
+        agent_resp = await _call_llm(deps, conv_id)
+        if not agent_resp:
+            await defer_turn(conv_id, phone, turn_messages - 1)
+            return
+        reply = agent_resp.message
+        demographics_update = {**local_update, **agent_resp.user_demographics_update}
+        complete = agent_resp.conversation_complete
 
     # Persist response + update demographics
     async with pool.acquire() as conn:
         async with conn.transaction():
-            await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1::text))", str(conv_id))
-
-            await conn.execute(
-                "INSERT INTO messages (conversation_id, sender, content) VALUES ($1, 'agent', $2)",
-                conv_id, agent_resp.message,
-            )
+            await _lock_conversation(conn, conv_id)
+            await _insert_agent_message(conn, conv_id, phone, reply)
 
             # Update demographics
             became_onboarded = await _update_user_demographics(
-                conn, user["id"], agent_resp.user_demographics_update, user,
+                conn, user["id"], demographics_update, user,
             )
 
-            if agent_resp.conversation_complete:
+            if complete:
                 await conn.execute(
                     """
                     UPDATE conversations
-                    SET status = 'completed', message_count = message_count + 2,
+                    SET status = 'completed', message_count = message_count + $2,
                         updated_at = NOW(), completed_at = NOW()
                     WHERE id = $1
                     """,
                     conv_id,
+                    turn_messages,
                 )
+                await write_conversation(conn, user["id"], conv_id, status="completed")
                 # _update_user_demographics already sets onboarded if demographics are filled.
                 # Do NOT force onboarded here — trust actual demographics, not LLM signal.
             else:
                 await conn.execute(
-                    "UPDATE conversations SET message_count = message_count + 2, updated_at = NOW() WHERE id = $1",
+                    "UPDATE conversations SET message_count = message_count + $2, updated_at = NOW() WHERE id = $1",
                     conv_id,
+                    turn_messages,
                 )
 
-    _safe_send(phone, agent_resp.message)
+    notify_outbox()
 
 
 # ---------------------------------------------------------------------------
@@ -578,85 +1032,102 @@ async def _handle_onboarding(conv, user, phone: str, body: str, twilio_sid: str)
 # ---------------------------------------------------------------------------
 
 
-async def _handle_bounty_response(conv, user, phone: str, body: str, twilio_sid: str) -> None:
+async def _handle_bounty_response(conv, user, phone: str, messages: list[InboundMessage]) -> None:
     pool = get_pool()
     conv_id = conv["id"]
     stop_requested = False
+    intent = None
 
     async with pool.acquire() as conn:
         async with conn.transaction():
-            await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1::text))", str(conv_id))
-
-            inserted = await _insert_inbound_user_message(conn, conv_id, body, twilio_sid)
+            await _lock_conversation(conn, conv_id)
+            inserted = await _insert_inbound_user_messages(conn, conv_id, messages)
             if not inserted:
                 logger.info("Duplicate inbound message ignored for conversation=%s", conv_id)
                 return
+            turn_messages = inserted + 1  # inbound messages + the agent reply
 
             # Check stop keywords
-            if body.lower().strip() in STOP_KEYWORDS:
-                await conn.execute(
-                    "UPDATE conversations SET status = 'abandoned', updated_at = NOW(), completed_at = NOW() WHERE id = $1",
-                    conv_id,
+            if _is_stop_request(messages):
+                await set_conversation_status(conn, conv_id, "abandoned")
+                await write_conversation(conn, user["id"], conv_id, status="abandoned")
+                await enqueue_outbox(
+                    conn, phone, STOP_REPLY,
+                    conversation_id=conv_id, idempotency_key=f"stop:{conv_id}",
                 )
                 stop_requested = True
             else:
-                conversation_history = await _load_history(conn, conv_id)
-
-    if stop_requested:
-        _safe_send(phone, "Understood — thanks for your time! Take care.")
+                # Clear accepts/declines are settled locally; only ambiguous
+                # replies need the bounty-interpretation LLM call.
+                intent = classify_bounty_reply(" ".join(m.body for m in messages))
+                if intent is False:
+                    await _insert_agent_message(conn, conv_id, phone, BOUNTY_DECLINE_REPLY)
+                    await set_conversation_status(conn, conv_id, "declined", add_messages=turn_messages)
+                    await write_conversation(conn, user["id"], conv_id, status="declined")
+                else:
+                    if intent is True:
+                        # The campaign turn counts its own reply.
+                        await set_conversation_status(conn, conv_id, "active", add_messages=inserted)
+                        await write_conversation(conn, user["id"], conv_id, status="active")
+                    history = await load_history(conn, conv_id)
+
+    if stop_requested or intent is False:
+        notify_outbox()
         if conv["campaign_id"]:
-            await _check_campaign_completion(conv["campaign_id"])
+            await check_campaign_completion(pool, conv["campaign_id"])
         return
 
-    extraction_schema = conv["extraction_schema"]
-    if isinstance(extraction_schema, str):
-        extraction_schema = json.loads(extraction_schema)
+    if intent is True:
+        # Accepted: go straight to the campaign turn, whose prompt opens the
+        # research conversation.
+        await _run_campaign_turn({**conv, "status": "active"}, user, phone, history, turn_messages=1)
+        return
+
+    await _run_bounty_turn(conv, user, phone, history, turn_messages)
+
+
+async def _run_bounty_turn(conv, user, phone: str, history: HistoryWindow, turn_messages: int) -> None:
+    """Interprets an ambiguous bounty reply with the LLM; inbound messages are already stored."""
+    pool = get_pool()
+    conv_id = conv["id"]
 
     deps = MeshContext(
         mode="bounty",
-        conversation_history=conversation_history,
+        conversation_history=history.messages,
+        history_summary=history.summary,
         user_demographics=_user_demographics(user),
         research_brief=conv["research_brief"],
-        extraction_schema=extraction_schema,
+        extraction_schema=conv["extraction_schema"],
         reward_text=conv["reward_text"],
         reward_link=conv["reward_link"],
+        campaign_id=conv["campaign_id"],
+        campaign_version=conv["campaign_updated_at"],
     )
 
     agent_resp = await _call_llm(deps, conv_id)
     if not agent_resp:
+        await defer_turn(conv_id, phone, turn_messages - 1)
         return
 
     async with pool.acquire() as conn:
         async with conn.transaction():
-            await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1::text))", str(conv_id))
-
-            await conn.execute(
-                "INSERT INTO messages (conversation_id, sender, content) VALUES ($1, 'agent', $2)",
-                conv_id, agent_resp.message,
-            )
+            await _lock_conversation(conn, conv_id)
+            await _insert_agent_message(conn, conv_id, phone, agent_resp.message)
 
             if agent_resp.bounty_accepted is True:
                 # Accepted — transition to active campaign conversation
-                await conn.execute(
-                    "UPDATE conversations SET status = 'active', message_count = message_count + 2, updated_at = NOW() WHERE id = $1",
-                    conv_id,
-                )
+                await set_conversation_status(conn, conv_id, "active", add_messages=turn_messages)
+                await write_conversation(conn, user["id"], conv_id, status="active")
             elif agent_resp.bounty_accepted is False:
                 # Declined
-                await conn.execute(
-                    """
-                    UPDATE conversations
-                    SET status = 'declined', message_count = message_count + 2,
-                        updated_at = NOW(), completed_at = NOW()
-                    WHERE id = $1
-                    """,
-                    conv_id,
-                )
+                await set_conversation_status(conn, conv_id, "declined", add_messages=turn_messages)
+                await write_conversation(conn, user["id"], conv_id, status="declined")
             else:
                 # Ambiguous — keep bounty_sent, just update message count
                 await conn.execute(
-                    "UPDATE conversations SET message_count = message_count + 2, updated_at = NOW() WHERE id = $1",
+                    "UPDATE conversations SET message_count = message_count + $2, updated_at = NOW() WHERE id = $1",
                     conv_id,
+                    turn_messages,
                 )
 
             # Update demographics if any
@@ -664,11 +1135,11 @@ async def _handle_bounty_response(conv, user, phone: str, body: str, twilio_sid:
                 conn, user["id"], agent_resp.user_demographics_update, user,
             )
 
-    _safe_send(phone, agent_resp.message)
+    notify_outbox()
 
     # Check campaign completion on terminal states
     if agent_resp.bounty_accepted is False and conv["campaign_id"]:
-        await _check_campaign_completion(conv["campaign_id"])
+        await check_campaign_completion(pool, conv["campaign_id"])
 
 
 # ---------------------------------------------------------------------------
@@ -676,71 +1147,82 @@ async def _handle_bounty_response(conv, user, phone: str, body: str, twilio_sid:
 # ---------------------------------------------------------------------------
 
 
-async def _handle_campaign(conv, user, phone: str, body: str, twilio_sid: str) -> None:
+async def _handle_campaign(conv, user, phone: str, messages: list[InboundMessage]) -> None:
     pool = get_pool()
     conv_id = conv["id"]
     stop_requested = False
 
     async with pool.acquire() as conn:
         async with conn.transaction():
-            await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1::text))", str(conv_id))
-
-            inserted = await _insert_inbound_user_message(conn, conv_id, body, twilio_sid)
+            await _lock_conversation(conn, conv_id)
+            inserted = await _insert_inbound_user_messages(conn, conv_id, messages)
             if not inserted:
                 logger.info("Duplicate inbound message ignored for conversation=%s", conv_id)
                 return
+            turn_messages = inserted + 1  # inbound messages + the agent reply
 
             # Check stop keywords
-            if body.lower().strip() in STOP_KEYWORDS:
-                await conn.execute(
-                    "UPDATE conversations SET status = 'abandoned', updated_at = NOW(), completed_at = NOW() WHERE id = $1",
-                    conv_id,
+            if _is_stop_request(messages):
+                await set_conversation_status(conn, conv_id, "abandoned")
+                await write_conversation(conn, user["id"], conv_id, status="abandoned")
+                await enqueue_outbox(
+                    conn, phone, STOP_REPLY,
+                    conversation_id=conv_id, idempotency_key=f"stop:{conv_id}",
                 )
                 stop_requested = True
             else:
-                conversation_history = await _load_history(conn, conv_id)
+                history = await load_history(conn, conv_id)
 
     if stop_requested:
-        _safe_send(phone, "Understood — thanks for your time! Take care.")
+        notify_outbox()
         if conv["campaign_id"]:
-            await _check_campaign_completion(conv["campaign_id"])
+            await check_campaign_completion(pool, conv["campaign_id"])
         return
 
-    extracted_data = conv["extracted_data"]
-    if isinstance(extracted_data, str):
-        extracted_data = json.loads(extracted_data)
-    extracted_data = extracted_data or {}
+    await _run_campaign_turn(conv, user, phone, history, turn_messages)
 
-    extraction_schema = conv["extraction_schema"]
-    if isinstance(extraction_schema, str):
-        extraction_schema = json.loads(extraction_schema)
+
+async def _run_campaign_turn(conv, user, phone: str, history: HistoryWindow, turn_messages: int) -> None:
+    """Calls the campaign agent and persists its reply; inbound messages are already stored."""
+    pool = get_pool()
+    conv_id = conv["id"]
+
+    # JSON columns arrive parsed from the routing cache
+    extracted_data = conv["extracted_data"]
 
     deps = MeshContext(
         mode="campaign",
-        conversation_history=conversation_history,
+        conversation_history=history.messages,
+        history_summary=history.summary,
         user_demographics=_user_demographics(user),
         research_brief=conv["research_brief"],
-        extraction_schema=extraction_schema,
+        extraction_schema=conv["extraction_schema"],
         extracted_data=extracted_data,
         reward_text=conv["reward_text"],
         reward_link=conv["reward_link"],
         system_prompt_override=conv["system_prompt_override"],
+        campaign_id=conv["campaign_id"],
+        campaign_version=conv["campaign_updated_at"],
     )
 
     agent_resp = await _call_llm(deps, conv_id)
     if not agent_resp:
+        await defer_turn(conv_id, phone, turn_messages - 1)
         return
 
     merged_data = {**extracted_data, **agent_resp.extracted_data_update}
 
     async with pool.acquire() as conn:
         async with conn.transaction():
-            await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1::text))", str(conv_id))
-
-            await conn.execute(
-                "INSERT INTO messages (conversation_id, sender, content) VALUES ($1, 'agent', $2)",
-                conv_id, agent_resp.message,
-            )
+            if await _lock_conversation(conn, conv_id):
+                # Another machine may have merged extractions since this turn
+                # read the conversation.
+                current = await conn.fetchval(
+                    "SELECT extracted_data FROM conversations WHERE id = $1", conv_id,
+                )
+                current = json.loads(current) if isinstance(current, str) else current
+                merged_data = {**(current or {}), **agent_resp.extracted_data_update}
+            await _insert_agent_message(conn, conv_id, phone, agent_resp.message)
 
             # Update demographics if any
             await _update_user_demographics(
@@ -749,15 +1231,14 @@ async def _handle_campaign(conv, user, phone: str, body: str, twilio_sid: str) -
 
             if agent_resp.conversation_complete:
                 await conn.execute(
-                    """
-                    UPDATE conversations
-                    SET extracted_data = $2, message_count = message_count + 2,
-                        status = 'completed', completed_at = NOW(), updated_at = NOW()
-                    WHERE id = $1
-                    """,
+                    "UPDATE conversations SET extracted_data = $2 WHERE id = $1",
                     conv_id,
                     json.dumps(merged_data),
                 )
+                await set_conversation_status(conn, conv_id, "completed", add_messages=turn_messages)
+                await write_conversation(
+                    conn, user["id"], conv_id, status="completed", extracted_data=merged_data,
+                )
                 await conn.execute(
                     """
                     UPDATE campaigns
@@ -771,18 +1252,26 @@ async def _handle_campaign(conv, user, phone: str, body: str, twilio_sid: str) -
                 await conn.execute(
                     """
                     UPDATE conversations
-                    SET extracted_data = $2, message_count = message_count + 2,
+                    SET extracted_data = $2, message_count = message_count + $3,
                         updated_at = NOW()
                     WHERE id = $1
                     """,
                     conv_id,
                     json.dumps(merged_data),
+                    turn_messages,
                 )
+                await write_conversation(conn, user["id"], conv_id, extracted_data=merged_data)
 
-    _safe_send(phone, agent_resp.message)
+            if agent_resp.extracted_data_update:
+                await publish_campaign_event(
+                    conn, conv["campaign_id"], "extraction",
+                    conversation_id=str(conv_id), data=agent_resp.extracted_data_update,
+                )
+
+    notify_outbox()
 
     if agent_resp.conversation_complete:
-        await _check_campaign_completion(conv["campaign_id"])
+        await check_campaign_completion(pool, conv["campaign_id"])
 
 
 # ---------------------------------------------------------------------------
@@ -790,8 +1279,9 @@ async def _handle_campaign(conv, user, phone: str, body: str, twilio_sid: str) -
 # ---------------------------------------------------------------------------
 
 
-async def _handle_general(user, phone: str, body: str, twilio_sid: str) -> None:
+async def _handle_general(user, phone: str, messages: list[InboundMessage]) -> None:
     pool = get_pool()
+    stop_requested = False
 
     # Create ephemeral conversation for message storage
     conv = await pool.fetchrow(
@@ -807,7 +1297,7 @@ async def _handle_general(user, phone: str, body: str, twilio_sid: str) -> None:
 
     async with pool.acquire() as conn:
         async with conn.transaction():
-            inserted = await _insert_inbound_user_message(conn, conv_id, body, twilio_sid)
+            inserted = await _insert_inbound_user_messages(conn, conv_id, messages)
             if not inserted:
                 logger.info("Duplicate inbound message ignored for conversation=%s", conv_id)
                 await conn.execute(
@@ -819,46 +1309,54 @@ async def _handle_general(user, phone: str, body: str, twilio_sid: str) -> None:
                     conv_id,
                 )
                 return
+            turn_messages = inserted + 1  # inbound messages + the agent reply
 
             # Check stop keywords — in general mode, just acknowledge
-            if body.lower().strip() in STOP_KEYWORDS:
+            if _is_stop_request(messages):
                 await conn.execute(
                     "UPDATE conversations SET status = 'abandoned', updated_at = NOW(), completed_at = NOW() WHERE id = $1",
                     conv_id,
                 )
-                _safe_send(phone, "Understood — thanks for your time! Take care.")
-                return
+                await enqueue_outbox(
+                    conn, phone, STOP_REPLY,
+                    conversation_id=conv_id, idempotency_key=f"stop:{conv_id}",
+                )
+                stop_requested = True
+            else:
+                history = await load_history(conn, conv_id)
 
-            conversation_history = await _load_history(conn, conv_id)
+    if stop_requested:
+        notify_outbox()
+        return
 
     deps = MeshContext(
         mode="general",
-        conversation_history=conversation_history,
+        conversation_history=history.messages,
+        history_summary=history.summary,
         user_demographics=_user_demographics(user),
     )
 
     agent_resp = await _call_llm(deps, conv_id)
-    if not agent_resp:
-        return
+    # Idle chat is the first traffic shed under load; answer with a template
+    # rather than leaving the message unanswered.
+    reply = agent_resp.message if agent_resp else GENERAL_BUSY_REPLY
 
     async with pool.acquire() as conn:
         async with conn.transaction():
-            await conn.execute(
-                "INSERT INTO messages (conversation_id, sender, content) VALUES ($1, 'agent', $2)",
-                conv_id, agent_resp.message,
-            )
+            await _insert_agent_message(conn, conv_id, phone, reply)
             # Mark general conversation as completed after response
             await conn.execute(
                 """
                 UPDATE conversations
-                SET status = 'completed', message_count = message_count + 2,
+                SET status = 'completed', message_count = message_count + $2,
                     updated_at = NOW(), completed_at = NOW()
                 WHERE id = $1
                 """,
                 conv_id,
+                turn_messages,
             )
 
-    _safe_send(phone, agent_resp.message)
+    notify_outbox()
 
 
 # ---------------------------------------------------------------------------
@@ -866,12 +1364,48 @@ async def _handle_general(user, phone: str, body: str, twilio_sid: str) -> None:
 # ---------------------------------------------------------------------------
 
 
-async def _load_history(conn, conv_id) -> list[dict[str, str]]:
-    msg_rows = await conn.fetch(
-        "SELECT sender, content FROM messages WHERE conversation_id = $1 ORDER BY created_at",
+async def _insert_agent_message(conn, conv_id, phone: str, text: str) -> None:
+    """
+    Stores an agent reply and queues it in the outbox in the same transaction.
+    The reply answers any earlier turn that was left pending, so that turn's
+    messages are counted now. Stamped with clock_timestamp() like inbound
+    messages: NOW() is the transaction start, which would sort the reply
+    before messages it answers that were stored later in the same transaction.
+    """
+    message_id = await conn.fetchval(
+        """
+        INSERT INTO messages (conversation_id, sender, content, created_at)
+        VALUES ($1, 'agent', $2, clock_timestamp())
+        RETURNING id
+        """,
         conv_id,
+        text,
     )
-    return [{"sender": m["sender"], "content": m["content"]} for m in msg_rows]
+    await enqueue_outbox(conn, phone, text, conversation_id=conv_id, message_id=message_id)
+    unanswered = await resolve_turn(conn, conv_id)
+    if unanswered:
+        await conn.execute(
+            "UPDATE conversations SET message_count = message_count + $2 WHERE id = $1",
+            conv_id,
+            unanswered,
+        )
+
+
+async def _insert_inbound_user_messages(conn, conv_id, messages: list[InboundMessage]) -> int:
+    """
+    Inserts a batch of inbound messages in arrival order. Returns how many were
+    new. created_at uses clock_timestamp() so messages inserted in the same
+    transaction keep their order in the history.
+    """
+    inserted = 0
+    for message in messages:
+        if await _insert_inbound_user_message(conn, conv_id, message.body, message.twilio_sid):
+            inserted += 1
+    return inserted
+
+
+def _is_stop_request(messages: list[InboundMessage]) -> bool:
+    return any(m.body.lower().strip() in STOP_KEYWORDS for m in messages)
 
 
 async def _insert_inbound_user_message(conn, conv_id, body: str, twilio_sid: str) -> bool:
@@ -881,8 +1415,8 @@ async def _insert_inbound_user_message(conn, conv_id, body: str, twilio_sid: str
     """
     result = await conn.execute(
         """
-        INSERT INTO messages (conversation_id, sender, content, twilio_sid)
-        VALUES ($1, 'user', $2, $3)
+        INSERT INTO messages (conversation_id, sender, content, twilio_sid, created_at)
+        VALUES ($1, 'user', $2, $3, clock_timestamp())
         ON CONFLICT DO NOTHING
         """,
         conv_id,
@@ -913,10 +1447,7 @@ async def _get_or_create_active_onboarding_conversation(user_id, phone: str):
                 """,
                 user_id,
             )
-            if existing:
-                return existing
-
-            return await conn.fetchrow(
+            conv = existing or await conn.fetchrow(
                 """
                 INSERT INTO conversations (user_id, phone_number, status)
                 VALUES ($1, $2, 'active')
@@ -925,6 +1456,8 @@ async def _get_or_create_active_onboarding_conversation(user_id, phone: str):
                 user_id,
                 phone,
             )
+    put_conversation(conv)
+    return conv
 
 
 def _user_demographics(user) -> dict[str, Any]:
@@ -965,6 +1498,7 @@ async def _update_user_demographics(
         f"UPDATE users SET {', '.join(set_clauses)} WHERE id = $1",
         user_id, *values,
     )
+    await write_user(conn, current_user["phone_number"], **updates)
 
     # Check if user is now fully onboarded
     # Merge current demographics with updates
@@ -975,54 +1509,51 @@ async def _update_user_demographics(
         await conn.execute(
             "UPDATE users SET status = 'onboarded' WHERE id = $1", user_id
         )
+        await write_user(conn, current_user["phone_number"], status="onboarded")
         return True
 
     return False
 
 
 async def _call_llm(deps: MeshContext, conv_id) -> Any:
-    """Call LLM with semaphore. Returns AgentResponse or None on error."""
-    assert _llm_semaphore is not None
-    async with _llm_semaphore:
-        try:
-            return await get_agent_response(deps)
-        except Exception:
-            logger.exception("Agent failed for conversation=%s", conv_id)
-            return None
-
-
-async def _check_campaign_completion(campaign_id) -> None:
-    pool = get_pool()
-    row = await pool.fetchrow(
-        """
-        SELECT c.total_conversations,
-               COUNT(*) FILTER (
-                   WHERE conv.status IN ('completed', 'declined', 'abandoned', 'expired', 'failed')
-               ) AS terminal_count
-        FROM campaigns c
-        LEFT JOIN conversations conv ON conv.campaign_id = c.id
-        WHERE c.id = $1
-        GROUP BY c.id
-        """,
-        campaign_id,
-    )
-    if row and row["terminal_count"] >= row["total_conversations"] > 0:
-        await pool.execute(
-            "UPDATE campaigns SET status = 'completed', updated_at = NOW() WHERE id = $1",
-            campaign_id,
-        )
-        logger.info("Campaign %s completed (all conversations terminal)", campaign_id)
-
-
-def _safe_send(phone: str, text: str) -> None:
+    """Call LLM through the scheduler (with retries). Returns AgentResponse or None on error or shed."""
     try:
-        to = f"whatsapp:{phone}" if not phone.startswith("whatsapp:") else phone
-        sid = send_whatsapp(to, text)
-        logger.info("Sent WhatsApp message sid=%s to=%s", sid, phone)
+        return await run_llm(deps.mode, deps.campaign_id, lambda: get_agent_response(deps))
+    except LlmShed as e:
+        logger.warning("%s (conversation=%s)", e, conv_id)
+        return None
     except Exception:
-        logger.exception("Failed to send WhatsApp message to %s", phone)
+        logger.exception("Agent failed for conversation=%s", conv_id)
+        return None
+
+
+async def _summarize_history(previous_summary: str | None, messages: list[dict[str, str]]) -> str:
+    """History compaction runs below live turns in the LLM scheduler."""
+    return await run_llm("summary", None, lambda: summarize_history(previous_summary, messages))
 
 
 @app.get("/health")
 async def health() -> dict[str, str]:
     return {"status": "ok"}
+
+
+@app.get("/metrics")
+async def metrics() -> dict[str, Any]:
+    return {
+        "outbound": outbound_stats(),
+        "outbox": outbox_stats(),
+        "outreach": outreach_stats(),
+        "inbound": inbound_actor_stats(),
+        "routing_cache": routing_cache_stats(),
+        "prompt_cache": prompt_cache_stats(),
+        "history": history_store_stats(),
+        "context_cache": context_cache_stats(),
+        "bounty_intent": bounty_intent_stats(),
+        "onboarding": onboarding_extractor_stats(),
+        "llm_scheduler": llm_scheduler_stats(),
+        "pending_turns": pending_turn_stats(),
+        "exports": export_stats(),
+        "campaign_events": campaign_event_stats(),
+        "analytics": analytics_stats(),
+        "reports": report_stats(),
+    }
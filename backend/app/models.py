@@ -19,6 +19,8 @@ class CreateCampaignRequest(BaseModel):
     reward_text: str | None = None
     reward_link: str | None = None
     targeting: dict[str, Any] | None = None  # V2 — schema-ready, not used in launch yet
+    outreach_weight: int = Field(default=1, ge=1, description="Share of the outreach rate vs other campaigns")
+    outreach_burst: int | None = Field(default=None, ge=1, description="Max opening messages per worker batch")
 
 
 class AgentResponse(BaseModel):
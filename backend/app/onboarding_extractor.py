@@ -0,0 +1,297 @@
+import difflib
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any
+
+AGE_BRACKETS = ("18-24", "25-34", "35-44", "45+")
+FUZZY_CUTOFF = 0.85
+# Neighborhood answers with more meaningful words than this are treated as
+# free-form text.
+MAX_NEIGHBORHOOD_TOKENS = 4
+
+WELCOME = "Hey! 👋 I'm MeshAI — we pay people for quick research chats right here on WhatsApp."
+ACKS = ("Got it!", "Perfect 👌", "Nice!")
+QUESTIONS = {
+    "city": "Which city are you based in? 🏙️",
+    "neighborhood": "Which part of {city}?",
+    "age_range": "Which age bracket are you in: 18-24, 25-34, 35-44 or 45+?",
+    "gender": "And your gender: Male, Female or Other?",
+}
+DONE = "You're all set! 🎉 We'll send bounties your way whenever one matches your profile."
+
+_REQUIRED = ("city", "age_range", "gender")
+
+# Canonical city -> aliases (normalized: lowercase, no accents/diacritics,
+# Arabic letter variants folded). Focused on where the panel is recruited.
+_CITIES = {
+    "Abu Dhabi": ("abu dhabi", "abudhabi", "abu dabi", "ad", "ابو ظبي", "ابوظبي"),
+    "Dubai": ("dubai", "dxb", "دبي"),
+    "Sharjah": ("sharjah", "shj", "الشارقه", "شارقه"),
+    "Ajman": ("ajman", "عجمان"),
+    "Al Ain": ("al ain", "alain", "العين"),
+    "Ras Al Khaimah": ("ras al khaimah", "ras al khaima", "rak", "راس الخيمه"),
+    "Fujairah": ("fujairah", "fujeirah", "الفجيره"),
+    "Umm Al Quwain": ("umm al quwain", "uaq", "ام القيوين"),
+    "Riyadh": ("riyadh", "riyad", "الرياض"),
+    "Jeddah": ("jeddah", "jedda", "jiddah", "جده"),
+    "Dammam": ("dammam", "الدمام"),
+    "Mecca": ("mecca", "makkah", "مكه"),
+    "Medina": ("medina", "madinah", "المدينه"),
+    "Doha": ("doha", "الدوحه"),
+    "Kuwait City": ("kuwait", "kuwait city", "الكويت"),
+    "Manama": ("manama", "bahrain", "المنامه"),
+    "Muscat": ("muscat", "مسقط"),
+    "Beirut": ("beirut", "beyrouth", "بيروت"),
+    "Amman": ("amman",),
+    "Cairo": ("cairo", "le caire", "القاهره"),
+    "Alexandria": ("alexandria", "الاسكندريه"),
+    "Damascus": ("damascus", "damas", "دمشق"),
+    "Baghdad": ("baghdad", "بغداد"),
+    "Casablanca": ("casablanca", "الدار البيضاء"),
+    "Rabat": ("rabat", "الرباط"),
+    "Tunis": ("tunis", "تونس"),
+    "Algiers": ("algiers", "alger", "الجزائر"),
+    "Paris": ("paris", "باريس"),
+    "London": ("london", "لندن"),
+    "Karachi": ("karachi",),
+    "Lahore": ("lahore",),
+    "Mumbai": ("mumbai", "bombay"),
+    "Delhi": ("delhi", "new delhi"),
+    "Manila": ("manila",),
+}
+_CITY_ALIASES = {alias: city for city, aliases in _CITIES.items() for alias in aliases}
+# Short aliases ("ad", "rak") are too easy to hit by accident to fuzzy-match.
+_FUZZY_CITY_ALIASES = sorted(a for a in _CITY_ALIASES if len(a) >= 5 and a.isascii())
+# Nicknames that are also first names ("Hi, I'm Alex"): only a city when they
+# are the whole reply or follow a place preposition.
+_AMBIGUOUS_CITY_ALIASES = {"alex": "Alexandria", "casa": "Casablanca"}
+_PLACE_PREPOSITIONS = {"in", "from", "fi", "men", "de", "a", "من", "في"}
+
+_GENDERS = {
+    "Male": {"male", "man", "guy", "boy", "homme", "garcon", "masculin", "ذكر", "رجل", "شاب"},
+    "Female": {"female", "woman", "girl", "lady", "femme", "fille", "feminin", "feminine",
+               "انثى", "انثي", "امراه", "بنت"},
+    "Other": {"other", "nonbinary", "enby", "autre", "اخر", "غير"},
+}
+_GENDER_WORDS = {w: g for g, words in _GENDERS.items() for w in words}
+# Single letters only count when they are the whole reply.
+_GENDER_LETTERS = {"m": "Male", "f": "Female", "h": "Male"}
+
+# Words that carry no information in a slot-filling answer.
+_FILLER_WORDS = {
+    "i", "im", "am", "in", "from", "live", "living", "based", "the", "city", "of", "my",
+    "is", "a", "an", "and", "years", "year", "yrs", "old", "yo", "age", "aged", "its",
+    "je", "suis", "a", "de", "j", "ai", "ans", "habite", "et", "moi", "un", "une",
+    "ana", "men", "fi", "w", "3omri",
+    "انا", "من", "في", "ساكن", "ساكنه", "عمري", "سنه", "و", "عايش",
+    "ok", "okay", "yes", "yeah", "sure", "please", "thanks", "thank", "you", "merci", "shukran",
+    "شكرا", "hi", "hello", "hey", "salam", "marhaba", "bonjour", "salut", "hola", "yo",
+    "السلام", "عليكم", "مرحبا", "اهلا", "start", "join",
+    # Contraction remnants once apostrophes are split off ("i'm", "it's")
+    "it", "m", "s", "re", "ve", "ll", "d",
+}
+_SKIP_WORDS = {"skip", "no", "nope", "pass", "idk", "none", "non", "la", "لا", "rather", "not", "say", "prefer"}
+# Uncertainty and negation: never part of a neighborhood name.
+_UNSURE_WORDS = {
+    "dont", "don", "t", "know", "dunno", "unsure", "sure", "maybe", "whatever", "nowhere",
+    "anywhere", "sais", "pas", "mish", "msh", "3aref", "مش", "عارف", "معرفش", "بعرف", "ما",
+}
+
+_ARABIC_FOLD = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ى": "ي", "ة": "ه", "ـ": None})
+_ARABIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+_TOKEN_RE = re.compile(r"\d+\+?|[^\W\d_]+", re.UNICODE)
+_RANGE_RE = re.compile(r"(\d{2})\s*(?:-|–|to|a|à|ila|الى|إلى)\s*(\d{2})")
+_PLUS_RE = re.compile(r"(?:(\d{2})\s*(?:\+|plus|and above|or more|et plus))|(?:(?:over|above|plus de)\s*(\d{2}))")
+_REPEAT_RE = re.compile(r"(.)\1{2,}")
+
+_stats = {"local_turns": 0, "llm_turns": 0}
+
+
+@dataclass
+class OnboardingTurn:
+    reply: str
+    demographics_update: dict[str, Any] = field(default_factory=dict)
+    complete: bool = False
+
+
+def onboarding_extractor_stats() -> dict:
+    return dict(_stats)
+
+
+def extract_demographics(text: str, demographics: dict[str, Any]) -> tuple[dict[str, Any], list[str]]:
+    """
+    Pulls the still-missing city / age_range / gender out of a reply.
+    Returns (updates, leftover tokens that weren't explained by an answer or
+    filler). An empty leftover list means the reply was a plain answer.
+    """
+    normalized = _normalize(text)
+    updates: dict[str, Any] = {}
+
+    if not demographics.get("age_range"):
+        bracket, normalized = _extract_age(normalized)
+        if bracket:
+            updates["age_range"] = bracket
+
+    tokens = _TOKEN_RE.findall(normalized)
+
+    if not demographics.get("gender"):
+        if len(tokens) == 1 and tokens[0] in _GENDER_LETTERS:
+            updates["gender"] = _GENDER_LETTERS[tokens[0]]
+            tokens = []
+        for i, token in enumerate(tokens):
+            gender = _GENDER_WORDS.get(token)
+            if gender:
+                updates["gender"] = gender
+                tokens = tokens[:i] + tokens[i + 1:]
+                break
+
+    if not demographics.get("city"):
+        city, tokens = _extract_city(tokens)
+        if city:
+            updates["city"] = city
+
+    leftover = [t for t in tokens if t not in _FILLER_WORDS]
+    return updates, leftover
+
+
+def plan_onboarding_turn(
+    text: str, demographics: dict[str, Any], history: list[dict[str, str]],
+) -> OnboardingTurn | None:
+    """
+    Handles a slot-filling onboarding turn with templates. Returns None when
+    the reply contains anything beyond answers and filler (questions, chat),
+    which the LLM should handle.
+    """
+    if "?" in text or "؟" in text:
+        return None
+
+    agent_messages = [m["content"] for m in history if m["sender"] == "agent"]
+    last_agent = agent_messages[-1] if agent_messages else ""
+    city = demographics.get("city")
+    neighborhood_question = QUESTIONS["neighborhood"].format(city=city) if city else None
+    probed = neighborhood_question is not None and any(neighborhood_question in m for m in agent_messages)
+
+    updates, leftover = extract_demographics(text, demographics)
+    answering_probe = (
+        neighborhood_question is not None
+        and not demographics.get("neighborhood")
+        and last_agent.endswith(neighborhood_question)
+    )
+    if answering_probe and not updates:
+        # Answer to the neighborhood probe: accept a short place name, or a
+        # skip ("no", "not sure", "I don't know"). Anything mixing the two,
+        # or longer, goes to the LLM.
+        tokens = [t for t in _TOKEN_RE.findall(_normalize(text)) if t not in _FILLER_WORDS]
+        if len(tokens) > MAX_NEIGHBORHOOD_TOKENS:
+            return None
+        non_place = [t for t in tokens if t in _SKIP_WORDS or t in _UNSURE_WORDS]
+        if non_place and len(non_place) < len(tokens):
+            return None
+        if tokens and not non_place:
+            updates["neighborhood"] = _place_text(text)
+    elif leftover:
+        return None
+
+    merged = {**demographics, **updates}
+    missing = [k for k in _REQUIRED if not merged.get(k)]
+    if merged.get("city") and not merged.get("neighborhood") and not probed and not answering_probe:
+        # Probe once for the neighborhood, right after the city, like the
+        # LLM prompt does.
+        missing.insert(0, "neighborhood")
+
+    parts = []
+    if not agent_messages:
+        parts.append(WELCOME)
+    elif updates or answering_probe:
+        parts.append(ACKS[len(agent_messages) % len(ACKS)])
+    elif missing:
+        # Nothing new (e.g. a bare "ok"): the LLM can do better than
+        # repeating the same question.
+        return None
+
+    complete = not missing
+    if complete:
+        parts.append(DONE)
+    else:
+        key = missing[0]
+        parts.append(QUESTIONS[key].format(city=merged.get("city")))
+
+    _stats["local_turns"] += 1
+    return OnboardingTurn(reply=" ".join(parts), demographics_update=updates, complete=complete)
+
+
+def record_llm_turn() -> None:
+    _stats["llm_turns"] += 1
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower().translate(_ARABIC_DIGITS))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = text.translate(_ARABIC_FOLD).replace("'", " ").replace("’", " ")
+    return _REPEAT_RE.sub(r"\1", text)
+
+
+def _place_text(text: str) -> str:
+    """The reply without its filler words ("I live in Al Barsha" -> "Al Barsha"), as typed."""
+    words = [
+        word for word in text.split()
+        if any(t not in _FILLER_WORDS for t in _TOKEN_RE.findall(_normalize(word)))
+    ]
+    return " ".join(words).strip(" .,!")
+
+
+def _bracket_for_age(age: int) -> str | None:
+    if age < 18 or age > 99:
+        return None
+    if age >= 45:
+        return "45+"
+    for bracket in AGE_BRACKETS[:-1]:
+        low, high = (int(x) for x in bracket.split("-"))
+        if low <= age <= high:
+            return bracket
+    return None
+
+
+def _extract_age(normalized: str) -> tuple[str | None, str]:
+    """Finds an age bracket or plain age; returns it and the text without it."""
+    match = _RANGE_RE.search(normalized)
+    if match:
+        low, high = int(match.group(1)), int(match.group(2))
+        bracket = _bracket_for_age(low)
+        # Only accept ranges that sit inside one bracket ("30-40" straddles two).
+        if bracket and (bracket == "45+" or bracket == _bracket_for_age(high)):
+            return bracket, normalized[:match.start()] + " " + normalized[match.end():]
+        return None, normalized
+
+    match = _PLUS_RE.search(normalized)
+    if match:
+        age = int(match.group(1) or match.group(2))
+        if age >= 45:
+            return "45+", normalized[:match.start()] + " " + normalized[match.end():]
+        return None, normalized
+
+    numbers = re.findall(r"\b\d{1,3}\b", normalized)
+    if len(numbers) == 1:
+        bracket = _bracket_for_age(int(numbers[0]))
+        if bracket:
+            return bracket, re.sub(r"\b\d{1,3}\b", " ", normalized, count=1)
+    return None, normalized
+
+
+def _extract_city(tokens: list[str]) -> tuple[str | None, list[str]]:
+    # Longest n-gram first so "ras al khaimah" wins over "al".
+    for size in (3, 2, 1):
+        for i in range(len(tokens) - size + 1):
+            gram = " ".join(tokens[i:i + size])
+            city = _CITY_ALIASES.get(gram)
+            if city is None and len(gram) >= 5 and gram.isascii():
+                match = difflib.get_close_matches(gram, _FUZZY_CITY_ALIASES, n=1, cutoff=FUZZY_CUTOFF)
+                city = _CITY_ALIASES[match[0]] if match else None
+            if city:
+                return city, tokens[:i] + tokens[i + size:]
+    for i, token in enumerate(tokens):
+        city = _AMBIGUOUS_CITY_ALIASES.get(token)
+        if city and (len(tokens) == 1 or (i > 0 and tokens[i - 1] in _PLACE_PREPOSITIONS)):
+            return city, tokens[:i] + tokens[i + 1:]
+    return None, tokens
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from .config import OUTBOUND_QUEUE_SIZE, OUTBOUND_SENDER_WORKERS
+from .twilio_client import close_async_client, send_whatsapp_async
+
+logger = logging.getLogger("backend.outbound_sender")
+
+DRAIN_TIMEOUT_SECONDS = 10
+
+
+class SendSkipped(Exception):
+    """The message's before_send check declined it, so it was not sent."""
+
+
+@dataclass
+class _OutboundItem:
+    to: str
+    text: str
+    future: asyncio.Future
+    enqueued_at: float
+    before_send: Callable[[], Awaitable[bool]] | None = None
+
+
+# One bounded queue per sender worker. A destination always hashes to the same
+# shard, so messages to one participant go out in the order they were queued.
+_shards: list[asyncio.Queue] = []
+_tasks: list[asyncio.Task] = []
+
+_stats = {
+    "enqueued": 0,
+    "sent": 0,
+    "failed": 0,
+    "skipped": 0,
+    "backpressure_waits": 0,
+    "backpressure_wait_ms": 0.0,
+    "last_send_ms": 0.0,
+    "last_queue_ms": 0.0,
+}
+
+
+def start_outbound_sender() -> None:
+    global _shards, _tasks
+    workers = max(1, OUTBOUND_SENDER_WORKERS)
+    shard_size = max(1, OUTBOUND_QUEUE_SIZE // workers)
+    _shards = [asyncio.Queue(maxsize=shard_size) for _ in range(workers)]
+    _tasks = [asyncio.create_task(_sender_loop(q)) for q in _shards]
+    logger.info("Outbound sender started (workers=%s, queue_size=%s)", workers, shard_size * workers)
+
+
+async def stop_outbound_sender() -> None:
+    global _shards, _tasks
+    # Give queued messages a chance to go out before shutdown.
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(*(q.join() for q in _shards)), DRAIN_TIMEOUT_SECONDS,
+        )
+    except asyncio.TimeoutError:
+        logger.warning("Outbound sender shutdown with %s messages undelivered", _queue_depth())
+    for task in _tasks:
+        task.cancel()
+    _tasks = []
+    _shards = []
+    await close_async_client()
+    logger.info("Outbound sender stopped")
+
+
+def _to_whatsapp(phone: str) -> str:
+    return f"whatsapp:{phone}" if not phone.startswith("whatsapp:") else phone
+
+
+def _shard_for(to: str) -> asyncio.Queue:
+    if not _shards:
+        raise RuntimeError("Outbound sender not started. Call start_outbound_sender() first.")
+    return _shards[zlib.crc32(to.encode()) % len(_shards)]
+
+
+async def enqueue_whatsapp(
+    phone: str, text: str, *, before_send: Callable[[], Awaitable[bool]] | None = None,
+) -> asyncio.Future:
+    """
+    Queues a WhatsApp message and returns a future resolving to the Twilio SID.
+    Waits only when the destination's shard is full (backpressure).
+    `before_send` is awaited right before the Twilio call; if it returns
+    False the message is dropped and the future fails with SendSkipped.
+    """
+    to = _to_whatsapp(phone)
+    shard = _shard_for(to)
+    future = asyncio.get_running_loop().create_future()
+    future.add_done_callback(_consume_exception)
+    item = _OutboundItem(
+        to=to, text=text, future=future, enqueued_at=time.monotonic(), before_send=before_send,
+    )
+
+    if shard.full():
+        _stats["backpressure_waits"] += 1
+        started = time.monotonic()
+        await shard.put(item)
+        _stats["backpressure_wait_ms"] += (time.monotonic() - started) * 1000
+    else:
+        shard.put_nowait(item)
+
+    _stats["enqueued"] += 1
+    return future
+
+
+async def send_queued_whatsapp(phone: str, text: str) -> str:
+    """Sends through the sender pool and waits for the Twilio SID."""
+    return await (await enqueue_whatsapp(phone, text))
+
+
+def outbound_stats() -> dict:
+    return {
+        **_stats,
+        "queue_depth": _queue_depth(),
+        "queue_capacity": sum(q.maxsize for q in _shards),
+        "workers": len(_tasks),
+    }
+
+
+def _queue_depth() -> int:
+    return sum(q.qsize() for q in _shards)
+
+
+def _consume_exception(future: asyncio.Future) -> None:
+    # Fire-and-forget callers never await the future; failures are logged by
+    # the sender loop, so mark the exception as retrieved here.
+    if not future.cancelled():
+        future.exception()
+
+
+async def _sender_loop(queue: asyncio.Queue) -> None:
+    while True:
+        item: _OutboundItem = await queue.get()
+        started = time.monotonic()
+        _stats["last_queue_ms"] = (started - item.enqueued_at) * 1000
+        try:
+            if item.before_send is not None and not await item.before_send():
+                raise SendSkipped(f"Send to {item.to} skipped by before_send")
+            sid = await send_whatsapp_async(item.to, item.text)
+        except asyncio.CancelledError:
+            if not item.future.done():
+                item.future.cancel()
+            raise
+        except SendSkipped as e:
+            _stats["skipped"] += 1
+            logger.info("%s", e)
+            if not item.future.done():
+                item.future.set_exception(e)
+        except Exception as e:
+            _stats["failed"] += 1
+            logger.exception("Failed to send WhatsApp message to %s", item.to)
+            if not item.future.done():
+                item.future.set_exception(e)
+        else:
+            _stats["sent"] += 1
+            logger.info("Sent WhatsApp message sid=%s to=%s", sid, item.to)
+            if not item.future.done():
+                item.future.set_result(sid)
+        finally:
+            _stats["last_send_ms"] = (time.monotonic() - started) * 1000
+            queue.task_done()
@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import random
+from uuid import uuid4
+
+from .db import get_pool
+from .outbound_sender import SendSkipped, enqueue_whatsapp
+
+logger = logging.getLogger("backend.outbox")
+
+_task: asyncio.Task | None = None
+_stop_event: asyncio.Event | None = None
+_wake_event: asyncio.Event | None = None
+# Set whenever an in-flight send finishes, freeing a slot
+_slot_event: asyncio.Event | None = None
+_in_flight: set[asyncio.Task] = set()
+
+POLL_INTERVAL_SECONDS = 2
+# Rows claimed but not yet sent, per process
+MAX_IN_FLIGHT = 50
+MAX_ATTEMPTS = 6
+BASE_BACKOFF_SECONDS = 2
+MAX_BACKOFF_SECONDS = 300
+# A claimed row that is still 'sending' after this long is assumed orphaned
+# (process died mid-send) and becomes claimable again.
+SENDING_TIMEOUT_SECONDS = 120
+
+_stats = {
+    "claimed": 0,
+    "sent": 0,
+    "retried": 0,
+    "failed": 0,
+    "lease_lost": 0,
+}
+
+
+async def enqueue_outbox(
+    conn,
+    phone: str,
+    text: str,
+    *,
+    conversation_id=None,
+    message_id=None,
+    idempotency_key: str | None = None,
+) -> None:
+    """
+    Records an outbound message in the caller's transaction. Delivery happens
+    after commit; call notify_outbox() once the transaction is done.
+    """
+    if idempotency_key is None:
+        idempotency_key = f"msg:{message_id}" if message_id else f"adhoc:{uuid4()}"
+    await conn.execute(
+        """
+        INSERT INTO outbound_messages
+            (conversation_id, message_id, to_phone, body, idempotency_key)
+        VALUES ($1, $2, $3, $4, $5)
+        ON CONFLICT (idempotency_key) DO NOTHING
+        """,
+        conversation_id,
+        message_id,
+        phone,
+        text,
+        idempotency_key,
+    )
+
+
+def notify_outbox() -> None:
+    if _wake_event:
+        _wake_event.set()
+
+
+def start_outbox_worker() -> None:
+    global _task, _stop_event, _wake_event, _slot_event
+    _stop_event = asyncio.Event()
+    _wake_event = asyncio.Event()
+    _slot_event = asyncio.Event()
+    _task = asyncio.create_task(_worker_loop())
+    logger.info("Outbox worker started")
+
+
+def stop_outbox_worker() -> None:
+    global _task
+    if _stop_event:
+        _stop_event.set()
+    if _task:
+        _task.cancel()
+        _task = None
+    logger.info("Outbox worker stopped")
+
+
+def outbox_stats() -> dict:
+    return {**_stats, "in_flight": len(_in_flight)}
+
+
+async def _worker_loop() -> None:
+    assert _stop_event is not None and _wake_event is not None and _slot_event is not None
+    while not _stop_event.is_set():
+        try:
+            _wake_event.clear()
+            _slot_event.clear()
+            capacity = MAX_IN_FLIGHT - len(_in_flight)
+            claimed = await _claim_and_dispatch(capacity) if capacity > 0 else 0
+            # Caught up: wait for new rows. Otherwise more rows may be due, so
+            # claim again as soon as any in-flight send finishes.
+            event = _wake_event if claimed < capacity else _slot_event
+            try:
+                await asyncio.wait_for(event.wait(), POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+        except asyncio.CancelledError:
+            break
+        except Exception:
+            logger.exception("Outbox worker error")
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+
+async def _claim_and_dispatch(limit: int) -> int:
+    pool = get_pool()
+
+    # Claim due rows. Claiming pushes next_attempt_at forward so a crashed
+    # sender's rows are picked up again once SENDING_TIMEOUT_SECONDS passes.
+    rows = await pool.fetch(
+        """
+        UPDATE outbound_messages
+        SET status = 'sending',
+            attempts = attempts + 1,
+            next_attempt_at = NOW() + make_interval(secs => $2)
+        WHERE id IN (
+            SELECT id FROM outbound_messages
+            WHERE status IN ('pending', 'sending') AND next_attempt_at <= NOW()
+            ORDER BY next_attempt_at, created_at
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, message_id, to_phone, body, attempts, created_at
+        """,
+        limit,
+        SENDING_TIMEOUT_SECONDS,
+    )
+    if not rows:
+        return 0
+    _stats["claimed"] += len(rows)
+
+    # Queue in creation order so per-destination ordering is preserved by the
+    # sender pool; each row then completes on its own, so a slow destination
+    # only holds up its own sends.
+    for row in sorted(rows, key=lambda r: r["created_at"]):
+        future = await enqueue_whatsapp(
+            row["to_phone"], row["body"], before_send=lambda row=row: _renew_lease(pool, row),
+        )
+        task = asyncio.create_task(_finish_delivery(pool, row, future))
+        _in_flight.add(task)
+        task.add_done_callback(_on_delivery_done)
+    return len(rows)
+
+
+async def _renew_lease(pool, row) -> bool:
+    """
+    Runs right before the Twilio call. A row that waited in the sender queue
+    past its lease may have been re-claimed elsewhere (attempts moved on) or
+    finished; only send if this claim still holds it, and extend the lease.
+    """
+    renewed = await pool.fetchval(
+        """
+        UPDATE outbound_messages
+        SET next_attempt_at = NOW() + make_interval(secs => $3)
+        WHERE id = $1 AND status = 'sending' AND attempts = $2
+        RETURNING id
+        """,
+        row["id"],
+        row["attempts"],
+        SENDING_TIMEOUT_SECONDS,
+    )
+    if renewed is None:
+        _stats["lease_lost"] += 1
+        return False
+    return True
+
+
+async def _finish_delivery(pool, row, future: asyncio.Future) -> None:
+    try:
+        sid = await future
+    except SendSkipped:
+        return
+    except Exception as e:
+        await _record_failure(pool, row, e)
+        return
+
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                """
+                UPDATE outbound_messages
+                SET status = 'sent', twilio_sid = $2, sent_at = NOW(), last_error = NULL
+                WHERE id = $1
+                """,
+                row["id"],
+                sid,
+            )
+            if row["message_id"]:
+                await conn.execute(
+                    "UPDATE messages SET twilio_sid = $2 WHERE id = $1",
+                    row["message_id"],
+                    sid,
+                )
+    _stats["sent"] += 1
+
+
+def _on_delivery_done(task: asyncio.Task) -> None:
+    _in_flight.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Outbox delivery error", exc_info=task.exception())
+    if _slot_event:
+        _slot_event.set()
+
+
+async def _record_failure(pool, row, error: BaseException) -> None:
+    attempts = row["attempts"]
+    if attempts >= MAX_ATTEMPTS:
+        _stats["failed"] += 1
+        logger.error(
+            "Outbound message %s to %s failed permanently after %s attempts",
+            row["id"], row["to_phone"], attempts,
+        )
+        await pool.execute(
+            "UPDATE outbound_messages SET status = 'failed', last_error = $2 WHERE id = $1",
+            row["id"],
+            str(error),
+        )
+        return
+
+    _stats["retried"] += 1
+    backoff = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** (attempts - 1))
+    backoff = backoff * random.uniform(0.5, 1.0)
+    await pool.execute(
+        """
+        UPDATE outbound_messages
+        SET status = 'pending', last_error = $2,
+            next_attempt_at = NOW() + make_interval(secs => $3)
+        WHERE id = $1
+        """,
+        row["id"],
+        str(error),
+        backoff,
+    )
@@ -1,42 +1,123 @@
 import asyncio
 import logging
+import os
+import random
+import signal
+import socket
+import time
+from uuid import uuid4
 
-from .db import get_pool
-from .twilio_client import send_whatsapp
+from .campaign_stats import check_campaign_completion, set_conversation_status
+from .config import OUTREACH_BURST, OUTREACH_RATE_PER_MINUTE
+from .db import add_listener, close_pool, create_pool, get_pool
+from .outbound_sender import send_queued_whatsapp, start_outbound_sender, stop_outbound_sender
+from .rate_limiter import ensure_bucket, return_tokens, take_tokens
+from .routing_cache import publish_invalidation
+from .twilio_client import find_sent_whatsapp_async
 
 logger = logging.getLogger("backend.outreach_worker")
 
 _task: asyncio.Task | None = None
+_heartbeat_task: asyncio.Task | None = None
 _stop_event: asyncio.Event | None = None
+_wake_event: asyncio.Event | None = None
 
+# Identifies this worker's leases; unique per process so restarts never reuse one
+WORKER_ID = f"{os.environ.get('FLY_MACHINE_ID') or socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+# Queue ids this worker has claimed and not yet resolved
+_in_flight: set = set()
+
+NOTIFY_CHANNEL = "outreach_due"
 POLL_INTERVAL_SECONDS = 5
+# Safety-net poll while idle, in case a NOTIFY is missed
+MAX_IDLE_SECONDS = 60
+# Floor on idle sleeps: due rows can be unclaimable for a moment (locked by
+# another worker's claim), and retrying at once would spin on the bucket.
+MIN_IDLE_SECONDS = 1
 BATCH_SIZE = 10
+MIN_BATCH_SIZE = 1
+MAX_BATCH_SIZE = 50
+# Batch size tracks the measured send rate so one batch takes about this long
+TARGET_BATCH_SECONDS = 5
+REAP_INTERVAL_SECONDS = 60
+RATE_LIMITER_NAME = "outreach"
+# A claim is owned by its worker until the lease expires. Live workers renew
+# leases every LEASE_SECONDS / 3, so an expired lease means the worker died.
+LEASE_SECONDS = 90
+# A bounty held back because its participant is busy in another conversation
+# is retried after this long (jittered), instead of on the very next batch.
+BUSY_RETRY_SECONDS = 300
+
+
+_stats = {
+    "batch_size": BATCH_SIZE,
+    "send_rate_per_second": 0.0,
+    "wakeups": 0,
+}
 
 
 def start_outreach_worker() -> None:
-    global _task, _stop_event
+    global _task, _heartbeat_task, _stop_event, _wake_event
     _stop_event = asyncio.Event()
+    _wake_event = asyncio.Event()
     _task = asyncio.create_task(_worker_loop())
-    logger.info("Outreach worker started")
+    _heartbeat_task = asyncio.create_task(_heartbeat_loop())
+    logger.info("Outreach worker started (id=%s)", WORKER_ID)
 
 
 def stop_outreach_worker() -> None:
-    global _task
+    global _task, _heartbeat_task
     if _stop_event:
         _stop_event.set()
     if _task:
         _task.cancel()
         _task = None
+    if _heartbeat_task:
+        _heartbeat_task.cancel()
+        _heartbeat_task = None
+    # Unresolved claims keep their leases and are reaped by another worker.
     logger.info("Outreach worker stopped")
 
 
+async def notify_outreach_due(conn, campaign_id) -> None:
+    """Wakes idle outreach workers once the caller's transaction commits."""
+    await conn.execute("SELECT pg_notify($1, $2)", NOTIFY_CHANNEL, str(campaign_id))
+
+
+def outreach_stats() -> dict:
+    return dict(_stats)
+
+
 async def _worker_loop() -> None:
-    assert _stop_event is not None
+    assert _stop_event is not None and _wake_event is not None
+    last_reap = 0.0
+    ready = False
     while not _stop_event.is_set():
         try:
-            processed = await _process_batch()
-            if processed == 0:
-                await asyncio.sleep(POLL_INTERVAL_SECONDS)
+            if not ready:
+                await _setup()
+                ready = True
+            if time.monotonic() - last_reap >= REAP_INTERVAL_SECONDS:
+                last_reap = time.monotonic()
+                await _reap_expired_leases()
+
+            _wake_event.clear()
+            started = time.monotonic()
+            processed, token_wait = await _process_batch(_stats["batch_size"])
+            if processed:
+                _adapt_batch_size(processed, time.monotonic() - started)
+                continue
+
+            # Idle: sleep until the next token or the next scheduled row,
+            # whichever applies, unless a launch/resume NOTIFY arrives first.
+            delay = token_wait if token_wait > 0 else await _seconds_until_next_due()
+            delay = max(MIN_IDLE_SECONDS, min(delay, MAX_IDLE_SECONDS))
+            try:
+                await asyncio.wait_for(_wake_event.wait(), delay)
+                _stats["wakeups"] += 1
+            except asyncio.TimeoutError:
+                pass
         except asyncio.CancelledError:
             break
         except Exception:
@@ -44,61 +125,159 @@ async def _worker_loop() -> None:
             await asyncio.sleep(POLL_INTERVAL_SECONDS)
 
 
-async def _process_batch() -> int:
+async def _heartbeat_loop() -> None:
+    while True:
+        await asyncio.sleep(LEASE_SECONDS / 3)
+        if not _in_flight:
+            continue
+        try:
+            await get_pool().execute(
+                """
+                UPDATE outreach_queue
+                SET lease_expires_at = NOW() + make_interval(secs => $3)
+                WHERE id = ANY($1::uuid[]) AND claimed_by = $2 AND status = 'sending'
+                """,
+                list(_in_flight),
+                WORKER_ID,
+                LEASE_SECONDS,
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Outreach lease heartbeat failed")
+
+
+async def _setup() -> None:
+    pool = get_pool()
+    await ensure_bucket(
+        pool, RATE_LIMITER_NAME, max(1, OUTREACH_RATE_PER_MINUTE), max(1, OUTREACH_BURST),
+    )
+    # Rows queued before outreach_queue.campaign_id existed
+    await pool.execute(
+        """
+        UPDATE outreach_queue oq
+        SET campaign_id = c.campaign_id
+        FROM conversations c
+        WHERE oq.campaign_id IS NULL AND c.id = oq.conversation_id
+        """
+    )
+    await add_listener(NOTIFY_CHANNEL, _on_notify)
+
+
+def _on_notify(_payload: str) -> None:
+    if _wake_event:
+        _wake_event.set()
+
+
+def _adapt_batch_size(processed: int, elapsed: float) -> None:
+    rate = processed / max(elapsed, 0.001)
+    ewma = _stats["send_rate_per_second"]
+    ewma = rate if ewma == 0 else 0.7 * ewma + 0.3 * rate
+    _stats["send_rate_per_second"] = ewma
+    _stats["batch_size"] = max(
+        MIN_BATCH_SIZE, min(MAX_BATCH_SIZE, round(ewma * TARGET_BATCH_SECONDS)),
+    )
+
+
+async def _seconds_until_next_due() -> float:
+    pool = get_pool()
+    seconds = await pool.fetchval(
+        """
+        SELECT EXTRACT(EPOCH FROM MIN(oq.scheduled_at) - NOW())::float8
+        FROM outreach_queue oq
+        JOIN campaigns cam ON cam.id = oq.campaign_id
+        WHERE oq.status = 'pending' AND cam.status IN ('active', 'launching')
+        """
+    )
+    if seconds is None:
+        return MAX_IDLE_SECONDS
+    return max(0.0, seconds)
+
+
+async def _process_batch(batch_size: int) -> tuple[int, float]:
+    """Returns (items processed, seconds until the rate limiter has a token)."""
     pool = get_pool()
 
-    # Claim a batch of pending outreach items that are due
+    # The shared token bucket enforces OUTREACH_RATE_PER_MINUTE across all
+    # worker instances, so rows no longer need precomputed stagger times.
+    granted, token_wait = await take_tokens(pool, RATE_LIMITER_NAME, batch_size)
+    if granted == 0:
+        return 0, token_wait
+
+    # Claim due items from active campaigns. Each campaign contributes at most
+    # outreach_burst rows per batch, and rows are interleaved by
+    # rank / outreach_weight so heavier campaigns get a larger share.
+    # Rows stay in 'sending' until the Twilio SID is recorded.
     rows = await pool.fetch(
         """
+        WITH picked AS (
+            SELECT p.id
+            FROM campaigns cam
+            CROSS JOIN LATERAL (
+                SELECT oq.id, oq.scheduled_at,
+                       row_number() OVER (ORDER BY oq.scheduled_at, oq.id) AS rn
+                FROM outreach_queue oq
+                WHERE oq.campaign_id = cam.id
+                  AND oq.status = 'pending'
+                  AND oq.scheduled_at <= NOW()
+                ORDER BY oq.scheduled_at, oq.id
+                LIMIT LEAST($1, COALESCE(cam.outreach_burst, $1))
+            ) p
+            WHERE cam.status IN ('active', 'launching')
+            ORDER BY p.rn::float8 / GREATEST(cam.outreach_weight, 1), p.scheduled_at
+            LIMIT $1
+        )
         UPDATE outreach_queue
-        SET status = 'sent'
+        SET status = 'sending', claimed_at = NOW(), claimed_by = $2,
+            lease_expires_at = NOW() + make_interval(secs => $3)
         WHERE id IN (
-            SELECT id FROM outreach_queue
-            WHERE status = 'pending' AND scheduled_at <= NOW()
-            ORDER BY scheduled_at
-            LIMIT $1
-            FOR UPDATE SKIP LOCKED
+            SELECT oq.id FROM outreach_queue oq
+            JOIN picked ON picked.id = oq.id
+            WHERE oq.status = 'pending'
+            FOR UPDATE OF oq SKIP LOCKED
         )
         RETURNING id, conversation_id
         """,
-        BATCH_SIZE,
+        granted,
+        WORKER_ID,
+        LEASE_SECONDS,
     )
 
+    await return_tokens(pool, RATE_LIMITER_NAME, granted - len(rows))
     if not rows:
-        return 0
+        return 0, 0.0
 
-    tasks = [_send_bounty(row["id"], row["conversation_id"]) for row in rows]
-    await asyncio.gather(*tasks, return_exceptions=True)
-    return len(rows)
+    ids = [row["id"] for row in rows]
+    _in_flight.update(ids)
+    try:
+        tasks = [_send_bounty(row["id"], row["conversation_id"]) for row in rows]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        _in_flight.difference_update(ids)
+    # Only real sends count towards the measured send rate.
+    return sum(1 for r in results if r is True), 0.0
 
 
-async def _send_bounty(queue_id, conversation_id) -> None:
+async def _send_bounty(queue_id, conversation_id) -> bool:
+    """Returns True if the bounty went out to Twilio."""
     pool = get_pool()
+    sid = None
 
     try:
-        # Load conversation + campaign + user
-        conv = await pool.fetchrow(
-            """
-            SELECT c.*, cam.research_brief, cam.reward_text,
-                   u.status AS user_status
-            FROM conversations c
-            JOIN campaigns cam ON c.campaign_id = cam.id
-            JOIN users u ON c.user_id = u.id
-            WHERE c.id = $1
-            """,
-            conversation_id,
-        )
-        if not conv:
-            logger.warning("Conversation %s not found for outreach", conversation_id)
-            return
-
-        user_id = conv["user_id"]
-        phone = conv["phone_number"]
-
-        # Advisory lock per user — serializes bounty sends so two concurrent
-        # sends for the same user can't both pass the sacred side quest check.
+        # Phase 1 — claim: reserve the conversation under the per-user lock,
+        # then commit so no connection is held during the Twilio call.
         async with pool.acquire() as conn:
             async with conn.transaction():
+                conv = await _load_outreach_conversation(conn, conversation_id)
+                if not conv:
+                    logger.warning("Conversation %s not found for outreach", conversation_id)
+                    return False
+
+                user_id = conv["user_id"]
+
+                # Advisory lock per user — serializes bounty claims so two
+                # concurrent sends for the same user can't both pass the
+                # sacred side quest check.
                 await conn.execute(
                     "SELECT pg_advisory_xact_lock(hashtext('bounty:' || $1::text))",
                     str(user_id),
@@ -118,101 +297,232 @@ async def _send_bounty(queue_id, conversation_id) -> None:
                     conversation_id,
                 )
                 if conflicting:
-                    # Revert queue item to pending — will be retried next poll
+                    # Hold the item back for a while; retrying on the next
+                    # batch would re-claim it ahead of everyone else.
                     await conn.execute(
-                        "UPDATE outreach_queue SET status = 'pending' WHERE id = $1",
+                        """
+                        UPDATE outreach_queue
+                        SET status = 'pending', claimed_at = NULL, claimed_by = NULL, lease_expires_at = NULL,
+                            scheduled_at = NOW() + make_interval(secs => $2)
+                        WHERE id = $1
+                        """,
                         queue_id,
+                        BUSY_RETRY_SECONDS * random.uniform(0.5, 1.0),
                     )
                     logger.info(
                         "Sacred side quest: user %s busy, holding bounty for conv %s",
                         user_id, conversation_id,
                     )
-                    return
-
-                # Build templated bounty message (no LLM call)
-                brief_summary = conv["research_brief"] or "a quick research chat"
-                reward_text = conv["reward_text"] or "a reward"
-                user_status = conv["user_status"]
-
-                if user_status == "onboarded":
-                    message = (
-                        f"🎯 New bounty: {brief_summary}\n"
-                        f"~5 min · {reward_text}\n"
-                        "Reply 'go' to start!"
-                    )
                 else:
-                    message = (
-                        "Hey! This is MeshAI — we pay people for quick "
-                        "research chats on WhatsApp. 💰\n\n"
-                        f"🎯 Your first bounty: {brief_summary}\n"
-                        f"~5 min · {reward_text}\n"
-                        "Reply 'go' to start!"
+                    # Reserve: bounty_sent makes later claims for this user see a
+                    # conflict while the send is in flight. The exact body is
+                    # stored so the reaper can find this send at Twilio even if
+                    # the participant's details change meanwhile.
+                    message = _bounty_message(conv)
+                    await set_conversation_status(conn, conversation_id, "bounty_sent")
+                    await publish_invalidation(conn, "conversation", user_id)
+                    await conn.execute(
+                        "UPDATE outreach_queue SET message_body = $2 WHERE id = $1",
+                        queue_id,
+                        message,
                     )
 
-                # Send via Twilio
-                to = f"whatsapp:{phone}" if not phone.startswith("whatsapp:") else phone
-                sid = send_whatsapp(to, message)
-                logger.info("Bounty sent to %s, sid=%s", phone, sid)
+        if conflicting:
+            # Nothing was sent, so the rate-limit token goes back.
+            await return_tokens(pool, RATE_LIMITER_NAME, 1)
+            return False
 
-                # Persist agent message and update conversation to bounty_sent
-                await conn.execute(
-                    """
-                    INSERT INTO messages (conversation_id, sender, content, twilio_sid)
-                    VALUES ($1, 'agent', $2, $3)
-                    """,
-                    conversation_id,
-                    message,
-                    sid,
-                )
-                await conn.execute(
-                    """
-                    UPDATE conversations
-                    SET status = 'bounty_sent', message_count = 1, updated_at = NOW()
-                    WHERE id = $1
-                    """,
-                    conversation_id,
-                )
-                await conn.execute(
-                    "UPDATE outreach_queue SET sent_at = NOW() WHERE id = $1",
-                    queue_id,
-                )
+        # Phase 2 — send, outside any transaction
+        phone = conv["phone_number"]
+        sid = await send_queued_whatsapp(phone, message)
+        logger.info("Bounty sent to %s, sid=%s", phone, sid)
+
+        # Phase 3 — confirm: persist the agent message and mark the item sent
+        await _confirm_bounty(pool, queue_id, conversation_id, message, sid)
+        return True
 
     except Exception as e:
+        if sid is not None:
+            # Twilio accepted the message; leave the item in 'sending' so the
+            # reaper confirms it once the lease expires.
+            logger.exception("Failed to confirm outreach %s (sid=%s)", queue_id, sid)
+            return True
         logger.exception("Failed outreach for conversation %s", conversation_id)
         await pool.execute(
             "UPDATE outreach_queue SET status = 'failed', error = $2 WHERE id = $1",
             queue_id,
             str(e),
         )
-        await pool.execute(
-            "UPDATE conversations SET status = 'failed', updated_at = NOW() WHERE id = $1",
-            conversation_id,
-        )
-        campaign_id = await pool.fetchval(
-            "SELECT campaign_id FROM conversations WHERE id = $1",
-            conversation_id,
-        )
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                failed = await set_conversation_status(conn, conversation_id, "failed")
+                if failed:
+                    await publish_invalidation(conn, "conversation", failed["user_id"])
+        campaign_id = failed["campaign_id"] if failed else None
         if campaign_id:
-            await _check_campaign_completion(pool, campaign_id)
+            await check_campaign_completion(pool, campaign_id)
+        return False
 
 
-async def _check_campaign_completion(pool, campaign_id) -> None:
-    row = await pool.fetchrow(
+async def _load_outreach_conversation(conn, conversation_id):
+    return await conn.fetchrow(
         """
-        SELECT c.total_conversations,
-               COUNT(*) FILTER (
-                   WHERE conv.status IN ('completed', 'declined', 'abandoned', 'expired', 'failed')
-               ) AS terminal_count
-        FROM campaigns c
-        LEFT JOIN conversations conv ON conv.campaign_id = c.id
+        SELECT c.*, cam.research_brief, cam.reward_text,
+               u.status AS user_status
+        FROM conversations c
+        JOIN campaigns cam ON c.campaign_id = cam.id
+        JOIN users u ON c.user_id = u.id
         WHERE c.id = $1
-        GROUP BY c.id
         """,
-        campaign_id,
+        conversation_id,
     )
-    if row and row["terminal_count"] >= row["total_conversations"] > 0:
-        await pool.execute(
-            "UPDATE campaigns SET status = 'completed', updated_at = NOW() WHERE id = $1",
-            campaign_id,
+
+
+def _bounty_message(conv) -> str:
+    # Templated bounty message (no LLM call)
+    brief_summary = conv["research_brief"] or "a quick research chat"
+    reward_text = conv["reward_text"] or "a reward"
+
+    if conv["user_status"] == "onboarded":
+        return (
+            f"🎯 New bounty: {brief_summary}\n"
+            f"~5 min · {reward_text}\n"
+            "Reply 'go' to start!"
         )
-        logger.info("Campaign %s completed (all conversations terminal)", campaign_id)
+    return (
+        "Hey! This is MeshAI — we pay people for quick "
+        "research chats on WhatsApp. 💰\n\n"
+        f"🎯 Your first bounty: {brief_summary}\n"
+        f"~5 min · {reward_text}\n"
+        "Reply 'go' to start!"
+    )
+
+
+async def _confirm_bounty(pool, queue_id, conversation_id, message: str, sid: str) -> None:
+    """
+    Records a sent bounty. Confirmation can run late (the reaper confirms
+    after a lease expires), by which time the participant may already have
+    replied, so the message is dated to the claim (before the send, hence
+    before any reply), counts only if it was newly recorded, and the
+    conversation is left alone unless it is still bounty_sent.
+    """
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            inserted = await conn.fetchval(
+                """
+                INSERT INTO messages (conversation_id, sender, content, twilio_sid, created_at)
+                SELECT $1, 'agent', $2, $3, COALESCE(oq.claimed_at, NOW())
+                FROM outreach_queue oq
+                WHERE oq.id = $4
+                ON CONFLICT DO NOTHING
+                RETURNING id
+                """,
+                conversation_id,
+                message,
+                sid,
+                queue_id,
+            )
+            if inserted:
+                await conn.execute(
+                    "UPDATE conversations SET message_count = message_count + 1 WHERE id = $1",
+                    conversation_id,
+                )
+                # Dated before any reply that a cached transcript may already hold
+                await publish_invalidation(conn, "transcript", conversation_id)
+            await set_conversation_status(conn, conversation_id, "bounty_sent", only_from=("bounty_sent",))
+            await conn.execute(
+                "UPDATE outreach_queue SET status = 'sent', sent_at = NOW(), lease_expires_at = NULL WHERE id = $1",
+                queue_id,
+            )
+
+
+async def _reap_expired_leases() -> int:
+    """
+    Resolves outreach items whose worker died mid-send (lease expired while
+    'sending'). The reaper takes over the lease, then asks Twilio whether the
+    bounty actually went out: if so the send is confirmed with that SID,
+    otherwise the item is re-queued.
+    """
+    pool = get_pool()
+    rows = await pool.fetch(
+        """
+        UPDATE outreach_queue
+        SET claimed_by = $1, lease_expires_at = NOW() + make_interval(secs => $2)
+        WHERE id IN (
+            SELECT id FROM outreach_queue
+            WHERE status = 'sending' AND lease_expires_at < NOW()
+            ORDER BY lease_expires_at
+            LIMIT $3
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, conversation_id, claimed_at, message_body
+        """,
+        WORKER_ID,
+        LEASE_SECONDS,
+        BATCH_SIZE,
+    )
+
+    for row in rows:
+        queue_id, conversation_id = row["id"], row["conversation_id"]
+        try:
+            conv = await _load_outreach_conversation(pool, conversation_id)
+            if not conv:
+                continue
+            phone = conv["phone_number"]
+            to = f"whatsapp:{phone}" if not phone.startswith("whatsapp:") else phone
+            # Rows reserved before message_body existed fall back to the template.
+            message = row["message_body"] or _bounty_message(conv)
+            sid = await find_sent_whatsapp_async(to, message, row["claimed_at"])
+            if sid:
+                await _confirm_bounty(pool, queue_id, conversation_id, message, sid)
+                logger.info("Reaped outreach %s as sent (sid=%s)", queue_id, sid)
+                continue
+
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    await set_conversation_status(
+                        conn, conversation_id, "pending", only_from=("bounty_sent",),
+                    )
+                    await publish_invalidation(conn, "conversation", conv["user_id"])
+                    await conn.execute(
+                        """
+                        UPDATE outreach_queue
+                        SET status = 'pending', claimed_at = NULL, claimed_by = NULL, lease_expires_at = NULL,
+                            message_body = NULL
+                        WHERE id = $1 AND status = 'sending' AND claimed_by = $2
+                        """,
+                        queue_id,
+                        WORKER_ID,
+                    )
+            logger.info("Reaped outreach %s as unsent, re-queued", queue_id)
+        except Exception:
+            logger.exception("Failed to reap outreach %s", queue_id)
+
+    return len(rows)
+
+
+# ---------------------------------------------------------------------------
+# Standalone worker process: python -m app.outreach_worker
+# ---------------------------------------------------------------------------
+
+
+async def _run_standalone() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await create_pool()
+    start_outbound_sender()
+    start_outreach_worker()
+    try:
+        await stop.wait()
+    finally:
+        stop_outreach_worker()
+        await stop_outbound_sender()
+        await close_pool()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run_standalone())
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+from typing import Callable
+
+from .config import PENDING_TURN_MAX_ATTEMPTS
+from .db import get_pool
+
+logger = logging.getLogger("backend.pending_turns")
+
+POLL_INTERVAL_SECONDS = 5
+BATCH_SIZE = 100
+BASE_BACKOFF_SECONDS = 10
+MAX_BACKOFF_SECONDS = 600
+# A claimed turn that hasn't been answered or re-deferred after this long
+# (process died mid-turn) becomes claimable again.
+CLAIM_LEASE_SECONDS = 300
+
+# (phone, conversation_id) -> None; hands the turn to the participant's actor
+Resume = Callable[[str, object], None]
+# phone -> whether this process owns the participant's actor
+Owns = Callable[[str], bool]
+
+_task: asyncio.Task | None = None
+_stop_event: asyncio.Event | None = None
+_resume: Resume | None = None
+_owns: Owns | None = None
+
+_stats = {
+    "deferred": 0,
+    "resubmitted": 0,
+    "resolved": 0,
+    "failed": 0,
+}
+
+
+async def defer_turn(conv_id, phone: str, unanswered: int) -> None:
+    """
+    Records that a turn's agent reply could not be produced. `unanswered` is
+    the number of newly stored inbound messages not yet counted in
+    message_count; new messages restart the attempt count, a failed retry
+    backs off further. Gives up after PENDING_TURN_MAX_ATTEMPTS.
+    """
+    status = await get_pool().fetchval(
+        """
+        INSERT INTO pending_turns
+            (conversation_id, phone_number, unanswered, attempts, next_attempt_at)
+        VALUES ($1, $2, $3, 1, NOW() + make_interval(secs => $4::float8 * (0.5 + random() / 2)))
+        ON CONFLICT (conversation_id) DO UPDATE
+        SET unanswered = pending_turns.unanswered + EXCLUDED.unanswered,
+            attempts = CASE WHEN EXCLUDED.unanswered > 0 THEN 1 ELSE pending_turns.attempts + 1 END,
+            status = CASE
+                WHEN EXCLUDED.unanswered = 0 AND pending_turns.attempts + 1 >= $6 THEN 'failed'
+                ELSE 'pending'
+            END,
+            next_attempt_at = NOW() + make_interval(secs => CASE
+                WHEN EXCLUDED.unanswered > 0 THEN $4::float8
+                ELSE LEAST($5::float8, $4::float8 * power(2, pending_turns.attempts))
+            END * (0.5 + random() / 2))
+        RETURNING status
+        """,
+        conv_id,
+        phone,
+        unanswered,
+        BASE_BACKOFF_SECONDS,
+        MAX_BACKOFF_SECONDS,
+        PENDING_TURN_MAX_ATTEMPTS,
+    )
+    if status == "failed":
+        _stats["failed"] += 1
+        logger.error("Giving up on unanswered turn for conversation %s", conv_id)
+    else:
+        _stats["deferred"] += 1
+
+
+async def resolve_turn(conn, conv_id) -> int:
+    """
+    Clears the conversation's pending turn inside the transaction that stores
+    its agent reply. Returns the unanswered message count to add to
+    message_count.
+    """
+    unanswered = await conn.fetchval(
+        "DELETE FROM pending_turns WHERE conversation_id = $1 RETURNING unanswered",
+        conv_id,
+    )
+    if unanswered is None:
+        return 0
+    _stats["resolved"] += 1
+    return unanswered
+
+
+async def drop_turn(conv_id) -> None:
+    """Forgets a pending turn that no longer needs a reply (stopped, expired, moved on)."""
+    await get_pool().execute("DELETE FROM pending_turns WHERE conversation_id = $1", conv_id)
+
+
+def start_pending_turn_worker(owns: Owns, resume: Resume) -> None:
+    global _task, _stop_event, _owns, _resume
+    _owns = owns
+    _resume = resume
+    _stop_event = asyncio.Event()
+    _task = asyncio.create_task(_worker_loop())
+    logger.info("Pending turn worker started")
+
+
+def stop_pending_turn_worker() -> None:
+    global _task
+    if _stop_event:
+        _stop_event.set()
+    if _task:
+        _task.cancel()
+        _task = None
+    logger.info("Pending turn worker stopped")
+
+
+def pending_turn_stats() -> dict:
+    return dict(_stats)
+
+
+async def _worker_loop() -> None:
+    assert _stop_event is not None
+    while not _stop_event.is_set():
+        try:
+            claimed = await _claim_batch()
+            if claimed < BATCH_SIZE:
+                await asyncio.sleep(POLL_INTERVAL_SECONDS)
+        except asyncio.CancelledError:
+            break
+        except Exception:
+            logger.exception("Pending turn worker error")
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+
+async def _claim_batch() -> int:
+    """
+    Claims due turns owned by this process and hands them to the participants'
+    actors, which run them in order with any newer inbound messages. Turns
+    owned by another machine are left for its worker.
+    """
+    assert _owns is not None and _resume is not None
+    pool = get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            rows = await conn.fetch(
+                """
+                SELECT conversation_id, phone_number FROM pending_turns
+                WHERE status = 'pending' AND next_attempt_at <= NOW()
+                ORDER BY next_attempt_at
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+                """,
+                BATCH_SIZE,
+            )
+            owned = [r for r in rows if _owns(r["phone_number"])]
+            if owned:
+                await conn.execute(
+                    """
+                    UPDATE pending_turns
+                    SET next_attempt_at = NOW() + make_interval(secs => $2)
+                    WHERE conversation_id = ANY($1::uuid[])
+                    """,
+                    [r["conversation_id"] for r in owned],
+                    CLAIM_LEASE_SECONDS,
+                )
+
+    for row in owned:
+        _resume(row["phone_number"], row["conversation_id"])
+    _stats["resubmitted"] += len(owned)
+    return len(owned)
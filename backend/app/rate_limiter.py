@@ -0,0 +1,67 @@
+async def ensure_bucket(pool, name: str, rate_per_minute: float, burst: float) -> None:
+    """Creates the bucket or updates its rate/burst, keeping the current tokens."""
+    await pool.execute(
+        """
+        INSERT INTO rate_limiters (name, tokens, capacity, refill_per_second, updated_at)
+        VALUES ($1, $2, $2, $3, clock_timestamp())
+        ON CONFLICT (name) DO UPDATE
+        SET capacity = EXCLUDED.capacity,
+            refill_per_second = EXCLUDED.refill_per_second,
+            tokens = LEAST(rate_limiters.tokens, EXCLUDED.capacity)
+        """,
+        name,
+        float(burst),
+        rate_per_minute / 60.0,
+    )
+
+
+async def take_tokens(pool, name: str, want: int) -> tuple[int, float]:
+    """
+    Atomically refills the bucket and takes up to `want` whole tokens.
+    Returns (granted, seconds until the next token is available).
+    """
+    row = await pool.fetchrow(
+        """
+        WITH cur AS (
+            SELECT name, refill_per_second,
+                   LEAST(
+                       capacity,
+                       tokens + EXTRACT(EPOCH FROM clock_timestamp() - updated_at) * refill_per_second
+                   ) AS available
+            FROM rate_limiters
+            WHERE name = $1
+            FOR UPDATE
+        ), taken AS (
+            SELECT name, refill_per_second, available,
+                   LEAST($2::float8, floor(available)) AS granted
+            FROM cur
+        )
+        UPDATE rate_limiters r
+        SET tokens = t.available - t.granted, updated_at = clock_timestamp()
+        FROM taken t
+        WHERE r.name = t.name
+        RETURNING t.granted::int AS granted,
+                  t.available - t.granted AS remaining,
+                  t.refill_per_second
+        """,
+        name,
+        want,
+    )
+    if not row:
+        raise RuntimeError(f"Rate limiter {name!r} not initialized")
+
+    remaining = row["remaining"]
+    refill = row["refill_per_second"]
+    wait = 0.0 if remaining >= 1 or refill <= 0 else (1 - remaining) / refill
+    return row["granted"], wait
+
+
+async def return_tokens(pool, name: str, count: int) -> None:
+    """Gives back tokens that were taken but not used."""
+    if count <= 0:
+        return
+    await pool.execute(
+        "UPDATE rate_limiters SET tokens = LEAST(capacity, tokens + $2) WHERE name = $1",
+        name,
+        float(count),
+    )
@@ -0,0 +1,319 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+from typing import Any
+
+from .analytics import campaign_analytics
+from .analytics_agent import PROMPT_FINGERPRINT, REPORT_MODEL, ai_enabled, generate_report_tsx
+from .db import get_pool
+from .llm_scheduler import run_llm
+from .tsx_safety import validate_generated_tsx
+
+logger = logging.getLogger("backend.reports")
+
+_task: asyncio.Task | None = None
+_stop_event: asyncio.Event | None = None
+_wake_event: asyncio.Event | None = None
+
+POLL_INTERVAL_SECONDS = 5
+# Jobs generated at once per process; each holds an LLM call for a while
+BATCH_SIZE = 2
+MAX_ATTEMPTS = 3
+# Generations per attempt when the TSX fails validation
+MAX_GENERATIONS = 3
+BASE_BACKOFF_SECONDS = 10
+MAX_BACKOFF_SECONDS = 300
+# A claimed job still 'running' after this long is assumed orphaned
+# (process died mid-generation) and becomes claimable again. The lease is
+# renewed before each generation, so this only has to cover one: the
+# scheduler's report wait (600 s) plus the call itself.
+RUNNING_TIMEOUT_SECONDS = 900
+
+# Analytics keys that change without the data changing
+_VOLATILE_KEYS = {"computed_at", "compute_ms", "cached"}
+
+_stats = {
+    "submitted": 0,
+    "cache_hits": 0,
+    "deduplicated": 0,
+    "generations": 0,
+    "invalid": 0,
+    "succeeded": 0,
+    "retried": 0,
+    "failed": 0,
+    "lease_lost": 0,
+}
+
+
+class ReportsDisabled(Exception):
+    """No LLM credentials are configured, so new reports can't be generated."""
+
+
+async def submit_report(campaign_id) -> dict[str, Any] | None:
+    """
+    Returns the report job for the campaign's current analytics, creating it
+    if needed, or None if the campaign doesn't exist. Jobs are keyed by a
+    hash of the analysis context (plus model and prompt), so an unchanged
+    campaign gets its finished report back immediately and concurrent
+    submissions share one job.
+    """
+    pool = get_pool()
+    campaign = await pool.fetchrow("SELECT name, research_brief FROM campaigns WHERE id = $1", campaign_id)
+    if not campaign:
+        return None
+    analytics = await campaign_analytics(campaign_id)
+    if analytics is None:
+        return None
+    context = {
+        "campaign": {"name": campaign["name"], "research_brief": campaign["research_brief"]},
+        **{k: v for k, v in analytics.items() if k not in _VOLATILE_KEYS},
+    }
+    context_json = json.dumps(context, sort_keys=True, default=str)
+    context_hash = hashlib.sha256(
+        f"{REPORT_MODEL}|{PROMPT_FINGERPRINT}|{context_json}".encode()
+    ).hexdigest()
+
+    existing = await _job_for_hash(pool, context_hash)
+    if existing:
+        _stats["cache_hits" if existing["status"] == "succeeded" else "deduplicated"] += 1
+        return {**_job_summary(existing), "cached": existing["status"] == "succeeded"}
+    if not ai_enabled():
+        raise ReportsDisabled("AI is not enabled (missing GOOGLE_API_KEY/GEMINI_API_KEY)")
+
+    row = await pool.fetchrow(
+        """
+        INSERT INTO report_jobs (campaign_id, context_hash, context, model)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (context_hash) WHERE status <> 'failed' DO NOTHING
+        RETURNING id, campaign_id, status, attempts, last_error, created_at, finished_at
+        """,
+        campaign_id,
+        context_hash,
+        context_json,
+        REPORT_MODEL,
+    )
+    if row is None:
+        # Lost a race with an identical submission.
+        _stats["deduplicated"] += 1
+        row = await _job_for_hash(pool, context_hash)
+    else:
+        _stats["submitted"] += 1
+        notify_reports()
+    return {**_job_summary(row), "cached": row["status"] == "succeeded"}
+
+
+async def get_report(job_id) -> dict[str, Any] | None:
+    row = await get_pool().fetchrow("SELECT * FROM report_jobs WHERE id = $1", job_id)
+    if not row:
+        return None
+    report = _job_summary(row)
+    if row["status"] == "succeeded":
+        context = row["context"]
+        report.update({
+            "ok": True,
+            "tsx": row["tsx"],
+            "data": json.loads(context) if isinstance(context, str) else context,
+            "model": row["model"],
+        })
+    return report
+
+
+def notify_reports() -> None:
+    if _wake_event:
+        _wake_event.set()
+
+
+def start_report_worker() -> None:
+    global _task, _stop_event, _wake_event
+    _stop_event = asyncio.Event()
+    _wake_event = asyncio.Event()
+    _task = asyncio.create_task(_worker_loop())
+    logger.info("Report worker started")
+
+
+def stop_report_worker() -> None:
+    global _task
+    if _stop_event:
+        _stop_event.set()
+    if _task:
+        _task.cancel()
+        _task = None
+    logger.info("Report worker stopped")
+
+
+def report_stats() -> dict:
+    return dict(_stats)
+
+
+async def _job_for_hash(pool, context_hash: str):
+    return await pool.fetchrow(
+        """
+        SELECT id, campaign_id, status, attempts, last_error, created_at, finished_at
+        FROM report_jobs
+        WHERE context_hash = $1 AND status <> 'failed'
+        """,
+        context_hash,
+    )
+
+
+def _job_summary(row) -> dict[str, Any]:
+    return {
+        "job_id": str(row["id"]),
+        "campaign_id": str(row["campaign_id"]),
+        "status": row["status"],
+        "attempts": row["attempts"],
+        "error": row["last_error"],
+        "created_at": row["created_at"].isoformat(),
+        "finished_at": row["finished_at"].isoformat() if row["finished_at"] else None,
+    }
+
+
+async def _worker_loop() -> None:
+    assert _stop_event is not None and _wake_event is not None
+    while not _stop_event.is_set():
+        try:
+            _wake_event.clear()
+            processed = await _process_batch()
+            if processed < BATCH_SIZE:
+                try:
+                    await asyncio.wait_for(_wake_event.wait(), POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            break
+        except Exception:
+            logger.exception("Report worker error")
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+
+async def _process_batch() -> int:
+    pool = get_pool()
+    # Claiming pushes next_attempt_at forward so a crashed worker's jobs are
+    # picked up again once RUNNING_TIMEOUT_SECONDS passes.
+    rows = await pool.fetch(
+        """
+        UPDATE report_jobs
+        SET status = 'running',
+            attempts = attempts + 1,
+            next_attempt_at = NOW() + make_interval(secs => $2)
+        WHERE id IN (
+            SELECT id FROM report_jobs
+            WHERE status IN ('pending', 'running') AND next_attempt_at <= NOW()
+            ORDER BY next_attempt_at, created_at
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, campaign_id, context, attempts
+        """,
+        BATCH_SIZE,
+        RUNNING_TIMEOUT_SECONDS,
+    )
+    if rows:
+        await asyncio.gather(*(_run_job(pool, row) for row in rows))
+    return len(rows)
+
+
+async def _run_job(pool, job) -> None:
+    """
+    Generates and validates the report TSX. Output that fails validation is
+    regenerated with the validator's errors in the prompt; LLM errors are
+    retried with backoff.
+    """
+    context = json.loads(job["context"]) if isinstance(job["context"], str) else job["context"]
+    errors: list[str] | None = None
+    try:
+        for _ in range(MAX_GENERATIONS):
+            if not await _renew_lease(pool, job):
+                _stats["lease_lost"] += 1
+                logger.warning("Report %s was re-claimed by another worker, abandoning", job["id"])
+                return
+            _stats["generations"] += 1
+            tsx = await run_llm(
+                "report",
+                job["campaign_id"],
+                lambda errors=errors: generate_report_tsx(analysis_context=context, previous_errors=errors),
+            )
+            errors = validate_generated_tsx(tsx)
+            if not errors:
+                break
+            _stats["invalid"] += 1
+            logger.info("Report %s failed validation: %s", job["id"], "; ".join(errors))
+    except Exception as e:
+        await _record_failure(pool, job, e)
+        return
+
+    if errors:
+        if await _finish(
+            pool,
+            job,
+            "status = 'failed', last_error = $3, finished_at = NOW()",
+            "Generated TSX failed validation: " + "; ".join(errors),
+        ):
+            _stats["failed"] += 1
+        return
+
+    if await _finish(
+        pool, job, "status = 'succeeded', tsx = $3, last_error = NULL, finished_at = NOW()", tsx,
+    ):
+        _stats["succeeded"] += 1
+
+
+async def _renew_lease(pool, job) -> bool:
+    """Extends the job's lease; False if it has since been re-claimed or finished."""
+    renewed = await pool.fetchval(
+        """
+        UPDATE report_jobs
+        SET next_attempt_at = NOW() + make_interval(secs => $3)
+        WHERE id = $1 AND status = 'running' AND attempts = $2
+        RETURNING id
+        """,
+        job["id"],
+        job["attempts"],
+        RUNNING_TIMEOUT_SECONDS,
+    )
+    return renewed is not None
+
+
+async def _record_failure(pool, job, error: BaseException) -> None:
+    attempts = job["attempts"]
+    if attempts >= MAX_ATTEMPTS:
+        if await _finish(pool, job, "status = 'failed', last_error = $3, finished_at = NOW()", str(error)):
+            _stats["failed"] += 1
+            logger.error("Report %s failed permanently after %s attempts: %s", job["id"], attempts, error)
+        return
+
+    backoff = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** (attempts - 1))
+    backoff = backoff * random.uniform(0.5, 1.0)
+    if await _finish(
+        pool,
+        job,
+        "status = 'pending', last_error = $3, next_attempt_at = NOW() + make_interval(secs => $4)",
+        str(error),
+        backoff,
+    ):
+        _stats["retried"] += 1
+
+
+async def _finish(pool, job, assignments: str, *args) -> bool:
+    """
+    Applies `assignments` (parameters from $3) only while this worker still
+    holds the lease. If the job was re-claimed after the lease expired, the
+    newer attempt owns it and this result is dropped.
+    """
+    updated = await pool.fetchval(
+        f"""
+        UPDATE report_jobs
+        SET {assignments}
+        WHERE id = $1 AND status = 'running' AND attempts = $2
+        RETURNING id
+        """,
+        job["id"],
+        job["attempts"],
+        *args,
+    )
+    if updated is None:
+        _stats["lease_lost"] += 1
+        logger.warning("Report %s was re-claimed by another worker, dropping its result", job["id"])
+    return updated is not None
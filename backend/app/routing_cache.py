@@ -0,0 +1,274 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+from uuid import uuid4
+
+from .config import ROUTING_CACHE_SIZE, ROUTING_CACHE_TTL_SECONDS
+from .db import add_listener, on_listener_reconnect
+
+logger = logging.getLogger("backend.routing_cache")
+
+NOTIFY_CHANNEL = "routing_cache"
+ACTIVE_STATUSES = ("active", "bounty_sent")
+
+# Tags write-through NOTIFY payloads so the process that wrote through doesn't
+# evict the entry it just updated.
+_ORIGIN = uuid4().hex[:12]
+
+_CAMPAIGN_FIELDS = (
+    "research_brief",
+    "extraction_schema",
+    "system_prompt_override",
+    "reward_text",
+    "reward_link",
+)
+
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "invalidations": 0,
+    "flushes": 0,
+}
+
+# Bumped on every invalidation. A loader that saw a different value before its
+# query doesn't cache the result, so a NOTIFY racing a DB read can't leave a
+# stale entry behind.
+_generation = 0
+
+# Invalidation kinds for caches kept in other modules ("transcript" by
+# conversation id: history_store) -> callbacks taking the key
+_hooks: dict[str, list[Callable[[str], None]]] = {"transcript": []}
+
+
+class LruTtlCache:
+    """Size-bounded LRU where every entry also expires after `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def put(self, key: str, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# phone -> user row
+_users = LruTtlCache(ROUTING_CACHE_SIZE, ROUTING_CACHE_TTL_SECONDS)
+# user_id -> newest active/bounty_sent conversation, or None when idle
+_conversations = LruTtlCache(ROUTING_CACHE_SIZE, ROUTING_CACHE_TTL_SECONDS)
+# campaign_id -> campaign fields used by the agent, JSON already parsed
+_campaigns = LruTtlCache(ROUTING_CACHE_SIZE, ROUTING_CACHE_TTL_SECONDS)
+
+
+async def start_routing_cache() -> None:
+    await add_listener(NOTIFY_CHANNEL, _on_notify)
+    # Notifications sent while the listener was down are lost.
+    on_listener_reconnect(clear_routing_cache)
+    logger.info("Routing cache started (size=%s, ttl=%ss)", ROUTING_CACHE_SIZE, ROUTING_CACHE_TTL_SECONDS)
+
+
+def clear_routing_cache() -> None:
+    global _generation
+    _generation += 1
+    _stats["flushes"] += 1
+    _users.clear()
+    _conversations.clear()
+    _campaigns.clear()
+
+
+def routing_cache_stats() -> dict:
+    return {
+        **_stats,
+        "users": len(_users),
+        "conversations": len(_conversations),
+        "campaigns": len(_campaigns),
+    }
+
+
+async def publish_invalidation(conn, kind: str, key) -> None:
+    """
+    Drops the cached `kind` entry ("user" by phone, "conversation" by user_id,
+    "campaign" by id, "transcript" by conversation id) in every process,
+    this one included. The NOTIFY goes
+    out with the caller's transaction, so it lands after the change commits.
+    """
+    invalidate_cached(kind, key)
+    await _notify(conn, "", kind, key)
+
+
+async def write_user(conn, phone: str, **fields) -> None:
+    """Write-through for a user update made in the caller's transaction."""
+    hit, user = _users.get(phone)
+    if hit:
+        _users.put(phone, {**user, **fields})
+    await _notify(conn, _ORIGIN, "user", phone)
+
+
+async def write_conversation(conn, user_id, conv_id, **fields) -> None:
+    """
+    Write-through for a conversation update made in the caller's transaction.
+    A status outside ACTIVE_STATUSES means the user is now idle.
+    """
+    key = str(user_id)
+    hit, conv = _conversations.get(key)
+    if hit and conv is not None and conv["id"] == conv_id:
+        conv = {**conv, **fields}
+        _conversations.put(key, conv if conv["status"] in ACTIVE_STATUSES else None)
+    else:
+        _conversations.pop(key)
+    await _notify(conn, _ORIGIN, "conversation", key)
+
+
+def evict_participant(phone: str) -> None:
+    """Drops everything cached for a participant, e.g. after a failed turn."""
+    hit, user = _users.get(phone)
+    _users.pop(phone)
+    if hit:
+        _conversations.pop(str(user["id"]))
+
+
+async def get_user(pool, phone: str) -> dict | None:
+    hit, user = _users.get(phone)
+    if hit:
+        _stats["hits"] += 1
+        return dict(user)
+    _stats["misses"] += 1
+    generation = _generation
+    row = await pool.fetchrow("SELECT * FROM users WHERE phone_number = $1", phone)
+    if row is None:
+        return None
+    user = dict(row)
+    if generation == _generation:
+        _users.put(phone, user)
+    return dict(user)
+
+
+def put_user(user) -> None:
+    _users.put(user["phone_number"], dict(user))
+
+
+async def get_active_conversation(pool, user_id) -> dict | None:
+    """
+    Returns the user's newest active/bounty_sent conversation with its
+    campaign's agent config merged in, or None when the user is idle.
+    """
+    key = str(user_id)
+    hit, conv = _conversations.get(key)
+    if hit:
+        _stats["hits"] += 1
+    else:
+        _stats["misses"] += 1
+        generation = _generation
+        row = await pool.fetchrow(
+            """
+            SELECT * FROM conversations
+            WHERE user_id = $1
+              AND status IN ('active', 'bounty_sent')
+            ORDER BY created_at DESC
+            LIMIT 1
+            """,
+            user_id,
+        )
+        conv = _parse_conversation(row) if row else None
+        if generation == _generation:
+            _conversations.put(key, conv)
+    if conv is None:
+        return None
+
+    campaign = await get_campaign_config(pool, conv["campaign_id"]) if conv["campaign_id"] else None
+    return {**conv, **(campaign or dict.fromkeys((*_CAMPAIGN_FIELDS, "campaign_updated_at")))}
+
+
+def put_conversation(conv) -> None:
+    conv = _parse_conversation(conv)
+    _conversations.put(str(conv["user_id"]), conv if conv["status"] in ACTIVE_STATUSES else None)
+
+
+async def get_campaign_config(pool, campaign_id) -> dict | None:
+    key = str(campaign_id)
+    hit, campaign = _campaigns.get(key)
+    if hit:
+        _stats["hits"] += 1
+        return campaign
+    _stats["misses"] += 1
+    generation = _generation
+    row = await pool.fetchrow(
+        f"SELECT {', '.join(_CAMPAIGN_FIELDS)}, updated_at AS campaign_updated_at FROM campaigns WHERE id = $1",
+        campaign_id,
+    )
+    if row is None:
+        return None
+    campaign = dict(row)
+    campaign["extraction_schema"] = _json(campaign["extraction_schema"])
+    if generation == _generation:
+        _campaigns.put(key, campaign)
+    return campaign
+
+
+def on_invalidation(kind: str, hook: Callable[[str], None]) -> None:
+    """Runs `hook(key)` whenever a `kind` invalidation is published or heard."""
+    _hooks.setdefault(kind, []).append(hook)
+
+
+def invalidate_cached(kind: str, key) -> None:
+    global _generation
+    _generation += 1
+    _stats["invalidations"] += 1
+    if kind == "user":
+        _users.pop(str(key))
+    elif kind == "conversation":
+        _conversations.pop(str(key))
+    elif kind == "campaign":
+        _campaigns.pop(str(key))
+    elif kind in _hooks:
+        for hook in _hooks[kind]:
+            hook(str(key))
+    else:
+        logger.warning("Unknown routing cache invalidation kind: %s", kind)
+
+
+def _on_notify(payload: str) -> None:
+    origin, kind, key = payload.split("|", 2)
+    if origin != _ORIGIN:
+        invalidate_cached(kind, key)
+
+
+async def _notify(conn, origin: str, kind: str, key) -> None:
+    await conn.execute(
+        "SELECT pg_notify($1, $2)", NOTIFY_CHANNEL, f"{origin}|{kind}|{key}",
+    )
+
+
+def _parse_conversation(row) -> dict:
+    conv = dict(row)
+    conv["extracted_data"] = _json(conv.get("extracted_data")) or {}
+    return conv
+
+
+def _json(value):
+    return json.loads(value) if isinstance(value, str) else value
@@ -1,3 +1,6 @@
+from datetime import datetime
+
+from twilio.http.async_http_client import AsyncTwilioHttpClient
 from twilio.rest import Client
 
 from .config import TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_FROM
@@ -5,6 +8,11 @@ from .config import TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_FROM
 
 _client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 
+# Async client backed by a pooled keep-alive aiohttp session. Created lazily so
+# the session binds to the running event loop.
+_async_http_client: AsyncTwilioHttpClient | None = None
+_async_client: Client | None = None
+
 
 def send_whatsapp(to_user: str, text: str) -> str:
     msg = _client.messages.create(
@@ -14,3 +22,43 @@ def send_whatsapp(to_user: str, text: str) -> str:
     )
     return msg.sid
 
+
+def _get_async_client() -> Client:
+    global _async_http_client, _async_client
+    if _async_client is None:
+        _async_http_client = AsyncTwilioHttpClient()
+        _async_client = Client(
+            TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, http_client=_async_http_client,
+        )
+    return _async_client
+
+
+async def send_whatsapp_async(to_user: str, text: str) -> str:
+    msg = await _get_async_client().messages.create_async(
+        from_=TWILIO_WHATSAPP_FROM,
+        to=to_user,
+        body=text,
+    )
+    return msg.sid
+
+
+async def find_sent_whatsapp_async(to_user: str, text: str, since: datetime) -> str | None:
+    """Returns the SID of a message with this body sent to to_user after since."""
+    msgs = await _get_async_client().messages.list_async(
+        from_=TWILIO_WHATSAPP_FROM,
+        to=to_user,
+        date_sent_after=since,
+        limit=20,
+    )
+    for msg in msgs:
+        if msg.body == text:
+            return msg.sid
+    return None
+
+
+async def close_async_client() -> None:
+    global _async_http_client, _async_client
+    if _async_http_client is not None:
+        await _async_http_client.close()
+    _async_http_client = None
+    _async_client = None
@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+# app.config requires these at import time; tests never reach the services.
+for name in ("DATABASE_URL", "TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_WHATSAPP_FROM", "GOOGLE_API_KEY"):
+    os.environ.setdefault(name, "test")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
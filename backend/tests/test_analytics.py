@@ -0,0 +1,35 @@
+from app.analytics import compute_analytics
+
+SCHEMA = {"score": {"type": "number(1-10)", "description": "How likely to recommend"}}
+
+CSV = b"""status,message_count,city,age_range,gender,f0
+completed,6,lagos,25-34,female,4
+completed,5,lagos,25-34,male,8
+completed,4,abuja,18-24,female,99
+active,1,abuja,18-24,male,6
+active,3,,,,
+"""
+
+
+def test_number_stats_exclude_out_of_range_values():
+    score = compute_analytics(SCHEMA, CSV)["fields"]["score"]
+    assert score["out_of_range"] == 1
+    assert (score["min"], score["max"]) == (4.0, 8.0)
+    assert score["mean"] == 6.0
+    assert sum(score["histogram"]["counts"]) == 3
+    assert 99.0 not in score["by"]["city"]["mean"]
+
+
+def test_answer_rate_only_counts_engaged_participants():
+    score = compute_analytics(SCHEMA, CSV)["fields"]["score"]
+    # 4 answered, but one of them never engaged (message_count 1)
+    assert score["answered"] == 4
+    assert score["answer_rate"] == 0.75
+
+
+def test_all_out_of_range_has_no_stats():
+    csv = b"status,message_count,city,age_range,gender,f0\ncompleted,4,,,,42\n"
+    score = compute_analytics(SCHEMA, csv)["fields"]["score"]
+    assert score["out_of_range"] == 1
+    assert "mean" not in score
+    assert sum(score["histogram"]["counts"]) == 0
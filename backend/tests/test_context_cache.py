@@ -0,0 +1,126 @@
+import asyncio
+
+from app import context_cache
+from app.context_cache import ContextCacheManager, FakeContextCacheProvider
+from app.conversation_agent import MeshContext, _run_with_cached_context
+
+PREFIX = "personality + campaign brief " * 20
+
+
+def _manager(**kwargs) -> tuple[ContextCacheManager, FakeContextCacheProvider]:
+    provider = FakeContextCacheProvider(min_chars=kwargs.pop("provider_min_chars", 0))
+    return ContextCacheManager(provider, "gemini-2.5-flash", **kwargs), provider
+
+
+def test_create_then_hit():
+    manager, provider = _manager()
+
+    async def run():
+        first = await manager.get_handle("campaign:1", PREFIX)
+        second = await manager.get_handle("campaign:1", PREFIX)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second and first in provider.contexts
+    assert manager.stats["misses"] == 1 and manager.stats["hits"] == 1
+    assert [c[0] for c in provider.calls] == ["create"]
+
+
+def test_refresh_before_expiry(monkeypatch):
+    # TTL inside the refresh margin: the next use refreshes instead of hitting.
+    manager, provider = _manager(ttl_seconds=context_cache.REFRESH_MARGIN_SECONDS - 1)
+
+    async def run():
+        first = await manager.get_handle("campaign:1", PREFIX)
+        return first, await manager.get_handle("campaign:1", PREFIX)
+
+    first, second = asyncio.run(run())
+    assert first == second
+    assert manager.stats["refreshes"] == 1
+    assert [c[0] for c in provider.calls] == ["create", "refresh"]
+
+
+def test_failed_create_is_held_off():
+    manager, provider = _manager(provider_min_chars=len(PREFIX) + 1)
+
+    async def run():
+        return [await manager.get_handle("campaign:1", PREFIX) for _ in range(3)]
+
+    assert asyncio.run(run()) == [None, None, None]
+    # One create attempt; the negative TTL answers the rest without a call.
+    assert [c[0] for c in provider.calls] == ["create"]
+    assert manager.stats["create_errors"] == 1 and manager.stats["fallbacks"] == 3
+
+
+def test_eviction_deletes_provider_cache():
+    manager, provider = _manager(max_entries=2)
+
+    async def run():
+        return [await manager.get_handle(f"campaign:{i}", PREFIX) for i in range(3)]
+
+    first, *rest = asyncio.run(run())
+    assert first not in provider.contexts
+    assert all(name in provider.contexts for name in rest)
+    assert ("delete", first) in provider.calls
+    assert len(manager) == 2
+
+
+def test_invalidate_deletes_and_holds_off():
+    manager, provider = _manager()
+
+    async def run():
+        name = await manager.get_handle("campaign:1", PREFIX)
+        await manager.invalidate("campaign:1")
+        return name, await manager.get_handle("campaign:1", PREFIX)
+
+    name, again = asyncio.run(run())
+    assert name not in provider.contexts
+    assert again is None
+    assert [c[0] for c in provider.calls] == ["create", "delete"]
+
+
+def test_cached_turn_runs_against_fake_provider():
+    manager, provider = _manager()
+    context_cache.set_context_cache(manager)
+    deps = MeshContext(
+        mode="campaign",
+        conversation_history=[{"sender": "user", "content": "go"}],
+        research_brief="How people pick a gym",
+        extraction_schema={"gym": {"type": "string", "description": "Gym they use"}},
+        extracted_data={},
+        campaign_id="c1",
+    )
+    try:
+        response = asyncio.run(_run_with_cached_context(deps, "Them: go"))
+    finally:
+        context_cache.set_context_cache(None)
+
+    assert response is not None and response.message
+    assert manager.stats["misses"] == 1 and manager.stats["rejected"] == 0
+    assert len(provider.contexts) == 1
+
+
+def test_rejected_handle_is_invalidated():
+    manager, provider = _manager()
+    context_cache.set_context_cache(manager)
+    deps = MeshContext(
+        mode="bounty",
+        conversation_history=[{"sender": "user", "content": "sure"}],
+        research_brief="How people pick a gym",
+        campaign_id="c1",
+    )
+
+    async def run():
+        await manager.get_handle("warmup", PREFIX)  # unrelated entry
+        await _run_with_cached_context(deps, "Them: sure")
+        # The provider loses the handle (expired early) behind the manager's back.
+        provider.contexts.clear()
+        return await _run_with_cached_context(deps, "Them: sure")
+
+    try:
+        response = asyncio.run(run())
+    finally:
+        context_cache.set_context_cache(None)
+
+    assert response is None  # caller falls back to the inline prompt
+    assert manager.stats["rejected"] == 1
@@ -0,0 +1,19 @@
+from app.main import _etag_matches
+
+ETAG = 'W/"3f786850e387550fdab836ed7e6dc881de23001b"'
+
+
+def test_weak_comparison_ignores_w_prefix():
+    assert _etag_matches(ETAG, ETAG)
+    assert _etag_matches(ETAG, '"3f786850e387550fdab836ed7e6dc881de23001b"')
+
+
+def test_list_and_wildcard():
+    assert _etag_matches(ETAG, f'W/"other", {ETAG}')
+    assert _etag_matches(ETAG, "*")
+
+
+def test_no_substring_matches():
+    assert not _etag_matches(ETAG, None)
+    assert not _etag_matches(ETAG, 'W/"3f786850"')
+    assert not _etag_matches('W/"3f78"', ETAG)
@@ -0,0 +1,37 @@
+import asyncio
+
+from app import reports
+
+
+class FakePool:
+    """Records fetchval calls; `owned` decides whether the guarded UPDATE matches."""
+
+    def __init__(self, owned: bool):
+        self.owned = owned
+        self.calls: list[tuple] = []
+
+    async def fetchval(self, query, *args):
+        self.calls.append((query, args))
+        return args[0] if self.owned else None
+
+
+JOB = {"id": "job-1", "campaign_id": "c-1", "context": "{}", "attempts": 1}
+
+
+def test_terminal_writes_are_guarded_by_the_lease():
+    pool = FakePool(owned=True)
+    before = reports.report_stats()["retried"]
+    asyncio.run(reports._record_failure(pool, JOB, RuntimeError("boom")))
+    query, args = pool.calls[0]
+    assert "status = 'running' AND attempts = $2" in query
+    assert args[:2] == ("job-1", 1)
+    assert reports.report_stats()["retried"] == before + 1
+
+
+def test_result_is_dropped_after_the_job_was_reclaimed():
+    pool = FakePool(owned=False)
+    before = reports.report_stats()
+    asyncio.run(reports._record_failure(pool, {**JOB, "attempts": reports.MAX_ATTEMPTS}, RuntimeError("boom")))
+    after = reports.report_stats()
+    assert after["failed"] == before["failed"]
+    assert after["lease_lost"] == before["lease_lost"] + 1